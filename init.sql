@@ -12,12 +12,16 @@ CREATE TABLE claims
     insurance VARCHAR(50),
     status VARCHAR(50),
     amount NUMERIC(10, 2) NOT NULL,
-    insert_ts  TIMESTAMP    NOT NULL DEFAULT CURRENT_TIMESTAMP
+    insert_ts  TIMESTAMP    NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    -- fingerprint of the record's content, unchanged re-sends are not written again
+    content_hash CHAR(32),
+    CONSTRAINT claims_claim_id_key UNIQUE (claim_id)
 );
 
+-- history tables are partitioned by month of change_ts, see ensure_history_partition
 CREATE TABLE claims_history
 (
-    id         INT PRIMARY KEY GENERATED ALWAYS AS IDENTITY,
+    id         INT GENERATED ALWAYS AS IDENTITY,
     claim_id VARCHAR(255) NOT NULL,
     patient_id VARCHAR(255) NOT NULL,
     billing_start DATE NOT NULL,
@@ -28,8 +32,9 @@ CREATE TABLE claims_history
     status VARCHAR(50),
     amount NUMERIC(10, 2) NOT NULL,
     insert_ts  TIMESTAMP,
-    change_ts  TIMESTAMP    NOT NULL DEFAULT CURRENT_TIMESTAMP
-);
+    change_ts  TIMESTAMP    NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    PRIMARY KEY (id, change_ts)
+) PARTITION BY RANGE (change_ts);
 
 CREATE TABLE patients
 (
@@ -37,15 +42,55 @@ CREATE TABLE patients
     first_name VARCHAR(128) NOT NULL,
     last_name  VARCHAR(128) NOT NULL,
     patient_id VARCHAR(255) NOT NULL,
-    insert_ts  TIMESTAMP    NOT NULL DEFAULT CURRENT_TIMESTAMP
+    insert_ts  TIMESTAMP    NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    content_hash CHAR(32),
+    CONSTRAINT patients_patient_id_key UNIQUE (patient_id)
 );
 
 CREATE TABLE patients_history
 (
-    id         INT PRIMARY KEY GENERATED ALWAYS AS IDENTITY,
+    id         INT GENERATED ALWAYS AS IDENTITY,
     first_name VARCHAR(128) NOT NULL,
     last_name  VARCHAR(128) NOT NULL,
     patient_id VARCHAR(255) NOT NULL,
     insert_ts  TIMESTAMP,
-    change_ts  TIMESTAMP    NOT NULL DEFAULT CURRENT_TIMESTAMP
+    change_ts  TIMESTAMP    NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    PRIMARY KEY (id, change_ts)
+) PARTITION BY RANGE (change_ts);
+
+-- used by the patient coverage check in percent_of_patients_above_threshold
+CREATE INDEX patients_history_patient_id_idx ON patients_history (patient_id);
+CREATE INDEX claims_history_claim_id_idx ON claims_history (claim_id);
+
+-- rows outside of the monthly partitions land here
+CREATE TABLE claims_history_default PARTITION OF claims_history DEFAULT;
+CREATE TABLE patients_history_default PARTITION OF patients_history DEFAULT;
+
+-- creates the monthly partition of a history table that holds `ts`, e.g. claims_history_2024_05
+CREATE OR REPLACE FUNCTION ensure_history_partition(parent TEXT, ts TIMESTAMP) RETURNS TEXT AS
+$$
+DECLARE
+    month_start    DATE := date_trunc('month', ts);
+    partition_name TEXT := format('%s_%s', parent, to_char(month_start, 'YYYY_MM'));
+BEGIN
+    EXECUTE format('CREATE TABLE IF NOT EXISTS %I PARTITION OF %I FOR VALUES FROM (%L) TO (%L)',
+                   partition_name, parent, month_start, month_start + INTERVAL '1 month');
+    RETURN partition_name;
+END;
+$$ LANGUAGE plpgsql;
+
+SELECT ensure_history_partition(parent, date_trunc('month', LOCALTIMESTAMP) + month * INTERVAL '1 month')
+FROM unnest(ARRAY ['claims_history', 'patients_history']) AS parent,
+     generate_series(0, 1) AS month;
+
+-- ingestion progress per input file, see common.checkpoints
+CREATE TABLE ingest_checkpoints
+(
+    path           VARCHAR(1024) PRIMARY KEY,
+    file_size      BIGINT      NOT NULL,
+    file_mtime_ns  BIGINT      NOT NULL,
+    file_sha256    VARCHAR(64),
+    rows_committed BIGINT      NOT NULL DEFAULT 0,
+    status         VARCHAR(16) NOT NULL,
+    updated_ts     TIMESTAMP   NOT NULL DEFAULT CURRENT_TIMESTAMP
 );
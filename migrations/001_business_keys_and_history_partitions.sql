@@ -0,0 +1,93 @@
+-- Upgrades a database created from an earlier init.sql:
+-- unique business keys on the current tables and monthly partitions of the history tables by change_ts.
+-- Run once, e.g. docker exec -i postgres-db psql -U user structured < migrations/001_business_keys_and_history_partitions.sql
+BEGIN;
+
+-- keep the most recently inserted row per business key before enforcing uniqueness
+DELETE FROM claims c USING claims newer
+WHERE c.claim_id = newer.claim_id AND (c.insert_ts, c.id) < (newer.insert_ts, newer.id);
+ALTER TABLE claims ADD CONSTRAINT claims_claim_id_key UNIQUE (claim_id);
+
+DELETE FROM patients p USING patients newer
+WHERE p.patient_id = newer.patient_id AND (p.insert_ts, p.id) < (newer.insert_ts, newer.id);
+ALTER TABLE patients ADD CONSTRAINT patients_patient_id_key UNIQUE (patient_id);
+
+CREATE OR REPLACE FUNCTION ensure_history_partition(parent TEXT, ts TIMESTAMP) RETURNS TEXT AS
+$$
+DECLARE
+    month_start    DATE := date_trunc('month', ts);
+    partition_name TEXT := format('%s_%s', parent, to_char(month_start, 'YYYY_MM'));
+BEGIN
+    EXECUTE format('CREATE TABLE IF NOT EXISTS %I PARTITION OF %I FOR VALUES FROM (%L) TO (%L)',
+                   partition_name, parent, month_start, month_start + INTERVAL '1 month');
+    RETURN partition_name;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP INDEX IF EXISTS patients_history_patient_id_idx;
+ALTER TABLE claims_history RENAME TO claims_history_unpartitioned;
+ALTER TABLE claims_history_unpartitioned RENAME CONSTRAINT claims_history_pkey TO claims_history_unpartitioned_pkey;
+ALTER TABLE patients_history RENAME TO patients_history_unpartitioned;
+ALTER TABLE patients_history_unpartitioned
+    RENAME CONSTRAINT patients_history_pkey TO patients_history_unpartitioned_pkey;
+
+CREATE TABLE claims_history
+(
+    id         INT GENERATED ALWAYS AS IDENTITY,
+    claim_id VARCHAR(255) NOT NULL,
+    patient_id VARCHAR(255) NOT NULL,
+    billing_start DATE NOT NULL,
+    billing_end DATE NOT NULL,
+    provider VARCHAR(255) NOT NULL,
+    admitting_diagnosis VARCHAR(128),
+    insurance VARCHAR(50),
+    status VARCHAR(50),
+    amount NUMERIC(10, 2) NOT NULL,
+    insert_ts  TIMESTAMP,
+    change_ts  TIMESTAMP    NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    PRIMARY KEY (id, change_ts)
+) PARTITION BY RANGE (change_ts);
+
+CREATE TABLE patients_history
+(
+    id         INT GENERATED ALWAYS AS IDENTITY,
+    first_name VARCHAR(128) NOT NULL,
+    last_name  VARCHAR(128) NOT NULL,
+    patient_id VARCHAR(255) NOT NULL,
+    insert_ts  TIMESTAMP,
+    change_ts  TIMESTAMP    NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    PRIMARY KEY (id, change_ts)
+) PARTITION BY RANGE (change_ts);
+
+CREATE INDEX patients_history_patient_id_idx ON patients_history (patient_id);
+CREATE INDEX claims_history_claim_id_idx ON claims_history (claim_id);
+CREATE TABLE claims_history_default PARTITION OF claims_history DEFAULT;
+CREATE TABLE patients_history_default PARTITION OF patients_history DEFAULT;
+
+-- partitions for every month with history, and the current and next month, before any rows are moved
+SELECT ensure_history_partition('claims_history', month)
+FROM (SELECT DISTINCT date_trunc('month', change_ts) AS month FROM claims_history_unpartitioned
+      UNION SELECT date_trunc('month', LOCALTIMESTAMP) + INTERVAL '1 month' * generate_series(0, 1)) months;
+SELECT ensure_history_partition('patients_history', month)
+FROM (SELECT DISTINCT date_trunc('month', change_ts) AS month FROM patients_history_unpartitioned
+      UNION SELECT date_trunc('month', LOCALTIMESTAMP) + INTERVAL '1 month' * generate_series(0, 1)) months;
+
+-- ids are kept so the history order is unchanged
+INSERT INTO claims_history (id, claim_id, patient_id, billing_start, billing_end, provider, admitting_diagnosis,
+                            insurance, status, amount, insert_ts, change_ts)
+    OVERRIDING SYSTEM VALUE
+SELECT id, claim_id, patient_id, billing_start, billing_end, provider, admitting_diagnosis,
+       insurance, status, amount, insert_ts, change_ts
+FROM claims_history_unpartitioned;
+INSERT INTO patients_history (id, first_name, last_name, patient_id, insert_ts, change_ts)
+    OVERRIDING SYSTEM VALUE
+SELECT id, first_name, last_name, patient_id, insert_ts, change_ts
+FROM patients_history_unpartitioned;
+
+SELECT setval(pg_get_serial_sequence('claims_history', 'id'), COALESCE(MAX(id), 0) + 1, false) FROM claims_history;
+SELECT setval(pg_get_serial_sequence('patients_history', 'id'), COALESCE(MAX(id), 0) + 1, false) FROM patients_history;
+
+DROP TABLE claims_history_unpartitioned;
+DROP TABLE patients_history_unpartitioned;
+
+COMMIT;
@@ -0,0 +1,12 @@
+-- Adds the table recording the ingestion progress of every input file, see common.checkpoints.
+-- Run once, e.g. docker exec -i postgres-db psql -U user structured < migrations/002_ingest_checkpoints.sql
+CREATE TABLE IF NOT EXISTS ingest_checkpoints
+(
+    path           VARCHAR(1024) PRIMARY KEY,
+    file_size      BIGINT      NOT NULL,
+    file_mtime_ns  BIGINT      NOT NULL,
+    file_sha256    VARCHAR(64),
+    rows_committed BIGINT      NOT NULL DEFAULT 0,
+    status         VARCHAR(16) NOT NULL,
+    updated_ts     TIMESTAMP   NOT NULL DEFAULT CURRENT_TIMESTAMP
+);
@@ -0,0 +1,5 @@
+-- Adds the content fingerprint of the current claims and patients, see common.utils.fingerprint.
+-- Existing rows have no fingerprint yet, so their next re-send is written once more and records it.
+-- Run once, e.g. docker exec -i postgres-db psql -U user structured < migrations/003_content_hash.sql
+ALTER TABLE claims ADD COLUMN IF NOT EXISTS content_hash CHAR(32);
+ALTER TABLE patients ADD COLUMN IF NOT EXISTS content_hash CHAR(32);
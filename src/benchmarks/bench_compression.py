@@ -0,0 +1,89 @@
+"""
+Read and parse throughput of gzip and zstd compressed NDJSON files, decompressed while they are read
+(`readers.compression`), against the same file uncompressed and against decompressing it to disk before reading it.
+
+    python -m benchmarks.bench_compression --rows 500000
+"""
+import argparse
+import gzip
+import os
+import shutil
+import tempfile
+import time
+
+from benchmarks.synthetic import generate, write_ndjson
+from readers.compression import open_decompressed
+from readers.ndjson import iter_line_batches, iter_ndjson
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+
+def compress(path, compression):
+    """
+    Write a compressed copy of `path` with the default level of each format, returns its path.
+    """
+    if compression == 'gzip':
+        compressed_path = path + '.gz'
+        with open(path, 'rb') as source, gzip.open(compressed_path, 'wb', compresslevel=6) as target:
+            shutil.copyfileobj(source, target, 1024 * 1024)
+    else:
+        compressed_path = path + '.zst'
+        with open(path, 'rb') as source, open(compressed_path, 'wb') as target:
+            zstandard.ZstdCompressor(level=3).copy_stream(source, target)
+    return compressed_path
+
+
+def timed(function, repeat):
+    """
+    Best of `repeat` runs, in seconds.
+    """
+    seconds = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        function()
+        seconds.append(time.perf_counter() - started)
+    return min(seconds)
+
+
+def decompress_to_disk(path, directory):
+    """
+    The workflow streaming replaces: decompress the file to disk, then parse the decompressed copy.
+    """
+    decompressed_path = os.path.join(directory, 'decompressed.ndjson')
+    with open_decompressed(path) as source, open(decompressed_path, 'wb') as target:
+        shutil.copyfileobj(source, target, 4 * 1024 * 1024)
+    for _ in iter_ndjson(decompressed_path):
+        pass
+    os.remove(decompressed_path)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--rows', type=int, default=500000)
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, 'Claim.ndjson')
+        size = write_ndjson(path, generate('Claim', args.rows, duplicate_rate=0.05, null_rate=0.1))
+        files = [('none', path), ('gzip', compress(path, 'gzip'))]
+        if zstandard is not None:
+            files.append(('zstd', compress(path, 'zstd')))
+
+        print(f"{args.rows} rows, {size / 1e6:.1f} MB uncompressed")
+        print(f"{'compression':<22} {'file MB':>8} {'read s':>8} {'read MB/s':>10} {'parse s':>8} {'rows/s':>10}")
+        for compression, file_path in files:
+            read = timed(lambda: [None for _ in iter_line_batches(file_path)], args.repeat)
+            parse = timed(lambda: [None for _ in iter_ndjson(file_path)], args.repeat)
+            print(f"{compression:<22} {os.path.getsize(file_path) / 1e6:>8.1f} {read:>8.2f} {size / 1e6 / read:>10.0f} "
+                  f"{parse:>8.2f} {args.rows / parse:>10,.0f}")
+        for compression, file_path in files[1:]:
+            parse = timed(lambda: decompress_to_disk(file_path, directory), args.repeat)
+            print(f"{compression + ' to disk first':<22} {'':>8} {'':>8} {'':>10} {parse:>8.2f} {args.rows / parse:>10,.0f}")
+
+
+if __name__ == '__main__':
+    main()
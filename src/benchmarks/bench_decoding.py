@@ -0,0 +1,51 @@
+"""
+Benchmark of NDJSON decoding: the original text-mode, line-by-line `json.loads` against `iter_ndjson` with buffered
+reads, for each installed decoder backend.
+
+    python -m benchmarks.bench_decoding --path /data/Claim.ndjson
+"""
+import argparse
+import json
+import time
+
+from readers.decoders import DECODERS, get_decoder
+from readers.ndjson import iter_ndjson
+
+
+def legacy_load(ndjson_path):
+    """The reader as it was before buffered decoding, kept here as the baseline."""
+    with open(ndjson_path, 'r') as file:
+        return [json.loads(line) for line in file if line.strip()]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--path', default='/data/Claim.ndjson')
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+
+    expected = legacy_load(args.path)
+    runs = [('legacy json', lambda: legacy_load(args.path))]
+    for name in DECODERS[1:]:
+        try:
+            decoder = get_decoder(name)
+        except ImportError:
+            print(f"{name} is not installed, skipping")
+            continue
+        assert list(iter_ndjson(args.path, decoder=decoder)) == expected
+        runs.append((f"buffered {name}", lambda decoder=decoder: list(iter_ndjson(args.path, decoder=decoder))))
+
+    print(f"{'reader':<16} {'seconds':>8} {'rows/s':>12}")
+    for label, run in runs:
+        seconds = min(_timed(run) for _ in range(args.repeat))
+        print(f"{label:<16} {seconds:>8.3f} {len(expected) / seconds:>12,.0f}")
+
+
+def _timed(run):
+    started = time.perf_counter()
+    run()
+    return time.perf_counter() - started
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,80 @@
+"""
+Micro-benchmark of JSON path lookups per claim: the original parse-on-every-call `get_value_at_json_path`
+against the compiled accessors used by `FHIRClaimProcessor.map_values`.
+
+    python -m benchmarks.bench_json_path --records 20000
+"""
+import argparse
+import timeit
+
+from field_mappers.base import compile_json_path
+from field_mappers.claim_processor import FHIRClaimProcessor
+
+CLAIM = {
+        "resourceType": "Claim",
+        "id": "claim-1",
+        "created": "2021-01-01T00:00:00Z",
+        "status": "active",
+        "patient": {"reference": "Patient/-10000000000066"},
+        "provider": {"reference": "#provider-org"},
+        "billablePeriod": {"start": "2020-12-19", "end": "2020-12-20"},
+        "total": {"value": 100.5, "currency": "USD"},
+        "insurance": [{"coverage": {"identifier": {"value": "MEDICARE"}}}],
+        "diagnosis": [{"diagnosisCodeableConcept": {"coding": [{"code": "A01"}],
+                                                    "type": [{"coding": [{"code": "admitting"}]}]}}],
+}
+PATHS = list(FHIRClaimProcessor.mapping.values()) + ["diagnosis[0].diagnosisCodeableConcept.type[0].coding[0].code"]
+
+
+def legacy_get_value_at_json_path(json_data, json_path):
+    """The lookup as it was before path compilation, kept here as the baseline."""
+    import re
+
+    keys = re.split(r'\.|\[|\]', json_path)
+    keys = [key for key in keys if key]
+    for key in keys:
+        if isinstance(json_data, list):
+            try:
+                json_data = json_data[int(key)]
+            except (ValueError, IndexError):
+                return None
+        elif isinstance(json_data, dict):
+            if key not in json_data:
+                return None
+            json_data = json_data[key]
+        else:
+            return None
+    return json_data
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--records', type=int, default=20000)
+    args = parser.parse_args()
+
+    accessors = [compile_json_path(path) for path in PATHS]
+    for path, accessor in zip(PATHS, accessors):
+        assert accessor(CLAIM) == legacy_get_value_at_json_path(CLAIM, path)
+
+    def legacy():
+        for path in PATHS:
+            legacy_get_value_at_json_path(CLAIM, path)
+
+    def compiled():
+        for accessor in accessors:
+            accessor(CLAIM)
+
+    processor = FHIRClaimProcessor(None)
+
+    def map_values():
+        processor.data = CLAIM
+        processor.map_values()
+
+    legacy_time = timeit.timeit(legacy, number=args.records)
+    for label, func in (('legacy lookups', legacy), ('compiled lookups', compiled), ('map_values', map_values)):
+        elapsed = timeit.timeit(func, number=args.records)
+        print(f"{label:<18} {elapsed / args.records * 1e6:>8.2f} us/record {legacy_time / elapsed:>6.1f}x")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,77 @@
+"""
+Times `percent_of_patients_above_threshold` for large patient files, optionally against the original
+`WHERE patient_id IN (...)` query built from string interpolation.
+
+Requires the structured database to be up (see README), e.g.:
+    docker exec ingest-service python -m benchmarks.bench_patient_coverage --ids 1000000 --history 1000000
+"""
+import argparse
+import time
+
+from common.db import close_pools, db_session
+from structured_zone_transformer import percent_of_patients_above_threshold, pg_connection_dict
+
+BENCH_PREFIX = 'bench-coverage-'
+
+
+def legacy_percent_of_patients(patient_ids, threshold, connection_dict):
+    """The check as it was before staging the IDs, kept here as the baseline."""
+    with db_session(connection_dict) as conn, conn.cursor() as cursor:
+        cursor.execute(f"""
+        SELECT COUNT(*) AS count_matching_values
+        FROM patients_history
+        WHERE patient_id IN ({', '.join([f"'{s}'" for s in map(str, patient_ids)])});
+        """)
+        return (cursor.fetchone()[0] / len(patient_ids)) * 100 > (threshold / 100)
+
+
+def seed_history(rows):
+    with db_session(pg_connection_dict) as conn, conn.cursor() as cursor:
+        cursor.execute("""
+            INSERT INTO patients_history (first_name, last_name, patient_id)
+            SELECT 'Bench', 'Patient', %s || n FROM generate_series(1, %s) AS n
+        """, (BENCH_PREFIX, rows)
+                       )
+        cursor.execute("ANALYZE patients_history")
+
+
+def clean_up():
+    with db_session(pg_connection_dict) as conn, conn.cursor() as cursor:
+        cursor.execute("DELETE FROM patients_history WHERE patient_id LIKE %s", (BENCH_PREFIX + '%',))
+
+
+def timed(label, func):
+    start = time.perf_counter()
+    result = func()
+    print(f"{label:<36} {time.perf_counter() - start:>8.2f}s result={result}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--ids', type=int, default=1000000, help='patient IDs in the simulated file')
+    parser.add_argument('--history', type=int, default=200000, help='patients seeded in the history table')
+    parser.add_argument('--legacy-max', type=int, default=100000,
+                        help='largest file size to run the legacy query for')
+    parser.add_argument('--sample-size', type=int, default=10000)
+    args = parser.parse_args()
+
+    clean_up()
+    seed_history(args.history)
+    try:
+        # every other ID was seen before, so the coverage is close to 50%
+        patient_ids = [f'{BENCH_PREFIX}{n * 2}' for n in range(1, args.ids + 1)]
+        timed(f'staged check, {args.ids} ids',
+              lambda: percent_of_patients_above_threshold(iter(patient_ids), 20, pg_connection_dict))
+        timed(f'sampled check, {args.sample_size} of {args.ids}',
+              lambda: percent_of_patients_above_threshold(iter(patient_ids), 20, pg_connection_dict,
+                                                          sample_size=args.sample_size))
+        if args.ids <= args.legacy_max:
+            timed(f'legacy IN (...) check, {args.ids} ids',
+                  lambda: legacy_percent_of_patients(patient_ids, 20, pg_connection_dict))
+    finally:
+        clean_up()
+        close_pools()
+
+
+if __name__ == '__main__':
+    main()
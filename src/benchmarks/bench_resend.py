@@ -0,0 +1,45 @@
+"""
+Re-sends a file of claims where most claims are unchanged, as in the weekly re-sends, and reports the time and the
+history rows written. Unchanged claims are skipped by their content hash.
+
+Requires the structured database to be up (see README), e.g.:
+    docker exec ingest-service python -m benchmarks.bench_resend --rows 20000 --changed-every 20
+"""
+import argparse
+
+import psycopg2
+
+from benchmarks.bench_upsert import BENCH_PREFIX, clean_up, make_claims, resend, timed
+from structured_zone_transformer import pg_connection_dict, upsert_claims
+
+
+def history_rows():
+    with psycopg2.connect(**pg_connection_dict) as conn, conn.cursor() as cursor:
+        cursor.execute("SELECT COUNT(*) FROM claims_history WHERE claim_id LIKE %s", (BENCH_PREFIX + '%',))
+        count, = cursor.fetchone()
+    conn.close()
+    return count
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--rows', type=int, default=20000)
+    parser.add_argument('--chunk-size', type=int, default=1000)
+    parser.add_argument('--changed-every', type=int, default=20, help="1 in N claims changes between sends")
+    args = parser.parse_args()
+
+    clean_up()
+    try:
+        claims = make_claims(args.rows, 'resend-', duplicate_every=0)
+        timed('first send', args.rows, lambda: upsert_claims(claims, chunk_size=args.chunk_size))
+        before = history_rows()
+        timed('re-send', args.rows,
+              lambda: upsert_claims(resend(claims, args.changed_every), chunk_size=args.chunk_size)
+              )
+        print(f"history rows written by the re-send: {history_rows() - before}")
+    finally:
+        clean_up()
+
+
+if __name__ == '__main__':
+    main()
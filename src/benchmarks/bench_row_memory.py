@@ -0,0 +1,50 @@
+"""
+Memory of processed claim rows held in memory: the compact `__slots__` rows the processors emit (`common.rows`)
+against one dict per row, measured with tracemalloc on synthetic claims. The values themselves are shared with the
+parsed input, so the difference is the per-row container overhead. Also reports the pickled size per row, which is
+what the worker processes of `process_ndjson_parallel` send back.
+
+    python -m benchmarks.bench_row_memory --rows 200000
+"""
+import argparse
+import gc
+import logging
+import pickle
+import tracemalloc
+
+from benchmarks.synthetic import generate
+from field_mappers.claim_processor import FHIRClaimProcessor
+
+
+def measure(records, as_dict):
+    processor = FHIRClaimProcessor(None)
+    gc.collect()
+    tracemalloc.start()
+    rows = processor.process_many(records, batch_size=1000)
+    rows = [row.as_dict() for row in rows] if as_dict else list(rows)
+    allocated, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    pickled = len(pickle.dumps(rows[:1000], protocol=pickle.HIGHEST_PROTOCOL)) / min(len(rows), 1000)
+    return allocated, pickled
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--rows', type=int, default=200000)
+    args = parser.parse_args()
+
+    records = list(generate('Claim', args.rows, error_rate=0.01))
+    logging.disable(logging.CRITICAL)
+    try:
+        results = [(name, *measure(records, as_dict)) for name, as_dict in (('dict', True), ('slots', False))]
+    finally:
+        logging.disable(logging.NOTSET)
+
+    print(f"{'rows':<8} {'MB held':>10} {'bytes/row':>10} {'pickled bytes/row':>18}")
+    for name, allocated, pickled in results:
+        print(f"{name:<8} {allocated / 1e6:>10.1f} {allocated / args.rows:>10.0f} {pickled:>18.0f}")
+    print(f"reduction {results[0][1] / results[1][1]:.1f}x")
+
+
+if __name__ == '__main__':
+    main()
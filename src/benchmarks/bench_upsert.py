@@ -0,0 +1,90 @@
+"""
+Compares the per-row `upsert_claim` path against the chunked `upsert_claims` path.
+
+Requires the structured database to be up (see README), e.g.:
+    docker exec ingest-service python -m benchmarks.bench_upsert --rows 5000
+"""
+import argparse
+import time
+
+import psycopg2
+
+from structured_zone_transformer import pg_connection_dict, upsert_claim, upsert_claims
+
+BENCH_PREFIX = 'bench-upsert-'
+
+
+def make_claims(rows, prefix, duplicate_every=10):
+    """
+    Synthetic processed claims; every `duplicate_every`-th row repeats an earlier claim to exercise updates.
+    """
+    claims = []
+    for row_num in range(rows):
+        claim_num = row_num // 2 if duplicate_every and row_num % duplicate_every == 0 else row_num
+        claims.append({
+                'origin': 1,
+                'claim_id': f'{BENCH_PREFIX}{prefix}{claim_num}',
+                'patient_id': f'patient-{claim_num % 1000}',
+                'billing_start': '2020-01-01',
+                'billing_end': '2020-01-31',
+                'provider': 'provider-org',
+                'admitting_diagnosis': None,
+                'insurance': 'MEDICARE',
+                'status': 'active',
+                'amount': row_num % 10000,
+        })
+    return claims
+
+
+def resend(claims, changed_every=1):
+    """
+    A re-send of `claims` where every `changed_every`-th claim has a new amount, the others are unchanged.
+    """
+    return [dict(claim, amount=claim['amount'] + 1) if row_num % changed_every == 0 else claim
+            for row_num, claim in enumerate(claims)]
+
+
+def clean_up():
+    conn = psycopg2.connect(**pg_connection_dict)
+    try:
+        with conn.cursor() as cursor:
+            cursor.execute("DELETE FROM claims WHERE claim_id LIKE %s", (BENCH_PREFIX + '%',))
+            cursor.execute("DELETE FROM claims_history WHERE claim_id LIKE %s", (BENCH_PREFIX + '%',))
+        conn.commit()
+    finally:
+        conn.close()
+
+
+def timed(label, rows, func):
+    start = time.perf_counter()
+    func()
+    elapsed = time.perf_counter() - start
+    print(f"{label:<28} {rows:>9} rows {elapsed:>9.2f}s {rows / elapsed:>12.0f} rows/s")
+    return elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--rows', type=int, default=2000)
+    parser.add_argument('--chunk-sizes', type=int, nargs='+', default=[100, 1000, 5000])
+    args = parser.parse_args()
+
+    clean_up()
+    try:
+        # each run writes new claims first and then re-sends them with new amounts, so inserts and updates are timed
+        claims = make_claims(args.rows, 'row-')
+        row_time = timed('per-row upsert_claim', args.rows * 2,
+                         lambda: [upsert_claim(claim) for claim in claims + resend(claims)]
+                         )
+        for chunk_size in args.chunk_sizes:
+            claims = make_claims(args.rows, f'bulk-{chunk_size}-')
+            bulk_time = timed(f'upsert_claims chunk={chunk_size}', args.rows * 2,
+                              lambda: upsert_claims(claims + resend(claims), chunk_size=chunk_size)
+                              )
+            print(f"{'':<28} speedup {row_time / bulk_time:.1f}x")
+    finally:
+        clean_up()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,63 @@
+"""
+Shows that upsert latency stays flat as the claims tables grow, now that claim_id is unique and indexed.
+The claims table is grown in steps with generated rows; at each size a sample of per-row and chunked upserts
+(half updates of existing claims, half new claims) is timed.
+
+Requires the structured database to be up and migrated (see README), e.g.:
+    docker exec ingest-service python -m benchmarks.bench_upsert_scaling --sizes 10000 100000 1000000
+"""
+import argparse
+import statistics
+import time
+
+from benchmarks.bench_upsert import BENCH_PREFIX, clean_up, make_claims
+from common.db import close_pools, db_session
+from structured_zone_transformer import pg_connection_dict, upsert_claim, upsert_claims
+
+
+def grow_claims(size):
+    with db_session(pg_connection_dict) as conn, conn.cursor() as cursor:
+        cursor.execute("SELECT COUNT(*) FROM claims WHERE claim_id LIKE %s", (BENCH_PREFIX + 'seed-%',))
+        current = cursor.fetchone()[0]
+        cursor.execute("""
+            INSERT INTO claims (claim_id, patient_id, billing_start, billing_end, provider, status, amount)
+            SELECT %(prefix)s || n, 'patient-' || n %% 1000, '2020-01-01', '2020-01-31', 'provider-org', 'active', n
+            FROM generate_series(%(start)s, %(end)s) AS n
+        """, {'prefix': BENCH_PREFIX + 'seed-', 'start': current, 'end': size - 1}
+                       )
+        cursor.execute("ANALYZE claims")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--sizes', type=int, nargs='+', default=[10000, 100000, 500000])
+    parser.add_argument('--samples', type=int, default=200)
+    parser.add_argument('--chunk-size', type=int, default=1000)
+    args = parser.parse_args()
+
+    clean_up()
+    try:
+        print(f"{'table rows':>12} {'per-row p50 ms':>16} {'per-row p95 ms':>16} {'chunk ms':>10}")
+        for size in args.sizes:
+            grow_claims(size)
+            updates = [dict(claim, claim_id=f'{BENCH_PREFIX}seed-{n}')
+                       for n, claim in enumerate(make_claims(args.samples // 2, f'size-{size}-', duplicate_every=0))]
+            claims = updates + make_claims(args.samples // 2, f'new-{size}-', duplicate_every=0)
+            latencies = []
+            for claim in claims:
+                start = time.perf_counter()
+                upsert_claim(claim)
+                latencies.append((time.perf_counter() - start) * 1000)
+            chunk = make_claims(args.chunk_size, f'chunk-{size}-', duplicate_every=10)
+            start = time.perf_counter()
+            upsert_claims(chunk, chunk_size=args.chunk_size)
+            chunk_ms = (time.perf_counter() - start) * 1000
+            p95 = statistics.quantiles(latencies, n=20)[-1]
+            print(f"{size:>12} {statistics.median(latencies):>16.2f} {p95:>16.2f} {chunk_ms:>10.1f}")
+    finally:
+        clean_up()
+        close_pools()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,71 @@
+"""
+Benchmark of date validation: record-by-record `validate_dates` against the vectorized `validate_dates_batch` used
+by `process_many(batch_size=...)`. About one value in twenty is invalid; logging is disabled while timing.
+
+    python -m benchmarks.bench_validation --records 100000 --batch-size 1000
+"""
+import argparse
+import logging
+import time
+
+from common.utils import chunked
+from field_mappers.claim_processor import FHIRClaimProcessor
+
+
+def make_records(rows):
+    records = []
+    for row in range(rows):
+        day = 30 if row % 20 == 0 else row % 28 + 1
+        records.append({
+                "created": f"2021-01-{row % 28 + 1:02d}T00:00:00Z" if row % 25 else "yesterday",
+                "billablePeriod": {"start": f"2020-02-{day:02d}", "end": f"2020-12-{row % 28 + 1:02d}"},
+        })
+    return records
+
+
+def validate_rows(records):
+    processor = FHIRClaimProcessor(None)
+    for row_num, record in enumerate(records):
+        processor.data = record
+        processor.row_num = row_num
+        processor.validate_dates()
+    return processor.total_warnings
+
+
+def validate_batches(records, batch_size):
+    processor = FHIRClaimProcessor(None)
+    first_row = 0
+    for batch in chunked(records, batch_size):
+        processor.validate_dates_batch(batch, first_row)
+        first_row += len(batch)
+    return processor.total_warnings
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--records', type=int, default=100000)
+    parser.add_argument('--batch-size', type=int, default=1000)
+    args = parser.parse_args()
+
+    records = make_records(args.records)
+    logging.disable(logging.CRITICAL)
+    try:
+        started = time.perf_counter()
+        row_warnings = validate_rows(records)
+        row_seconds = time.perf_counter() - started
+
+        started = time.perf_counter()
+        batch_warnings = validate_batches(records, args.batch_size)
+        batch_seconds = time.perf_counter() - started
+    finally:
+        logging.disable(logging.NOTSET)
+
+    assert row_warnings == batch_warnings
+    print(f"{'mode':<8} {'seconds':>8} {'rows/s':>12} {'warnings':>9}")
+    for mode, seconds in (('row', row_seconds), ('batch', batch_seconds)):
+        print(f"{mode:<8} {seconds:>8.3f} {args.records / seconds:>12,.0f} {row_warnings:>9}")
+    print(f"speedup  {row_seconds / batch_seconds:.1f}x")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,190 @@
+"""
+Benchmark harness: generates synthetic Claim and Patient files (`benchmarks.synthetic`), runs them through parsing,
+validation, mapping, normalization and writing, and reports the seconds and rows/s of every stage.
+
+Writes go to an in-memory or SQLite sink, so the harness runs without Postgres. Stage timers come from
+`common.metrics` and include its overhead of about a microsecond per stage and record. Results are written as JSON
+to --results; --baseline compares them with an earlier results file to spot regressions.
+
+    python -m benchmarks.harness --rows 100000 --duplicate-rate 0.05 --error-rate 0.01 --sink sqlite \
+        --results results.json --baseline previous.json
+"""
+import argparse
+import json
+import logging
+import os
+import platform
+import sqlite3
+import tempfile
+import time
+from datetime import datetime, timezone
+
+from benchmarks.synthetic import RESOURCES, generate, write_ndjson
+from common import metrics
+from common.metrics import instrumented_run
+from common.utils import chunked
+from field_mappers.claim_processor import FHIRClaimProcessor
+from field_mappers.patient_processor import FHIRPatientProcessor
+from readers.decoders import FHIR_JSON_DECODER
+from readers.ndjson import iter_ndjson
+
+PROCESSORS = {'Claim': FHIRClaimProcessor, 'Patient': FHIRPatientProcessor}
+TABLES = {'Claim': ('claims', 'claim_id'), 'Patient': ('patients', 'patient_id')}
+# stage of the report -> timers of common.metrics it is made of
+STAGES = {
+        'parse': ('read', 'decode'),
+        'validate': ('validate', 'validate_dates_batch'),
+        'map': ('map_values',),
+        'normalize': ('normalize',),
+        'write': ('write',),
+}
+
+
+class MemorySink:
+    """
+    Keeps the last version of every record by key, like the current tables of the structured zone.
+    """
+
+    def __init__(self):
+        self.tables = {}
+
+    def write(self, table, key, records):
+        rows = self.tables.setdefault(table, {})
+        for record in records:
+            rows[record[key]] = record
+        return len(records)
+
+    def close(self):
+        self.tables = {}
+
+
+class SQLiteSink:
+    """
+    Upserts records by key into SQLite tables created from the columns of the first chunk.
+    """
+
+    def __init__(self, path=':memory:'):
+        self.db = sqlite3.connect(path)
+        self.db.execute("PRAGMA journal_mode = OFF")
+        self.db.execute("PRAGMA synchronous = OFF")
+        self.columns = {}
+
+    def write(self, table, key, records):
+        if not records:
+            return 0
+        if table not in self.columns:
+            self.columns[table] = columns = list(records[0])
+            self.db.execute(f"CREATE TABLE IF NOT EXISTS {table} ({', '.join(columns)}, PRIMARY KEY ({key}))")
+        columns = self.columns[table]
+        updates = ", ".join(f"{column} = excluded.{column}" for column in columns if column != key)
+        self.db.executemany(
+                f"INSERT INTO {table} ({', '.join(columns)}) VALUES ({', '.join('?' * len(columns))}) "
+                f"ON CONFLICT ({key}) DO UPDATE SET {updates}",
+                [[record.get(column) for column in columns] for record in records]
+        )
+        self.db.commit()
+        return len(records)
+
+    def close(self):
+        self.db.close()
+
+
+SINKS = {'memory': MemorySink, 'sqlite': SQLiteSink}
+
+
+def run(resource, path, sink, batch_size=1000, chunk_size=1000):
+    """
+    Process and write one NDJSON file, returns the result dict of the resource.
+    """
+    processor = PROCESSORS[resource](datetime.now())
+    table, key = TABLES[resource]
+    rows = 0
+    with instrumented_run(None, None, None, enabled=True) as run_metrics:
+        started = time.perf_counter()
+        processed = processor.process_many(iter_ndjson(path), batch_size=batch_size)
+        for chunk in chunked(processed, chunk_size):
+            with metrics.timer('write'):
+                rows += sink.write(table, key, chunk)
+        seconds = time.perf_counter() - started
+    timers = run_metrics.report()['timers']
+    stages = {}
+    for stage, names in STAGES.items():
+        stage_seconds = sum(timers.get(name, {}).get('seconds', 0.0) for name in names)
+        stages[stage] = {'seconds': stage_seconds, 'rows_per_second': rows / stage_seconds if stage_seconds else None}
+    return {
+            'rows': rows,
+            'bytes': os.path.getsize(path),
+            'warnings': processor.total_warnings,
+            'seconds': seconds,
+            'rows_per_second': rows / seconds if seconds else None,
+            'stages': stages,
+    }
+
+
+def print_results(results, baseline=None):
+    print(f"{'resource':<9} {'stage':<10} {'seconds':>9} {'rows/s':>12}" + (f" {'vs baseline':>12}" if baseline else ""))
+    for resource, result in results['results'].items():
+        base = (baseline or {}).get('results', {}).get(resource)
+        lines = [(stage, timing['seconds'], timing['rows_per_second']) for stage, timing in result['stages'].items()]
+        lines.append(('total', result['seconds'], result['rows_per_second']))
+        for stage, seconds, rows_per_second in lines:
+            line = f"{resource:<9} {stage:<10} {seconds:>9.3f} {rows_per_second or 0:>12,.0f}"
+            if base:
+                before = base['rows_per_second'] if stage == 'total' else base['stages'][stage]['rows_per_second']
+                line += f" {rows_per_second / before:>11.2f}x" if rows_per_second and before else f" {'-':>12}"
+            print(line)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--resources', nargs='+', choices=RESOURCES, default=list(RESOURCES))
+    parser.add_argument('--rows', type=int, default=100000)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--duplicate-rate', type=float, default=0.05)
+    parser.add_argument('--null-rate', type=float, default=0.1)
+    parser.add_argument('--error-rate', type=float, default=0.01)
+    parser.add_argument('--sink', choices=sorted(SINKS), default='memory')
+    parser.add_argument('--batch-size', type=int, default=1000, help="validation batch size, 0 validates by row")
+    parser.add_argument('--chunk-size', type=int, default=1000, help="records per sink write")
+    parser.add_argument('--data-dir', help="keep the generated files in this directory")
+    parser.add_argument('--results', default='benchmark-results.json')
+    parser.add_argument('--baseline', help="earlier results file to compare with")
+    args = parser.parse_args()
+
+    parameters = {name: getattr(args, name) for name in ('rows', 'seed', 'duplicate_rate', 'null_rate', 'error_rate',
+                                                         'sink', 'batch_size', 'chunk_size')}
+    results = {
+            'timestamp': datetime.now(timezone.utc).isoformat(),
+            'environment': {'python': platform.python_version(), 'platform': platform.platform(),
+                            'json_decoder': FHIR_JSON_DECODER},
+            'parameters': parameters,
+            'results': {},
+    }
+    with tempfile.TemporaryDirectory() as directory:
+        data_dir = args.data_dir or directory
+        logging.disable(logging.CRITICAL)
+        try:
+            for resource in args.resources:
+                path = os.path.join(data_dir, f"{resource}.ndjson")
+                write_ndjson(path, generate(resource, args.rows, args.seed, args.duplicate_rate, args.null_rate,
+                                            args.error_rate))
+                sink = SINKS[args.sink]()
+                try:
+                    results['results'][resource] = run(resource, path, sink, args.batch_size, args.chunk_size)
+                finally:
+                    sink.close()
+        finally:
+            logging.disable(logging.NOTSET)
+
+    with open(args.results, 'w') as file:
+        json.dump(results, file, indent=2)
+    baseline = None
+    if args.baseline:
+        with open(args.baseline) as file:
+            baseline = json.load(file)
+    print_results(results, baseline)
+    print(f"results written to {args.results}")
+
+
+if __name__ == '__main__':
+    main()
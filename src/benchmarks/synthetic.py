@@ -0,0 +1,161 @@
+"""
+Reproducible synthetic Claim and Patient NDJSON files, shaped like the fields `FHIRClaimProcessor` and
+`FHIRPatientProcessor` map, for benchmarks at sizes far beyond the sample data.
+
+- duplicate rate: share of rows that re-send an earlier record (same id) with changed content,
+- null rate: share of rows whose optional fields (diagnosis, insurance, birth date, ...) are missing,
+- error rate: share of rows with a validation error (invalid date or datetime, missing required field or wrong
+  resource type), each such row causing exactly one warning.
+
+The same seed and rates always produce the same file.
+
+    python -m benchmarks.synthetic --resource Claim --rows 1000000 --error-rate 0.01 --out /tmp/Claim.ndjson
+"""
+import argparse
+import json
+import random
+
+RESOURCES = ('Claim', 'Patient')
+STATUSES = ('active', 'cancelled', 'draft', 'entered-in-error')
+INSURANCES = ('MEDICARE', 'MEDICAID', 'PRIVATE')
+DIAGNOSES = ('A01', 'B20', 'E11', 'I10', 'J45')
+GIVEN_NAMES = ('Werner', 'Mohammad', 'Ana', 'Li', 'Grace', 'Tomas')
+FAMILY_NAMES = ('Schneider', 'Mann', 'Silva', 'Chen', 'Hopper', 'Novak')
+CLAIM_ERRORS = ('invalid_date', 'invalid_datetime', 'missing_required_field', 'wrong_resource_type')
+PATIENT_ERRORS = ('invalid_date', 'invalid_datetime', 'missing_required_field')
+
+
+def patient_id(n):
+    return f"-{10000000000000 + n}"
+
+
+def _date(rng, year):
+    return f"{year}-{rng.randint(1, 12):02d}-{rng.randint(1, 28):02d}"
+
+
+def make_claim(n, rng, version=0, patients=1000):
+    """
+    Claim resource `claim-{n}`; later versions of the same claim change its status and amount.
+    """
+    start = _date(rng, 2020)
+    return {
+            "resourceType": "Claim",
+            "id": f"claim-{n}",
+            "created": f"2021-{rng.randint(1, 12):02d}-{rng.randint(1, 28):02d}T{rng.randint(0, 23):02d}:00:00Z",
+            "status": STATUSES[(n + version) % len(STATUSES)],
+            "patient": {"reference": f"Patient/{patient_id(n % patients)}"},
+            "provider": {"reference": f"#provider-{n % 50}"},
+            "billablePeriod": {"start": start, "end": start},
+            "total": {"value": round(rng.uniform(10, 5000), 2) + version, "currency": "USD"},
+            "insurance": [{"coverage": {"identifier": {"value": rng.choice(INSURANCES)}}}],
+            "diagnosis": [{"diagnosisCodeableConcept": {
+                    "coding": [{"code": rng.choice(DIAGNOSES)}],
+                    "type": [{"coding": [{"code": "admitting" if n % 3 else "principal"}]}],
+            }}],
+    }
+
+
+def make_patient(n, rng, version=0, patients=None):
+    """
+    Patient resource with the id `patient_id(n)`; later versions of the same patient change the family name.
+    """
+    return {
+            "resourceType": "Patient",
+            "id": patient_id(n),
+            "name": [{"family": f"{rng.choice(FAMILY_NAMES)}{n}{'-' * version}", "given": [rng.choice(GIVEN_NAMES)],
+                      "use": "usual"}],
+            "gender": rng.choice(('male', 'female', 'other', 'unknown')),
+            "birthDate": _date(rng, rng.randint(1930, 2010)),
+            "address": [{"state": str(rng.randint(1, 50))}],
+            "meta": {"lastUpdated": "2021-08-17T13:43:00.037-04:00"},
+    }
+
+
+def _remove_optional(resource):
+    if resource["resourceType"] == "Claim":
+        resource.pop("diagnosis")
+        resource.pop("insurance")
+    else:
+        resource.pop("birthDate")
+        resource.pop("address")
+        resource.pop("gender")
+
+
+def _add_error(resource, error):
+    if error == 'invalid_date':
+        if resource["resourceType"] == "Claim":
+            resource["billablePeriod"]["start"] = "2020-02-30"
+        else:
+            resource["birthDate"] = "1999-13-01"
+    elif error == 'invalid_datetime':
+        if resource["resourceType"] == "Claim":
+            resource["created"] = "yesterday"
+        else:
+            resource["meta"]["lastUpdated"] = "2021-08-17 13:43"
+    elif error == 'missing_required_field':
+        resource.pop("status" if resource["resourceType"] == "Claim" else "name")
+    else:
+        resource["resourceType"] = "Patient"
+
+
+def generate(resource, rows, seed=0, duplicate_rate=0.0, null_rate=0.0, error_rate=0.0, patients=None):
+    """
+    Yield `rows` synthetic resources of type `resource` ('Claim' or 'Patient').
+
+    :param duplicate_rate: share of rows re-sending one of the previous records with changed content
+    :param null_rate: share of rows without their optional fields
+    :param error_rate: share of rows with one validation error
+    :param patients: number of distinct patients claims refer to, defaults to about one per ten claims
+    """
+    if resource not in RESOURCES:
+        raise ValueError(f"Unknown resource {resource!r}, expected one of {RESOURCES}")
+    make, errors = (make_claim, CLAIM_ERRORS) if resource == 'Claim' else (make_patient, PATIENT_ERRORS)
+    patients = patients or max(rows // 10, 1)
+    rng = random.Random(seed)
+    versions = {}
+    next_id = 0
+    for row in range(rows):
+        if next_id and rng.random() < duplicate_rate:
+            n = rng.randrange(next_id)
+        else:
+            n, next_id = next_id, next_id + 1
+        versions[n] = version = versions.get(n, -1) + 1
+        record = make(n, rng, version, patients)
+        if rng.random() < null_rate:
+            _remove_optional(record)
+        if rng.random() < error_rate:
+            _add_error(record, errors[row % len(errors)])
+        yield record
+
+
+def write_ndjson(path, records):
+    """
+    Write records to an NDJSON file, returns the number of bytes written.
+    """
+    size = 0
+    with open(path, 'w') as file:
+        for record in records:
+            line = json.dumps(record, separators=(',', ':')) + "\n"
+            file.write(line)
+            size += len(line)
+    return size
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--resource', choices=RESOURCES, default='Claim')
+    parser.add_argument('--rows', type=int, default=100000)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--duplicate-rate', type=float, default=0.0)
+    parser.add_argument('--null-rate', type=float, default=0.0)
+    parser.add_argument('--error-rate', type=float, default=0.0)
+    parser.add_argument('--out', required=True)
+    args = parser.parse_args()
+
+    size = write_ndjson(args.out, generate(args.resource, args.rows, args.seed, args.duplicate_rate, args.null_rate,
+                                           args.error_rate))
+    print(f"wrote {args.rows} {args.resource} rows ({size / 1e6:.1f} MB) to {args.out}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,148 @@
+import hashlib
+import os
+from collections import namedtuple
+
+from common.db import db_session
+from common.utils import TransformerLogger
+
+LOG = TransformerLogger(__name__)
+
+# also identify files by the SHA-256 of their content, not only their size and modification time
+CHECKPOINT_HASH_FILES = (os.getenv('CHECKPOINT_HASH_FILES') or '0') == '1'
+
+IN_PROGRESS = 'in_progress'
+COMPLETE = 'complete'
+
+FileIdentity = namedtuple('FileIdentity', ['path', 'size', 'mtime_ns', 'sha256'])
+Checkpoint = namedtuple('Checkpoint', ['rows_committed', 'status'])
+
+
+def file_identity(path, with_hash=CHECKPOINT_HASH_FILES):
+    """
+    Identify the current content of a file by its absolute path, size and modification time, and optionally the
+    SHA-256 of its content.
+    """
+    stat = os.stat(path)
+    sha256 = None
+    if with_hash:
+        digest = hashlib.sha256()
+        with open(path, 'rb') as file:
+            for block in iter(lambda: file.read(1024 * 1024), b''):
+                digest.update(block)
+        sha256 = digest.hexdigest()
+    return FileIdentity(os.path.abspath(path), stat.st_size, stat.st_mtime_ns, sha256)
+
+
+class CheckpointStore:
+    """
+    Records in the `ingest_checkpoints` table how many rows of each input file have been committed.
+
+    `advance` runs on the cursor of the transaction writing the rows, so the checkpoint and the rows it counts are
+    committed (or rolled back) together and no row is applied twice when a run is resumed.
+    """
+
+    def __init__(self, connection_dict):
+        self.connection_dict = connection_dict
+
+    def load(self, identity):
+        """
+        Returns the Checkpoint of a file, or None if it was never ingested or has changed since.
+        """
+        with db_session(self.connection_dict) as conn, conn.cursor() as cursor:
+            cursor.execute("""
+                SELECT file_size, file_mtime_ns, file_sha256, rows_committed, status
+                FROM ingest_checkpoints WHERE path = %s
+            """, (identity.path,)
+                           )
+            row = cursor.fetchone()
+        if row is None:
+            return None
+        size, mtime_ns, sha256, rows_committed, status = row
+        if (size, mtime_ns) != (identity.size, identity.mtime_ns) or \
+                (sha256 and identity.sha256 and sha256 != identity.sha256):
+            LOG.info(f"{identity.path} changed since its last checkpoint")
+            return None
+        return Checkpoint(rows_committed, status)
+
+    def start(self, identity):
+        """
+        (Re)start the checkpoint of a file at row 0.
+        """
+        with db_session(self.connection_dict) as conn, conn.cursor() as cursor:
+            self._save(cursor, identity, 0, IN_PROGRESS)
+
+    def finish(self, identity, cursor, rows_committed):
+        """
+        Record a file as completely ingested with `rows_committed` rows, in the transaction of `cursor`, e.g. when
+        the whole file is written in a single transaction.
+        """
+        self._save(cursor, identity, rows_committed, COMPLETE)
+
+    @staticmethod
+    def _save(cursor, identity, rows_committed, status):
+        cursor.execute("""
+            INSERT INTO ingest_checkpoints (path, file_size, file_mtime_ns, file_sha256, rows_committed, status)
+            VALUES (%(path)s, %(size)s, %(mtime_ns)s, %(sha256)s, %(rows_committed)s, %(status)s)
+            ON CONFLICT (path) DO UPDATE
+            SET file_size = EXCLUDED.file_size, file_mtime_ns = EXCLUDED.file_mtime_ns,
+                file_sha256 = EXCLUDED.file_sha256, rows_committed = EXCLUDED.rows_committed,
+                status = EXCLUDED.status, updated_ts = CURRENT_TIMESTAMP
+        """, dict(identity._asdict(), rows_committed=rows_committed, status=status)
+                       )
+
+    def advance(self, identity, cursor, rows_committed):
+        """
+        Move the checkpoint of a file to `rows_committed`, in the transaction of `cursor`.
+        """
+        cursor.execute("""
+            UPDATE ingest_checkpoints SET rows_committed = %s, updated_ts = CURRENT_TIMESTAMP WHERE path = %s
+        """, (rows_committed, identity.path)
+                       )
+
+    def on_commit(self, identity, first_row=0):
+        """
+        Returns an `on_commit(cursor, rows_written)` callback for the write functions of the transformer, which
+        count rows from `first_row`.
+        """
+        return lambda cursor, rows_written: self.advance(identity, cursor, first_row + rows_written)
+
+    def complete(self, identity):
+        with db_session(self.connection_dict) as conn, conn.cursor() as cursor:
+            cursor.execute("""
+                UPDATE ingest_checkpoints SET status = %s, updated_ts = CURRENT_TIMESTAMP WHERE path = %s
+            """, (COMPLETE, identity.path)
+                           )
+
+
+class RoutedCheckpointStore:
+    """
+    Checkpoints of files whose records are written to the databases of their origins (`common.routing.OriginRouter`):
+    the checkpoint of a file is kept in the `ingest_checkpoints` table of every routed database, next to the rows.
+
+    The partitions of different databases do not share a transaction, so the checkpoints only record a file as
+    started or complete, and a file is only skipped once it is complete in all of the databases. An interrupted
+    file is written again from its first row; records already written are skipped by their content hash.
+    """
+
+    def __init__(self, connection_dicts):
+        self.stores = [CheckpointStore(connection_dict) for connection_dict in connection_dicts]
+
+    def load(self, identity):
+        checkpoints = [store.load(identity) for store in self.stores]
+        if all(checkpoint and checkpoint.status == COMPLETE for checkpoint in checkpoints):
+            return checkpoints[0]
+        if any(checkpoint and checkpoint.status == IN_PROGRESS for checkpoint in checkpoints):
+            return Checkpoint(0, IN_PROGRESS)
+        return None
+
+    def start(self, identity):
+        for store in self.stores:
+            store.start(identity)
+
+    def on_commit(self, identity, first_row=0):
+        # progress within a file is not recorded, see the class docstring
+        return None
+
+    def complete(self, identity):
+        for store in self.stores:
+            store.complete(identity)
@@ -0,0 +1,111 @@
+import os
+import threading
+from contextlib import contextmanager
+
+from psycopg2.extensions import cursor as BaseCursor
+from psycopg2.pool import ThreadedConnectionPool
+
+from common import metrics
+from common.utils import TransformerLogger
+
+LOG = TransformerLogger(__name__)
+
+DATABASE_POOL_MIN_SIZE = int(os.getenv('DATABASE_POOL_MIN_SIZE') or 1)
+DATABASE_POOL_MAX_SIZE = int(os.getenv('DATABASE_POOL_MAX_SIZE') or 4)
+
+
+class CountingCursor(BaseCursor):
+    """
+    Cursor counting the statements sent to the server as `db_round_trips`, used while metrics are collected.
+    """
+
+    def execute(self, query, vars=None):
+        metrics.count('db_round_trips')
+        return super().execute(query, vars)
+
+    def executemany(self, query, vars_list):
+        metrics.count('db_round_trips')
+        return super().executemany(query, vars_list)
+
+    def copy_expert(self, sql, file, size=8192):
+        metrics.count('db_round_trips')
+        return super().copy_expert(sql, file, size)
+
+
+class ConnectionPool:
+    """
+    Thread-safe psycopg2 connection pool that blocks until a connection is free instead of raising when all
+    `max_size` connections are in use.
+    """
+
+    def __init__(self, connection_dict, min_size=DATABASE_POOL_MIN_SIZE, max_size=DATABASE_POOL_MAX_SIZE):
+        self._pool = ThreadedConnectionPool(min_size, max_size, **connection_dict)
+        self._available = threading.BoundedSemaphore(max_size)
+
+    def getconn(self):
+        self._available.acquire()
+        try:
+            return self._pool.getconn()
+        except Exception:
+            self._available.release()
+            raise
+
+    def putconn(self, conn):
+        try:
+            # connections that were closed by the server are discarded rather than handed out again
+            self._pool.putconn(conn, close=bool(conn.closed))
+        finally:
+            self._available.release()
+
+    def closeall(self):
+        self._pool.closeall()
+
+
+_pools = {}
+_pools_lock = threading.Lock()
+
+
+def get_pool(connection_dict):
+    """
+    Return the shared pool for `connection_dict`, creating it on first use.
+    Pools are per process, so worker processes never reuse connections inherited from their parent.
+    """
+    key = (os.getpid(), tuple(sorted(connection_dict.items())))
+    with _pools_lock:
+        if key not in _pools:
+            _pools[key] = ConnectionPool(connection_dict)
+        return _pools[key]
+
+
+@contextmanager
+def db_session(connection_dict):
+    """
+    Borrow a pooled connection for one transaction: commits when the block succeeds, rolls back when it raises,
+    and always returns the connection to the pool.
+
+    :param connection_dict: psycopg2 connection parameters, e.g. `pg_connection_dict`
+    """
+    pool = get_pool(connection_dict)
+    conn = pool.getconn()
+    conn.cursor_factory = CountingCursor if metrics.current().enabled else None
+    metrics.count('db_transactions')
+    try:
+        yield conn
+        conn.commit()
+    except Exception:
+        if not conn.closed:
+            conn.rollback()
+        raise
+    finally:
+        pool.putconn(conn)
+
+
+def close_pools():
+    """
+    Close every connection of every pool created by this process.
+    """
+    with _pools_lock:
+        for key, pool in list(_pools.items()):
+            if key[0] == os.getpid():
+                pool.closeall()
+                del _pools[key]
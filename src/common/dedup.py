@@ -0,0 +1,152 @@
+import json
+import os
+import sqlite3
+import tempfile
+from itertools import groupby
+
+from common.rows import row_to_json
+from common.utils import TransformerLogger
+
+LOG = TransformerLogger(__name__)
+
+# 'all' keeps every version of a record, grouped by key; 'final' keeps only the last version; 'off' disables the stage
+DEDUP_MODES = ('off', 'all', 'final')
+# records kept in memory before the versions are moved to an SQLite file
+DEDUP_MAX_IN_MEMORY = int(os.getenv('DEDUP_MAX_IN_MEMORY') or 100000)
+_FLUSH_SIZE = 10000
+
+
+class Deduplicator:
+    """
+    Collects processed records and groups the versions of each record by a business key (e.g. claim_id), so every
+    key is written once instead of once per occurrence in the file.
+
+    - mode 'all': every version is kept, in file order within its key, so the history tables still get one row per
+      version. Keys are returned in the order of their first occurrence, with their versions next to each other.
+    - mode 'final': only the last version of each key is kept and written, in the order of their last occurrence.
+
+    Records without a key are never merged. Past `max_in_memory` records the versions are moved to a temporary SQLite
+    database, so memory stays flat for files of any size.
+    """
+
+    def __init__(self, key, mode='all', max_in_memory=DEDUP_MAX_IN_MEMORY, directory=None):
+        if mode not in DEDUP_MODES[1:]:
+            raise ValueError(f"Unknown dedup mode {mode!r}, expected one of {DEDUP_MODES[1:]}")
+        self.key = key
+        self.mode = mode
+        self.max_in_memory = max_in_memory
+        self.directory = directory or os.getenv('SPILL_DIR')
+        self._groups = {}
+        self._in_memory = 0
+        self._seq = 0
+        self._db = None
+        self._path = None
+        self._pending = []
+
+    def _group_key(self, record):
+        key = record.get(self.key)
+        return ['unkeyed', self._seq] if key is None else ['key', key]
+
+    def add(self, record):
+        group_key = self._group_key(record)
+        self._seq += 1
+        if self._db is not None:
+            self._pending.append((json.dumps(group_key), self._seq, json.dumps(record, default=row_to_json)))
+            if len(self._pending) >= _FLUSH_SIZE:
+                self._flush()
+            return
+        group_key = tuple(group_key)
+        if self.mode == 'final':
+            # re-inserting moves the key to the end, so keys stay in the order of their last occurrence
+            self._in_memory -= len(self._groups.pop(group_key, ()))
+            self._groups[group_key] = [record]
+        else:
+            self._groups.setdefault(group_key, []).append(record)
+        self._in_memory += 1
+        if self._in_memory > self.max_in_memory:
+            self._spill()
+
+    def extend(self, records):
+        for record in records:
+            self.add(record)
+
+    def _spill(self):
+        fd, self._path = tempfile.mkstemp(prefix='fhir-dedup-', suffix='.sqlite', dir=self.directory)
+        os.close(fd)
+        LOG.info(f"Moving {self._in_memory} records of {len(self._groups)} keys to {self._path}")
+        self._db = sqlite3.connect(self._path)
+        self._db.execute("PRAGMA journal_mode = OFF")
+        self._db.execute("PRAGMA synchronous = OFF")
+        if self.mode == 'final':
+            self._db.execute("CREATE TABLE versions (key TEXT PRIMARY KEY, seq INTEGER, record TEXT)")
+        else:
+            self._db.execute("CREATE TABLE groups (key TEXT PRIMARY KEY, group_seq INTEGER)")
+            self._db.execute("CREATE TABLE versions (key TEXT, seq INTEGER, record TEXT)")
+        seq = 0
+        for group_key, records in self._groups.items():
+            for record in records:
+                seq += 1
+                self._pending.append((json.dumps(list(group_key)), seq, json.dumps(record, default=row_to_json)))
+        self._groups = {}
+        self._in_memory = 0
+        self._flush()
+
+    def _flush(self):
+        if self.mode == 'final':
+            self._db.executemany("INSERT OR REPLACE INTO versions (key, seq, record) VALUES (?, ?, ?)", self._pending)
+        else:
+            self._db.executemany("INSERT OR IGNORE INTO groups (key, group_seq) VALUES (?, ?)",
+                                 [(key, seq) for key, seq, _ in self._pending]
+                                 )
+            self._db.executemany("INSERT INTO versions (key, seq, record) VALUES (?, ?, ?)", self._pending)
+        self._db.commit()
+        self._pending = []
+
+    def groups(self):
+        """
+        Yields the list of versions to write for every key.
+        """
+        if self._db is None:
+            yield from self._groups.values()
+            return
+        self._flush()
+        if self.mode == 'final':
+            rows = self._db.execute("SELECT key, record FROM versions ORDER BY seq")
+        else:
+            rows = self._db.execute("SELECT v.key, v.record FROM versions v JOIN groups g ON g.key = v.key "
+                                    "ORDER BY g.group_seq, v.seq")
+        for _, group in groupby(rows, key=lambda row: row[0]):
+            yield [json.loads(record) for _, record in group]
+
+    def __iter__(self):
+        for group in self.groups():
+            yield from group
+
+    def __len__(self):
+        if self._db is None:
+            return self._in_memory
+        self._flush()
+        return self._db.execute("SELECT COUNT(*) FROM versions").fetchone()[0]
+
+    def key_count(self):
+        """
+        Number of distinct keys, records without a key count once each.
+        """
+        if self._db is None:
+            return len(self._groups)
+        self._flush()
+        table = 'versions' if self.mode == 'final' else 'groups'
+        return self._db.execute(f"SELECT COUNT(*) FROM {table}").fetchone()[0]
+
+    def close(self):
+        if self._db is not None:
+            self._db.close()
+            self._db = None
+        if self._path and os.path.exists(self._path):
+            os.remove(self._path)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
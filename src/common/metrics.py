@@ -0,0 +1,227 @@
+import cProfile
+import io
+import json
+import os
+import pstats
+import threading
+import time
+from contextlib import contextmanager, nullcontext
+from datetime import datetime, timezone
+
+from common.utils import TransformerLogger
+
+LOG = TransformerLogger(__name__)
+
+# write a JSON run report with the timers and counters of the run to this path
+METRICS_REPORT_PATH = os.getenv('METRICS_REPORT_PATH')
+# write the same timers and counters in the Prometheus text format to this path, e.g. for the textfile collector
+METRICS_PROMETHEUS_PATH = os.getenv('METRICS_PROMETHEUS_PATH')
+# run the ingest under cProfile and dump the stats to this path, readable with `python -m pstats`
+INGEST_PROFILE_PATH = os.getenv('INGEST_PROFILE_PATH')
+
+PROMETHEUS_PREFIX = 'fhir_ingest'
+
+
+class _Timer:
+    __slots__ = ('metrics', 'name', 'started')
+
+    def __init__(self, metrics, name):
+        self.metrics = metrics
+        self.name = name
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.metrics.add_time(self.name, time.perf_counter() - self.started)
+
+
+class Metrics:
+    """
+    Thread-safe timers and counters of an ingest run.
+
+    Timers accumulate the seconds and number of calls of a stage, counters add up values such as rows, bytes or
+    database round trips. Stages may nest (e.g. 'read' runs inside 'process' since files are streamed), so the
+    seconds of all timers do not add up to the run time.
+    """
+    enabled = True
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.started_at = datetime.now(timezone.utc)
+        self.timers = {}
+        self.counters = {}
+        self._lock = threading.Lock()
+
+    def timer(self, name):
+        """
+        Context manager adding the time spent in its block to the timer `name`.
+        """
+        return _Timer(self, name)
+
+    def add_time(self, name, seconds):
+        with self._lock:
+            calls, total = self.timers.get(name, (0, 0.0))
+            self.timers[name] = (calls + 1, total + seconds)
+
+    def count(self, name, value=1):
+        with self._lock:
+            self.counters[name] = self.counters.get(name, 0) + value
+
+    def snapshot(self):
+        """
+        Returns copies of the timers and counters, e.g. to send them from a worker process to `merge`.
+        """
+        with self._lock:
+            return dict(self.timers), dict(self.counters)
+
+    def merge(self, timers, counters):
+        """
+        Add the timers and counters of a `snapshot`, e.g. of the records processed in a worker process.
+        """
+        with self._lock:
+            for name, (calls, seconds) in timers.items():
+                own_calls, own_seconds = self.timers.get(name, (0, 0.0))
+                self.timers[name] = (own_calls + calls, own_seconds + seconds)
+            for name, value in counters.items():
+                self.counters[name] = self.counters.get(name, 0) + value
+
+    def report(self):
+        """
+        Returns the timers and counters as a JSON-serializable dict.
+        """
+        with self._lock:
+            return {
+                    'started': self.started_at.isoformat(),
+                    'seconds': time.perf_counter() - self.started,
+                    'timers': {name: {'calls': calls, 'seconds': seconds}
+                               for name, (calls, seconds) in sorted(self.timers.items())},
+                    'counters': dict(sorted(self.counters.items())),
+            }
+
+    def write_json(self, path):
+        with open(path, 'w') as file:
+            json.dump(self.report(), file, indent=2)
+
+    def write_prometheus(self, path):
+        """
+        Write the report in the Prometheus text exposition format. The file is replaced atomically, so a collector
+        never reads a partial file.
+        """
+        report = self.report()
+        lines = [f"# TYPE {PROMETHEUS_PREFIX}_run_seconds gauge",
+                 f"{PROMETHEUS_PREFIX}_run_seconds {report['seconds']}",
+                 f"# TYPE {PROMETHEUS_PREFIX}_stage_seconds_total counter"]
+        lines += [f'{PROMETHEUS_PREFIX}_stage_seconds_total{{stage="{name}"}} {timer["seconds"]}'
+                  for name, timer in report['timers'].items()]
+        lines.append(f"# TYPE {PROMETHEUS_PREFIX}_stage_calls_total counter")
+        lines += [f'{PROMETHEUS_PREFIX}_stage_calls_total{{stage="{name}"}} {timer["calls"]}'
+                  for name, timer in report['timers'].items()]
+        for name, value in report['counters'].items():
+            lines += [f"# TYPE {PROMETHEUS_PREFIX}_{name}_total counter", f"{PROMETHEUS_PREFIX}_{name}_total {value}"]
+        with open(path + '.tmp', 'w') as file:
+            file.write("\n".join(lines) + "\n")
+        os.replace(path + '.tmp', path)
+
+
+class NullMetrics:
+    """
+    Stand-in for Metrics while instrumentation is disabled: every call is a no-op.
+    """
+    enabled = False
+    _timer = nullcontext()
+
+    def timer(self, name):
+        return self._timer
+
+    def add_time(self, name, seconds):
+        pass
+
+    def count(self, name, value=1):
+        pass
+
+    def snapshot(self):
+        return {}, {}
+
+    def merge(self, timers, counters):
+        pass
+
+
+_current = NullMetrics()
+
+
+def current():
+    """
+    The Metrics of the current run, or a NullMetrics when instrumentation is disabled.
+    """
+    return _current
+
+
+def timer(name):
+    return _current.timer(name)
+
+
+def count(name, value=1):
+    _current.count(name, value)
+
+
+@contextmanager
+def collected(enabled=True):
+    """
+    Record the block into a fresh Metrics (or a NullMetrics), and restore the current metrics afterwards. Used by
+    worker processes, which would otherwise record into the copy of the parent's metrics they were forked with; the
+    parent merges their `snapshot` into its run.
+    """
+    global _current
+    previous, _current = _current, Metrics() if enabled else NullMetrics()
+    try:
+        yield _current
+    finally:
+        _current = previous
+
+
+@contextmanager
+def profiled(path):
+    """
+    Run the block under cProfile and dump the stats to `path`; a no-op without a path.
+    Only the calling thread is profiled, not the threads of the pipeline or origin routing.
+    """
+    if not path:
+        yield None
+        return
+    profile = cProfile.Profile()
+    profile.enable()
+    try:
+        yield profile
+    finally:
+        profile.disable()
+        profile.dump_stats(path)
+        top = io.StringIO()
+        pstats.Stats(profile, stream=top).sort_stats('cumulative').print_stats(15)
+        LOG.info(f"Wrote profile to {path}, top functions by cumulative time:\n{top.getvalue()}")
+
+
+@contextmanager
+def instrumented_run(report_path=METRICS_REPORT_PATH, prometheus_path=METRICS_PROMETHEUS_PATH,
+                     profile_path=INGEST_PROFILE_PATH, enabled=None):
+    """
+    Collect metrics for the block when a report path is set and write the reports when it ends, also when it fails.
+    Without any path the instrumentation stays disabled and costs next to nothing.
+
+    :param enabled: collect metrics even without a report path, e.g. to read them from the returned Metrics
+    :return: the Metrics of the run, or a NullMetrics
+    """
+    global _current
+    if enabled or (enabled is None and (report_path or prometheus_path)):
+        _current = Metrics()
+    try:
+        with profiled(profile_path):
+            yield _current
+    finally:
+        metrics, _current = _current, NullMetrics()
+        if report_path:
+            metrics.write_json(report_path)
+            LOG.info(f"Wrote run report to {report_path}")
+        if prometheus_path:
+            metrics.write_prometheus(prometheus_path)
@@ -0,0 +1,151 @@
+import os
+import queue
+import threading
+import time
+
+from common.utils import TransformerLogger
+
+LOG = TransformerLogger(__name__)
+
+# chunks buffered between two stages; a full queue blocks the stage before it (backpressure)
+PIPELINE_QUEUE_SIZE = int(os.getenv('PIPELINE_QUEUE_SIZE') or 4)
+
+_DONE = object()
+_POLL_SECONDS = 0.1
+
+
+class StopPipeline(Exception):
+    """
+    Raised by a stage to stop the pipeline early without an error, e.g. once a file is rejected.
+    """
+
+
+class StageStats:
+    """
+    Counters of one pipeline stage. `busy_seconds` is the time spent in the stage function, `wait_seconds` the time
+    spent blocked on the queues around it (waiting for input, or for room in the next queue).
+    """
+
+    def __init__(self, name):
+        self.name = name
+        self.chunks = 0
+        self.rows = 0
+        self.busy_seconds = 0.0
+        self.wait_seconds = 0.0
+
+    @property
+    def rows_per_second(self):
+        return self.rows / self.busy_seconds if self.busy_seconds else 0.0
+
+    def __repr__(self):
+        return (f"{self.name:<10} {self.chunks:>7} chunks {self.rows:>10} rows {self.busy_seconds:>8.2f}s busy "
+                f"{self.wait_seconds:>8.2f}s waiting {self.rows_per_second:>12.0f} rows/s")
+
+
+def _put(target, item, stop, stats):
+    started = time.perf_counter()
+    try:
+        while not stop.is_set():
+            try:
+                target.put(item, timeout=_POLL_SECONDS)
+                return True
+            except queue.Full:
+                continue
+        return False
+    finally:
+        stats.wait_seconds += time.perf_counter() - started
+
+
+def _get(source, stop, stats):
+    started = time.perf_counter()
+    try:
+        while not stop.is_set():
+            try:
+                return source.get(timeout=_POLL_SECONDS)
+            except queue.Empty:
+                continue
+        return _DONE
+    finally:
+        stats.wait_seconds += time.perf_counter() - started
+
+
+def run_pipeline(source, stages, queue_size=PIPELINE_QUEUE_SIZE):
+    """
+    Run `stages` over the chunks of `source`, each stage in its own thread, connected by bounded queues.
+
+    While a stage works on chunk N the stage before it can already work on chunk N + 1, e.g. parsing and processing
+    overlap with database writes, which release the GIL while they wait on the server. Chunks go through every stage
+    in source order.
+
+    Parameters:
+    - source: iterable of chunks (lists), read in a thread of its own, reported as the 'read' stage.
+    - stages: list of (name, function) pairs; each function takes a chunk and returns the chunk for the next stage,
+      the return value of the last one is ignored. A function may raise StopPipeline to stop early.
+    - queue_size: maximum number of chunks waiting between two stages.
+
+    Returns:
+    - (stats, stopped): a StageStats per stage, starting with 'read', and whether a stage raised StopPipeline.
+      Any other exception of a stage stops the pipeline and is raised again here.
+    """
+    stop = threading.Event()
+    queues = [queue.Queue(maxsize=queue_size) for _ in stages]
+    stats = [StageStats('read')] + [StageStats(name) for name, _ in stages]
+    outcome = {'stopped': False, 'error': None}
+
+    def fail(e):
+        if isinstance(e, StopPipeline):
+            outcome['stopped'] = True
+        elif outcome['error'] is None:
+            outcome['error'] = e
+        stop.set()
+
+    def read():
+        chunks = iter(source)
+        try:
+            while not stop.is_set():
+                started = time.perf_counter()
+                chunk = next(chunks, _DONE)
+                stats[0].busy_seconds += time.perf_counter() - started
+                if chunk is _DONE:
+                    break
+                stats[0].chunks += 1
+                stats[0].rows += len(chunk)
+                if not _put(queues[0], chunk, stop, stats[0]):
+                    return
+            _put(queues[0], _DONE, stop, stats[0])
+        except BaseException as e:
+            fail(e)
+
+    def work(index, function):
+        stage_stats = stats[index + 1]
+        output = queues[index + 1] if index + 1 < len(queues) else None
+        try:
+            while True:
+                chunk = _get(queues[index], stop, stage_stats)
+                if chunk is _DONE:
+                    break
+                started = time.perf_counter()
+                result = function(chunk)
+                stage_stats.busy_seconds += time.perf_counter() - started
+                stage_stats.chunks += 1
+                stage_stats.rows += len(chunk)
+                if output is not None and not _put(output, result, stop, stage_stats):
+                    return
+            if output is not None:
+                _put(output, _DONE, stop, stage_stats)
+        except BaseException as e:
+            fail(e)
+
+    threads = [threading.Thread(target=read, name='pipeline-read', daemon=True)]
+    threads += [threading.Thread(target=work, args=(index, function), name=f'pipeline-{name}', daemon=True)
+                for index, (name, function) in enumerate(stages)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    for stage_stats in stats:
+        LOG.info(f"Pipeline stage {stage_stats}")
+    if outcome['error'] is not None:
+        raise outcome['error']
+    return stats, outcome['stopped']
@@ -0,0 +1,131 @@
+import json
+import os
+import time
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+
+from common.spill import SpillFile
+from common.utils import TransformerLogger
+
+LOG = TransformerLogger(__name__)
+
+# origins written in parallel by `OriginRouter.write`
+ORIGIN_ROUTING_WORKERS = int(os.getenv('ORIGIN_ROUTING_WORKERS') or 4)
+
+TenantStats = namedtuple('TenantStats', ['origin', 'rows', 'seconds', 'rows_per_second'])
+
+
+def load_routes(value):
+    """
+    Parse the ORIGIN_ROUTES setting: a JSON object mapping an origin to the psycopg2 connection parameters that differ
+    from the default connection, e.g. `{"2": {"dbname": "hospital_2"}, "3": {"schema": "tenant_3"}}`. A `schema`
+    entry sets the search_path of the tenant's connections, so the same table names resolve to that schema.
+    """
+    routes = json.loads(value) if value else {}
+    if not isinstance(routes, dict):
+        raise ValueError(f"ORIGIN_ROUTES must be a JSON object, got {value!r}")
+    return {str(origin): dict(overrides) for origin, overrides in routes.items()}
+
+
+ORIGIN_ROUTES = load_routes(os.getenv('ORIGIN_ROUTES'))
+
+
+class OriginRouter:
+    """
+    Routes processed records to a database connection, or a schema, per `origin`, the tenant a record came from.
+
+    Origins without a route use the default connection. Every distinct connection gets its own pool
+    (`common.db.get_pool`), so `write` can write the records of each origin through its own connections in parallel
+    and one large feed does not hold back the others.
+    """
+
+    def __init__(self, connection_dict, routes=None, max_workers=ORIGIN_ROUTING_WORKERS):
+        self.connection_dict = connection_dict
+        self.routes = ORIGIN_ROUTES if routes is None else {str(origin): route for origin, route in routes.items()}
+        self.max_workers = max_workers
+
+    def connection_dict_for(self, origin):
+        """
+        psycopg2 connection parameters for the records of `origin`.
+        """
+        overrides = dict(self.routes.get(str(origin), {}))
+        schema = overrides.pop('schema', None)
+        if schema:
+            overrides['options'] = f"-c search_path={schema}"
+        return dict(self.connection_dict, **overrides)
+
+    def group_by_connection(self, origins):
+        """
+        Group origins that share a connection, e.g. the origins without a route.
+
+        :return: list of (connection_dict, origins), in the order of the first origin of each connection
+        """
+        groups = {}
+        for origin in origins:
+            connection_dict = self.connection_dict_for(origin)
+            key = tuple(sorted(connection_dict.items()))
+            groups.setdefault(key, (connection_dict, []))[1].append(origin)
+        return list(groups.values())
+
+    def connection_dicts(self):
+        """
+        The distinct connection parameters of the default connection and every route, e.g. to create the partitions
+        of the history tables in each of them.
+        """
+        return [connection_dict for connection_dict, _ in self.group_by_connection([None, *self.routes])]
+
+    @staticmethod
+    def partition(records, directory=None):
+        """
+        Split `records` by origin into spill files, keeping the file order within each origin.
+
+        :return: dict of origin to SpillFile, in the order of the first record of each origin; close them when done
+        """
+        partitions = {}
+        try:
+            for record in records:
+                origin = record.get('origin')
+                if origin not in partitions:
+                    partitions[origin] = SpillFile(directory)
+                partitions[origin].append(record)
+        except BaseException:
+            for partition in partitions.values():
+                partition.close()
+            raise
+        return partitions
+
+    def write(self, records, write_partition):
+        """
+        Partition `records` by origin and write the partitions in parallel, each through the connection of its origin.
+        A partition that fails does not stop the others; the first error is raised once all of them are done.
+
+        :param records: iterable of processed records with an `origin`
+        :param write_partition: `write_partition(records, connection_dict)` writing the records of one origin,
+                                e.g. `upsert_claims`
+        :return: a TenantStats per origin
+        """
+        partitions = self.partition(records)
+        try:
+            with ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix='origin') as executor:
+                futures = {origin: executor.submit(self._write_partition, origin, partition, write_partition)
+                           for origin, partition in partitions.items()}
+            errors = [future.exception() for future in futures.values() if future.exception() is not None]
+            if errors:
+                raise errors[0]
+            return [future.result() for future in futures.values()]
+        finally:
+            for partition in partitions.values():
+                partition.close()
+
+    def _write_partition(self, origin, records, write_partition):
+        started = time.perf_counter()
+        try:
+            write_partition(records, self.connection_dict_for(origin))
+        except Exception as e:
+            LOG.error(f"Writing {len(records)} rows of origin {origin} failed: {e}")
+            raise
+        seconds = time.perf_counter() - started
+        stats = TenantStats(origin, len(records), seconds, len(records) / seconds if seconds else 0.0)
+        LOG.info(f"Wrote {stats.rows} rows of origin {origin} in {stats.seconds:.2f}s "
+                 f"({stats.rows_per_second:.0f} rows/s)")
+        return stats
@@ -0,0 +1,75 @@
+import keyword
+from collections.abc import Mapping
+
+
+class Row(Mapping):
+    """
+    Base class of compact processed rows: one `__slots__` attribute per column instead of a dict per row, so a row
+    costs a fixed-size object and the column names are stored once per class.
+
+    Rows are mappings, so writers read them like dicts (`row['claim_id']`, `row.get('origin')`, `dict(row)`,
+    `**row`) and compare equal to a dict with the same items. Like other mappings, they do not support item
+    assignment.
+    Create row classes with `make_row_class`.
+    """
+    __slots__ = ()
+    _fields = ()
+    _field_set = frozenset()
+
+    def __init__(self, *values):
+        if len(values) != len(self._fields):
+            raise TypeError(f"{type(self).__name__} takes {len(self._fields)} values, got {len(values)}")
+        for field, value in zip(self._fields, values):
+            setattr(self, field, value)
+
+    def __getitem__(self, key):
+        if key in self._field_set:
+            return getattr(self, key)
+        raise KeyError(key)
+
+    def get(self, key, default=None):
+        return getattr(self, key) if key in self._field_set else default
+
+    def __contains__(self, key):
+        return key in self._field_set
+
+    def __iter__(self):
+        return iter(self._fields)
+
+    def __len__(self):
+        return len(self._fields)
+
+    def __reduce__(self):
+        return type(self), tuple(getattr(self, field) for field in self._fields)
+
+    def __repr__(self):
+        return f"{type(self).__name__}({', '.join(f'{field}={getattr(self, field)!r}' for field in self._fields)})"
+
+    def as_dict(self):
+        return {field: getattr(self, field) for field in self._fields}
+
+
+def make_row_class(name, fields, module):
+    """
+    Create a Row subclass with the columns `fields`, constructed with their values in that order.
+
+    The class must be bound to `name` in `module`, e.g. `__name__` of the defining module, for rows to be pickled,
+    e.g. when they are returned by the worker processes of `process_ndjson_parallel`.
+    """
+    fields = tuple(fields)
+    invalid = [field for field in fields
+               if not field.isidentifier() or keyword.iskeyword(field) or field.startswith('_')]
+    if invalid:
+        raise ValueError(f"Row columns must be identifiers that are not keywords and do not start with an underscore: "
+                         f"{invalid}")
+    return type(name, (Row,), {'__slots__': fields, '_fields': fields, '_field_set': frozenset(fields),
+                               '__module__': module})
+
+
+def row_to_json(value):
+    """
+    `default` hook of `json.dumps` serializing rows as objects, e.g. `json.dumps(row, default=row_to_json)`.
+    """
+    if isinstance(value, Row):
+        return value.as_dict()
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
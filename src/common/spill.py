@@ -0,0 +1,62 @@
+import json
+import os
+import tempfile
+
+from common.rows import Row
+
+
+class SpillFile:
+    """
+    Append-only, re-iterable store of processed rows backed by a temporary NDJSON file.
+
+    Keeps memory flat for files of any size: rows are written out as they are processed and read back lazily,
+    so the threshold checks and the writers can each make their own pass over the output.
+    Compact rows (`common.rows.Row`) are stored as the list of their values and read back as rows of the same class,
+    so the writers and deduplication get compact rows too; other rows are stored and read back as dicts.
+    """
+
+    def __init__(self, directory=None):
+        fd, self.path = tempfile.mkstemp(prefix='fhir-spill-', suffix='.ndjson',
+                                         dir=directory or os.getenv('SPILL_DIR')
+                                         )
+        self._file = os.fdopen(fd, 'w')
+        self._rows = 0
+        self._row_class = None
+
+    def append(self, row):
+        if isinstance(row, Row):
+            if self._row_class is None:
+                self._row_class = type(row)
+            elif type(row) is not self._row_class:
+                raise TypeError(f"Cannot spill a {type(row).__name__} with {self._row_class.__name__} rows")
+            self._file.write(json.dumps([getattr(row, field) for field in row._fields]))
+        else:
+            self._file.write(json.dumps(row))
+        self._file.write('\n')
+        self._rows += 1
+
+    def extend(self, rows):
+        for row in rows:
+            self.append(row)
+
+    def __len__(self):
+        return self._rows
+
+    def __iter__(self):
+        self._file.flush()
+        with open(self.path, 'r') as file:
+            for line in file:
+                row = json.loads(line)
+                yield self._row_class(*row) if isinstance(row, list) else row
+
+    def close(self):
+        if not self._file.closed:
+            self._file.close()
+        if os.path.exists(self.path):
+            os.remove(self.path)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
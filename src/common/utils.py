@@ -1,13 +1,81 @@
+import hashlib
+import json
 import logging.config
 
 import os
 import time
 from datetime import datetime, timezone
+import random
+from itertools import islice
 
 
 def set_timestamp_to_now() -> str:
     return datetime.now(timezone.utc).isoformat()
 
+
+def chunked(iterable, size):
+    """
+    Yield successive lists of at most `size` items from `iterable`.
+    """
+    iterator = iter(iterable)
+    while True:
+        chunk = list(islice(iterator, size))
+        if not chunk:
+            return
+        yield chunk
+
+
+def chunked_by_key(iterable, size, key):
+    """
+    Like `chunked`, without splitting runs of consecutive items with the same `key(item)` across chunks.
+    A run longer than `size` makes a chunk of its own.
+    """
+    chunk, run, run_key = [], [], None
+    for item in iterable:
+        item_key = key(item)
+        if run and item_key != run_key:
+            if chunk and len(chunk) + len(run) > size:
+                yield chunk
+                chunk = []
+            chunk.extend(run)
+            run = []
+            if len(chunk) >= size:
+                yield chunk
+                chunk = []
+        run_key = item_key
+        run.append(item)
+    if chunk and len(chunk) + len(run) > size:
+        yield chunk
+        chunk = []
+    chunk.extend(run)
+    if chunk:
+        yield chunk
+
+
+def reservoir_sample(iterable, size, rng=random):
+    """
+    Uniformly sample at most `size` items from an iterable of unknown length in a single pass.
+    """
+    sample = []
+    for seen, item in enumerate(iterable):
+        if seen < size:
+            sample.append(item)
+        else:
+            slot = rng.randint(0, seen)
+            if slot < size:
+                sample[slot] = item
+    return sample
+
+
+def fingerprint(values):
+    """
+    Returns a 32 character hex digest of a sequence of JSON serializable values (dates and decimals are hashed by their
+    string form), used to detect records whose content has not changed.
+    """
+    encoded = json.dumps(list(values), separators=(',', ':'), default=str).encode()
+    return hashlib.blake2b(encoded, digest_size=16).hexdigest()
+
+
 # Create a Formatter class that logs timestamps as UTC
 # time.gmtime is a function that converts a time expressed in seconds since the epoch to a struct_time in UTC
 class UTCFormatter(logging.Formatter):
@@ -1,21 +1,105 @@
-import json, re
+import json, logging, re
 from datetime import datetime
+from functools import lru_cache
 from typing import Dict, Any
-from common.utils import TransformerLogger
+from common import metrics
+from common.utils import TransformerLogger, chunked
+from field_mappers.columnar import invalid_date_mask, invalid_pattern_mask
+from field_mappers.threshold import ThresholdEvaluator
+from field_mappers.warning_collector import WarningCollector
 
 LOG = TransformerLogger(__name__)
 
-ISO8601_MATCH = match_iso8601 = re.compile(
+ISO8601_PATTERN = re.compile(
         r'^(-?(?:[1-9][0-9]*)?[0-9]{4})-(1[0-2]|0[1-9])-(3[01]|0[1-9]|[12][0-9])T'
         r'(2[0-3]|[01][0-9]):([0-5][0-9]):([0-5][0-9])(\.[0-9]+)?'
         r'(Z|[+-](?:2[0-3]|[01][0-9]):?[0-5][0-9])?$'
-).match
+)
+ISO8601_MATCH = match_iso8601 = ISO8601_PATTERN.match
+
+INVALID_DATE_MESSAGE = "Values in column '{key}' is not valid date string, should be YYYY-MM-DD"
+INVALID_DATETIME_MESSAGE = "Values in column '{key}' is not valid ISO8601 string"
 
 
 class ValidationError(Exception):
     pass
 
 
+def is_valid_date_string(value):
+    """
+    Returns True if the value is a date string in the %Y-%m-%d format.
+    """
+    try:
+        if len(value) != 10:
+            return False
+        datetime.strptime(value, '%Y-%m-%d')
+        return True
+    except (TypeError, ValueError):
+        return False
+
+
+def is_valid_datetime_string(value):
+    """
+    Returns True if the value is an ISO8601 string.
+    """
+    # noinspection PyBroadException
+    try:
+        return ISO8601_MATCH(value) is not None
+    except:
+        return False
+
+
+_split_json_path = re.compile(r'\.|\[|\]').split
+
+
+def _as_index(key):
+    try:
+        return int(key)
+    except ValueError:
+        return None
+
+
+@lru_cache(maxsize=1024)
+def compile_json_path(json_path):
+    """Compiles a JSON path into an accessor function, so the path is parsed only once.
+
+    Args:
+      json_path: A string representing the JSON path, e.g. "diagnosis[0].diagnosisCodeableConcept.coding[0].code".
+
+    Returns:
+      A function taking a dictionary or list and returning the value at the JSON path, or None if the path does
+      not exist. See `get_value_at_json_path`.
+    """
+    # Split the JSON path into parts, handling both dots and square brackets, and resolve list indexes up front.
+    keys = tuple((key, _as_index(key)) for key in _split_json_path(json_path) if key)
+
+    def accessor(json_data):
+        # Iterate over the keys, getting the value at each key or index from the JSON data.
+        for key, index in keys:
+            if isinstance(json_data, list):
+                # If the key is not an integer or the index is out of range, return None.
+                if index is None:
+                    return None
+                try:
+                    json_data = json_data[index]
+                except IndexError:
+                    return None
+            elif isinstance(json_data, dict):
+                # If the JSON data is a dictionary, get the value at the given key.
+                if key not in json_data:
+                    return None
+                json_data = json_data[key]
+            else:
+                # If the JSON data is not a list or dictionary, return None.
+                return None
+
+        # Return the value at the given JSON path.
+        return json_data
+
+    accessor.json_path = json_path
+    return accessor
+
+
 def get_value_at_json_path(json_data, json_path):
     """Returns the value at the given JSON path within the given JSON data.
 
@@ -26,39 +110,17 @@ def get_value_at_json_path(json_data, json_path):
     Returns:
       The value at the given JSON path, or None if the path does not exist.
     """
-    import re
-
-    # Split the JSON path into parts, handling both dots and square brackets.
-    keys = re.split(r'\.|\[|\]', json_path)
-    keys = [key for key in keys if key]  # Remove empty strings from the list
-
-    # Iterate over the keys, getting the value at each key or index from the JSON data.
-    for key in keys:
-        if isinstance(json_data, list):
-            try:
-                # Convert the key to an integer index and get the value from the list.
-                index = int(key)
-                json_data = json_data[index]
-            except ValueError:
-                # If the key is not an integer, return None.
-                return None
-            except IndexError:
-                # If the index is out of range, return None.
-                return None
-        elif isinstance(json_data, dict):
-            # If the JSON data is a dictionary, get the value at the given key.
-            if key not in json_data:
-                return None
-            json_data = json_data[key]
-        else:
-            # If the JSON data is not a list or dictionary, return None.
-            return None
-
-    # Return the value at the given JSON path.
-    return json_data
+    return compile_json_path(json_path)(json_data)
 
 
 class FHIRResourceProcessor:
+    # declarative validation and mapping of the resource type, see field_mappers.spec.ResourceSpec
+    spec = None
+    # set by `start_threshold_evaluation` to reject a file while it is being processed
+    threshold_evaluator = None
+    # rows of the current batch with date warnings, see `process_batch`
+    _batch_warned_rows = frozenset()
+
     def __init__(self, ingest_ts):
         """
         Initialize the processor with FHIR claims data.
@@ -72,18 +134,53 @@ class FHIRResourceProcessor:
         self.row_num = 0
         self.total_warnings = 0
         self.total_rows_processed = 0
-        self.date_fields = []
-        self.datetime_fields = []
-        self.required_fields = []
+        self.rows_with_warnings = 0
+        # counts every issue, but only logs the first occurrences of each
+        self.warnings = WarningCollector(LOG)
+        self.date_fields = list(self.spec.date_fields) if self.spec else []
+        self.datetime_fields = list(self.spec.datetime_fields) if self.spec else []
+        self.required_fields = list(self.spec.required_fields) if self.spec else []
+        # set while processing a batch whose dates were already validated column by column
+        self.dates_validated = False
 
     def validate_dates(self):
         """
         Validate date fields
         """
+        if self.dates_validated:
+            return
+        for field in self.date_fields:
+            if not self.validate_date_string(self.data, field):
+                self.log_warning(INVALID_DATE_MESSAGE.format(key=field), 'invalid_date', field)
+        for field in self.datetime_fields:
+            if not self.validate_datetime_string(self.data, field):
+                self.log_warning(INVALID_DATETIME_MESSAGE.format(key=field), 'invalid_datetime', field)
+
+    def validate_dates_batch(self, records, first_row=0):
+        """
+        Validate the date fields of a chunk of records column by column instead of record by record.
+        Warnings are logged and counted for each invalid value with its row number, as in `validate_dates`.
+        Returns the set of row numbers with at least one invalid value.
+        """
+        warned_rows = set()
         for field in self.date_fields:
-            self.validate_date_string(self.data, field)
+            column = list(map(compile_json_path(field), records))
+            warned_rows.update(self._log_invalid_rows(invalid_date_mask(column, is_valid_date_string), first_row,
+                                                      INVALID_DATE_MESSAGE.format(key=field), 'invalid_date', field
+                                                      ))
         for field in self.datetime_fields:
-            self.validate_datetime_string(self.data, field)
+            column = list(map(compile_json_path(field), records))
+            warned_rows.update(self._log_invalid_rows(invalid_pattern_mask(column, ISO8601_PATTERN), first_row,
+                                                      INVALID_DATETIME_MESSAGE.format(key=field), 'invalid_datetime',
+                                                      field
+                                                      ))
+        return warned_rows
+
+    def _log_invalid_rows(self, invalid, first_row, msg, rule, field):
+        row_nums = (invalid.nonzero()[0] + first_row).tolist()
+        self.total_warnings += len(row_nums)
+        self.warnings.add_many(rule, field, row_nums, msg)
+        return row_nums
 
     def _nested_field_dne(self, field):
         """
@@ -101,57 +198,89 @@ class FHIRResourceProcessor:
         """
         for field in self.required_fields:
             if field not in self.data or self._nested_field_dne(field):
-                self.log_warning(f"Missing required field: {field}")
+                self.log_warning(f"Missing required field: {field}", 'missing_required_field', field)
 
         self.validate_dates()
+        if self.spec is not None and self.spec.check_resource_type:
+            resource_type = self.data.get("resourceType")
+            if resource_type is not None and resource_type.lower() != self.spec.resource_type.lower():
+                self.log_warning("Wrong resource type", 'wrong_resource_type', 'resourceType')
 
-    def log_warning(self, msg):
+    def log_warning(self, msg, rule=None, field=None):
+        """
+        Count a warning for the current row; only the first occurrences of each (rule, field) are logged right
+        away, see `log_warning_summary`.
+        """
         self.total_warnings += 1
-        LOG.warning(f"{msg} at row {self.row_num}")
+        self.warnings.add(rule or msg, field, self.row_num, msg)
+
+    def log_info(self, msg, rule=None, field=None):
+        """
+        Record an informational issue for the current row, it is not counted towards the warning threshold.
+        """
+        self.warnings.add(rule or msg, field, self.row_num, msg, logging.INFO)
+
+    def log_warning_summary(self, source=None):
+        """
+        Log the counts and sample rows of every issue seen so far in a single record.
+        """
+        self.warnings.log_summary(self.total_rows_processed, source)
 
     def total_warnings_below_threshold(self, threshold):
+        if self.threshold_evaluator is not None and self.threshold_evaluator.rejected:
+            return False
         return (self.total_warnings / self.total_rows_processed) < (threshold / 100.0)
+
+    def start_threshold_evaluation(self, threshold, total_rows=None, **kwargs):
+        """
+        Evaluate the warning threshold while records are processed, so `process_many` stops as soon as the file can
+        no longer pass and `total_warnings_below_threshold` returns False. See `ThresholdEvaluator` for the rules.
+
+        :param threshold: maximum percentage of warnings per row, as for `total_warnings_below_threshold`
+        :param total_rows: number of records in the file, if known
+        :return: the ThresholdEvaluator, with the decision and the rows consumed
+        """
+        self.threshold_evaluator = ThresholdEvaluator(threshold, total_rows, **kwargs)
+        return self.threshold_evaluator
+
+    def threshold_exceeded(self):
+        """
+        Re-evaluate the warning threshold with the current counters, True once the file is rejected.
+        """
+        if self.threshold_evaluator is None:
+            return False
+        return self.threshold_evaluator.update(self.total_warnings, self.rows_with_warnings,
+                                               self.total_rows_processed)
     @staticmethod
     def validate_date_string(record: Dict[str, Any], key: str):
         """
         Validate date string format (%Y-%m-%d).
+        Returns False if the value at `key` is set and is not a valid date.
         """
-        if not get_value_at_json_path(record, key):
-            return
-        try:
-            date_string = get_value_at_json_path(record, key)
-            if len(date_string) != 10:
-                raise ValueError()
-
-            datetime.strptime(date_string, '%Y-%m-%d')
-
-        except ValueError:
-            LOG.warning(
-                    "Values in column '{key}' is not valid date string, should be YYYY-MM-DD".format(key=key)
-            )
+        date_string = get_value_at_json_path(record, key)
+        return not date_string or is_valid_date_string(date_string)
 
     @staticmethod
     def validate_datetime_string(record: Dict[str, Any], key: str):
         """
         Validate date string format (ISO8601).
+        Returns False if the value at `key` is set and is not a valid ISO8601 string.
         """
-        if not get_value_at_json_path(record, key):
-            return
-        # noinspection PyBroadException
-        try:
-            if ISO8601_MATCH(get_value_at_json_path(record, key)) is not None:
-                return True
-        except:
-            pass
-        LOG.warning("Values in column '{key}' is not valid ISO8601 string".format(key=key))
+        datetime_string = get_value_at_json_path(record, key)
+        return not datetime_string or is_valid_datetime_string(datetime_string)
 
     def map_values(self):
         """
         Map values in the data to standardized formats or codes as needed.
 
         This can include mapping diagnosis codes, normalizing provider identifiers, etc.
+        Processors with a `spec` map the record to the columns of their table in one pass.
         """
-        pass
+        if self.spec is not None:
+            self.data = self.spec.map_record(self.data, self.origin, self._log_missing_value)
+
+    def _log_missing_value(self, dest, source):
+        self.log_info(f"Missing value for {dest} at {source}", 'missing_value', dest)
 
     def normalize(self):
         """
@@ -174,8 +303,53 @@ class FHIRResourceProcessor:
         """
         self.data = data
         self.row_num = row_num
-        self.validate()
-        self.map_values()
-        self.normalize()
+        warnings_before = self.total_warnings
+        run = metrics.current()
+        if run.enabled:
+            with run.timer('validate'):
+                self.validate()
+            with run.timer('map_values'):
+                self.map_values()
+            with run.timer('normalize'):
+                self.normalize()
+        else:
+            # keep the per-record path free of timer calls when metrics are off
+            self.validate()
+            self.map_values()
+            self.normalize()
         self.total_rows_processed += 1
+        if self.total_warnings > warnings_before or row_num in self._batch_warned_rows:
+            self.rows_with_warnings += 1
+        self.warnings.row_processed(self.total_rows_processed)
         return self.data
+
+    def process_batch(self, records, first_row=0):
+        """
+        Process a chunk of records, validating their date fields in one vectorized pass.
+        """
+        with metrics.timer('validate_dates_batch'):
+            self._batch_warned_rows = self.validate_dates_batch(records, first_row)
+        self.dates_validated = True
+        try:
+            return [self.process(record, row_num) for row_num, record in enumerate(records, first_row)]
+        finally:
+            self.dates_validated = False
+            self._batch_warned_rows = frozenset()
+
+    def process_many(self, records, start_row=0, batch_size=None):
+        """
+        Lazily process an iterable of records, numbering rows from `start_row`.
+        With a `batch_size`, records are processed in chunks of that size with `process_batch`.
+        Stops early, after the current record or chunk, once `threshold_exceeded` rejects the file.
+        """
+        if not batch_size:
+            for row_num, record in enumerate(records, start_row):
+                yield self.process(record, row_num)
+                if self.threshold_exceeded():
+                    return
+            return
+        for chunk in chunked(records, batch_size):
+            yield from self.process_batch(chunk, start_row)
+            start_row += len(chunk)
+            if self.threshold_exceeded():
+                return
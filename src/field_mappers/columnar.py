@@ -0,0 +1,92 @@
+import re
+from functools import lru_cache
+
+import numpy as np
+
+_DAYS_IN_MONTH = np.array([31, 28, 31, 30, 31, 30, 31, 31, 30, 31, 30, 31])
+_DIGITS = [0, 1, 2, 3, 5, 6, 9]
+_DASHES = [4, 7]
+_SPACE, _DASH, _ZERO = ord(' '), ord('-'), ord('0')
+
+
+def invalid_date_mask(values, is_valid_date):
+    """
+    Vectorized check of a column of YYYY-MM-DD date strings.
+
+    Matches `datetime.strptime(value, '%Y-%m-%d')` for 10 character strings: the ASCII values are checked on an
+    array of their code points in one pass, anything else (non-string values, other lengths, non-ASCII digits)
+    is checked with `is_valid_date`.
+
+    :param values: sequence of values, empty values (None, '') are not checked
+    :param is_valid_date: per-value fallback returning True for a valid date
+    :return: numpy boolean array, True where the value is present and not a valid date
+    """
+    invalid = np.zeros(len(values), dtype=bool)
+    rows, dates = [], []
+    for row, value in enumerate(values):
+        if not value:
+            continue
+        if type(value) is str and len(value) == 10 and value.isascii():
+            rows.append(row)
+            dates.append(value)
+        else:
+            invalid[row] = not is_valid_date(value)
+    if not rows:
+        return invalid
+
+    codes = np.array(dates, dtype='U10').view(np.uint32).reshape(-1, 10).astype(np.int64)
+    digits = codes - _ZERO
+    is_digit = (digits >= 0) & (digits <= 9)
+    # strptime also accepts a space-padded day, e.g. "2020-01- 1"
+    space_padded_day = codes[:, 8] == _SPACE
+    well_formed = (is_digit[:, _DIGITS].all(axis=1) & (is_digit[:, 8] | space_padded_day)
+                   & (codes[:, _DASHES] == _DASH).all(axis=1))
+
+    year = digits[:, 0] * 1000 + digits[:, 1] * 100 + digits[:, 2] * 10 + digits[:, 3]
+    month = digits[:, 5] * 10 + digits[:, 6]
+    day = np.where(space_padded_day, 0, digits[:, 8]) * 10 + digits[:, 9]
+    leap_year = (year % 4 == 0) & ((year % 100 != 0) | (year % 400 == 0))
+    days_in_month = _DAYS_IN_MONTH[np.clip(month - 1, 0, 11)] + ((month == 2) & leap_year)
+    valid = well_formed & (year >= 1) & (month >= 1) & (month <= 12) & (day >= 1) & (day <= days_in_month)
+    invalid[rows] = ~valid
+    return invalid
+
+
+@lru_cache(maxsize=None)
+def _multiline(pattern):
+    return re.compile(pattern.pattern, pattern.flags | re.MULTILINE)
+
+
+def invalid_pattern_mask(values, pattern):
+    """
+    Vectorized check of a column of strings against an anchored (^...$) regex such as ISO8601_MATCH's.
+
+    The strings are joined with newlines and scanned with a single MULTILINE search, instead of calling the regex
+    once per value. Non-string values are invalid; strings containing a newline are checked one by one, so the
+    result is the same as `pattern.match(value) is not None`.
+
+    :param values: sequence of values, empty values (None, '') are not checked
+    :param pattern: compiled regex anchored with ^ and $
+    :return: numpy boolean array, True where the value is present and does not match
+    """
+    invalid = np.zeros(len(values), dtype=bool)
+    rows, strings = [], []
+    for row, value in enumerate(values):
+        if not value:
+            continue
+        if type(value) is not str:
+            invalid[row] = True
+        elif '\n' in value:
+            invalid[row] = pattern.match(value) is None
+        else:
+            rows.append(row)
+            strings.append(value)
+    if not rows:
+        return invalid
+
+    line_starts = np.zeros(len(strings), dtype=np.int64)
+    np.cumsum([len(string) + 1 for string in strings[:-1]], out=line_starts[1:])
+    match_starts = np.fromiter((match.start() for match in _multiline(pattern).finditer('\n'.join(strings))),
+                               dtype=np.int64)
+    invalid[rows] = ~np.isin(line_starts, match_starts)
+    return invalid
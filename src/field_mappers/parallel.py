@@ -0,0 +1,72 @@
+import math
+import os
+from multiprocessing import Pool
+
+from common import metrics
+from common.utils import TransformerLogger
+from readers.ndjson import iter_ndjson
+from readers.offset_index import IndexedNDJSON
+
+LOG = TransformerLogger(__name__)
+
+DEFAULT_SHARD_SIZE = 32 * 1024 * 1024
+
+
+def _process_shard(args):
+    """
+    Process one byte range of the file with a fresh processor, numbering rows from the shard's first row.
+    The timers and counters of the shard are recorded separately and returned, to be merged into the parent's run.
+    """
+    processor_cls, ingest_ts, origin, ndjson_path, start, end, first_row, batch_size, collect_metrics = args
+    processor = processor_cls(ingest_ts)
+    processor.origin = origin
+    with metrics.collected(collect_metrics) as shard_metrics:
+        rows = list(processor.process_many(iter_ndjson(ndjson_path, start, end), first_row, batch_size))
+    return rows, processor.total_warnings, processor.rows_with_warnings, processor.total_rows_processed, \
+        processor.warnings, shard_metrics.snapshot()
+
+
+def process_ndjson_parallel(processor, ndjson_path, workers=None, shard_size=DEFAULT_SHARD_SIZE, batch_size=None):
+    """
+    Process an NDJSON file with a pool of worker processes, one row-aligned byte range (shard) at a time, split with
+    the file's offset index (`readers.offset_index`).
+
+    Each shard is processed by a fresh instance of the processor's class, with the same ingest_ts and origin.
+    Processed rows are yielded in file order, and the warning and row counters of each shard are added to
+    `processor` as the shards complete, so the threshold checks work as in the sequential mode once the
+    generator is exhausted. The timers and counters the shards record are merged into the current metrics run. With a threshold evaluation started on `processor`, it is re-evaluated after every
+    shard and the remaining shards are cancelled once the file is rejected.
+
+    Parameters:
+    - processor: a FHIRResourceProcessor instance used as the template for the workers and to collect counters.
+    - ndjson_path: Path to the NDJSON file containing FHIR data.
+    - workers: number of worker processes, defaults to the number of CPUs.
+    - shard_size: approximate number of bytes per shard; smaller shards balance better and bound worker memory.
+    - batch_size: if set, workers validate dates in vectorized batches of this size, see `process_many`.
+    """
+    workers = workers or os.cpu_count()
+    shards = max(workers, math.ceil(os.path.getsize(ndjson_path) / shard_size))
+    # the offset index splits the file exactly on row boundaries and gives the first row of every shard, so rows are
+    # numbered across the whole file and the warnings of every shard point at the right row
+    with IndexedNDJSON(ndjson_path) as ndjson:
+        ranges = ndjson.shard_ranges(shards)
+        total_rows = len(ndjson)
+    with Pool(workers) as pool:
+        LOG.info(f"Processing {total_rows} rows of {ndjson_path} in {len(ranges)} shards with {workers} workers")
+        if processor.threshold_evaluator is not None and processor.threshold_evaluator.total_rows is None:
+            processor.threshold_evaluator.total_rows = total_rows
+        run = metrics.current()
+        tasks = [(type(processor), processor.ingest_ts, processor.origin, ndjson_path, start, end, first_row,
+                  batch_size, run.enabled) for start, end, first_row in ranges]
+        # imap returns the shards in submission order, so the output keeps the order of the file
+        for rows, total_warnings, rows_with_warnings, total_rows_processed, warnings, (timers, counters) in \
+                pool.imap(_process_shard, tasks):
+            processor.total_warnings += total_warnings
+            processor.rows_with_warnings += rows_with_warnings
+            processor.total_rows_processed += total_rows_processed
+            processor.warnings.merge(warnings)
+            run.merge(timers, counters)
+            yield from rows
+            if processor.threshold_exceeded():
+                # leaving the pool's context terminates the shards still running
+                return
@@ -1,40 +1,32 @@
 import json
-from field_mappers.base import FHIRResourceProcessor, get_value_at_json_path
+from field_mappers.base import FHIRResourceProcessor
+from field_mappers.spec import Field, ResourceSpec
 from common.utils import TransformerLogger
 from normalizers.enum_normalizer import GenderNormalizer
 
 LOG = TransformerLogger(__name__)
 
+# maps structured zone columns to JSON paths in the Patient resource
+# Note: due to time constraints not all fields are included
+PATIENT_SPEC = ResourceSpec(
+        'Patient',
+        [
+                Field("first_name", "name[0].given[0]"),
+                Field("last_name", "name[0].family"),
+                Field("patient_id", "id"),
+        ],
+        required=["name", "id"],
+        date_fields=["birthDate"],
+        datetime_fields=["meta.lastUpdated"],
+        row_name='PatientRow',
+        module=__name__,
+)
+PatientRow = PATIENT_SPEC.row_class
 
 
 class FHIRPatientProcessor(FHIRResourceProcessor):
-    def __init__(self, *args, **kwargs):
-        super().__init__(*args, **kwargs)
-        self.date_fields = ["birthDate"]
-        self.datetime_fields = ["meta.lastUpdated"]
-        self.required_fields = [
-                "name",
-                "id"
-        ]
-
-
-    def map_values(self):
-        """
-        Maps to structured zone table
-        Note: due to time constraints not all fields are included
-        """
-        mapping = {
-                "first_name": "name[0].given[0]",
-                "last_name": "name[0].family",
-                "patient_id": "id"
-        }
-        instance_dict = {
-                'origin': self.origin,
-        }
-        for dest, source in mapping.items():
-            instance_dict[dest] = get_value_at_json_path(self.data, source)
-        self.data = instance_dict
-
+    spec = PATIENT_SPEC
+    mapping = PATIENT_SPEC.mapping
 
     def normalize(self):
         pass
@@ -0,0 +1,127 @@
+from common.rows import make_row_class
+from field_mappers.base import compile_json_path
+
+DATE = 'date'
+DATETIME = 'datetime'
+
+
+def equals_ignore_case(expected):
+    """
+    Predicate for `Field.when`: the value is a string equal to `expected`, ignoring case.
+    """
+    expected = expected.lower()
+    return lambda value: isinstance(value, str) and value.lower() == expected
+
+
+class Field:
+    """
+    One column of a structured zone table and where its value comes from.
+
+    Parameters:
+    - dest: column name in the structured zone.
+    - source: JSON path of the value in the FHIR resource.
+    - type: DATE or DATETIME to validate the value's format, None for no format check.
+    - required: warn when the source path is missing.
+    - normalizer: function applied to values that are not None, e.g. `str.upper`.
+    - when: optional (json_path, predicate) pair; the value is only kept when `predicate` holds for the value at
+      `json_path`, otherwise the column is None and a 'missing_value' issue is recorded at INFO level.
+    """
+    __slots__ = ('dest', 'source', 'type', 'required', 'normalizer', 'when')
+
+    def __init__(self, dest, source, type=None, required=False, normalizer=None, when=None):
+        if type not in (None, DATE, DATETIME):
+            raise ValueError(f"Unknown field type {type!r} for {dest}")
+        self.dest = dest
+        self.source = source
+        self.type = type
+        self.required = required
+        self.normalizer = normalizer
+        self.when = when
+
+
+class ResourceSpec:
+    """
+    Declarative description of how a FHIR resource type is validated and mapped to its structured zone table.
+
+    The fields are compiled once into `map_record(data, origin, on_missing)`, which maps a resource with precompiled
+    accessors and calls `on_missing(dest, source)` for values dropped by a `when` rule. A processor for
+    a new resource type only needs a spec:
+
+        class FHIRCoverageProcessor(FHIRResourceProcessor):
+            spec = ResourceSpec('Coverage', [Field('coverage_id', 'id', required=True), ...])
+
+    Parameters:
+    - resource_type: FHIR resource type, e.g. 'Claim'.
+    - fields: list of Field, in column order.
+    - required: additional paths that must be present, checked before the required fields, in this order.
+    - date_fields, datetime_fields: additional paths validated as dates and datetimes, e.g. unmapped ones.
+    - check_resource_type: warn when the `resourceType` of a record is not `resource_type`.
+    - row_name: name of a compact row class (`common.rows.Row`) to map records to instead of dicts, available as
+      `row_class`.
+    - module: name of the module the row class is bound to `row_name` in, usually `__name__`, so rows can be pickled.
+    """
+
+    def __init__(self, resource_type, fields, required=(), date_fields=(), datetime_fields=(),
+                 check_resource_type=False, row_name=None, module=None):
+        self.resource_type = resource_type
+        self.fields = tuple(fields)
+        self.check_resource_type = check_resource_type
+        self.row_class = None
+        if row_name:
+            if not module:
+                raise ValueError(f"The {resource_type} spec needs the module its row class {row_name} is bound in")
+            self.row_class = make_row_class(row_name, self.columns, module)
+        self.required_fields = tuple(required) + tuple(f.source for f in self.fields if f.required)
+        self.date_fields = tuple(date_fields) + tuple(f.source for f in self.fields if f.type == DATE)
+        self.datetime_fields = tuple(datetime_fields) + tuple(f.source for f in self.fields if f.type == DATETIME)
+        self.map_record = self._compile()
+
+    @property
+    def columns(self):
+        """
+        Columns of the mapped rows, starting with `origin`.
+        """
+        return ('origin',) + tuple(f.dest for f in self.fields)
+
+    @property
+    def mapping(self):
+        """
+        Column name to source path, for each field.
+        """
+        return {f.dest: f.source for f in self.fields}
+
+    def _compile(self):
+        """
+        Build `map_record` as a closure over one precompiled accessor per field, with the normalizers folded into the
+        accessors of their fields, so mapping a record reads every value with one call and builds the row at once.
+        """
+        getters = [self._field_getter(f) for f in self.fields]
+        conditions = [(i, compile_json_path(f.when[0]), f.when[1], f.dest, f.source)
+                      for i, f in enumerate(self.fields) if f.when is not None]
+        row_class = self.row_class
+        columns = self.columns
+
+        def map_record(data, origin, on_missing):
+            values = [get(data) for get in getters]
+            for i, get_condition, predicate, dest, source in conditions:
+                if not predicate(get_condition(data)):
+                    on_missing(dest, source)
+                    values[i] = None
+            if row_class is not None:
+                return row_class(origin, *values)
+            return dict(zip(columns, [origin, *values]))
+
+        return map_record
+
+    @staticmethod
+    def _field_getter(field):
+        get = compile_json_path(field.source)
+        normalize = field.normalizer
+        if normalize is None:
+            return get
+
+        def get_normalized(data):
+            value = get(data)
+            return value if value is None else normalize(value)
+
+        return get_normalized
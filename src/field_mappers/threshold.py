@@ -0,0 +1,66 @@
+import math
+import os
+
+# rows processed before the confidence bound is used to reject a file
+THRESHOLD_MIN_ROWS = int(os.getenv('THRESHOLD_MIN_ROWS') or 1000)
+# z score of the one-sided confidence bound, 3.09 rejects a file that would have passed less than 0.1% of the time
+THRESHOLD_CONFIDENCE_Z = float(os.getenv('THRESHOLD_CONFIDENCE_Z') or 3.09)
+
+BUDGET_EXCEEDED = 'budget_exceeded'
+CONFIDENCE_BOUND = 'confidence_bound'
+
+
+def wilson_lower_bound(successes, trials, z):
+    """
+    Lower bound of the Wilson score interval for a binomial proportion.
+    """
+    if not trials:
+        return 0.0
+    p = successes / trials
+    denominator = 1 + z * z / trials
+    centre = p + z * z / (2 * trials)
+    margin = z * math.sqrt(p * (1 - p) / trials + z * z / (4 * trials * trials))
+    return (centre - margin) / denominator
+
+
+class ThresholdEvaluator:
+    """
+    Decides while a file is being processed whether it can still pass `total_warnings_below_threshold`.
+
+    A file fails when warnings / rows >= threshold %. It is rejected early when:
+    - the total number of rows is known and the warnings seen so far already use up the budget for the whole file,
+    - or after `min_rows` rows, the lower confidence bound of the share of rows with at least one warning is above
+      the threshold. Every such row has one or more warnings, so this also bounds the warnings per row. The bound
+      assumes bad rows are spread through the file; raise `min_rows` or `z` for files sorted by quality.
+
+    Attributes:
+    - decision: None while the file can still pass, BUDGET_EXCEEDED or CONFIDENCE_BOUND once it is rejected.
+    - rows_consumed: rows processed when the decision was made (or so far, while undecided).
+    """
+
+    def __init__(self, threshold, total_rows=None, min_rows=THRESHOLD_MIN_ROWS, z=THRESHOLD_CONFIDENCE_Z):
+        self.threshold = threshold
+        self.total_rows = total_rows
+        self.min_rows = min_rows
+        self.z = z
+        self.decision = None
+        self.rows_consumed = 0
+
+    @property
+    def rejected(self):
+        return self.decision is not None
+
+    def update(self, total_warnings, rows_with_warnings, rows_processed):
+        """
+        Re-evaluate with the current counters, returns True once the file is rejected.
+        """
+        if self.decision is not None:
+            return True
+        self.rows_consumed = rows_processed
+        rate = self.threshold / 100.0
+        if self.total_rows and total_warnings >= rate * self.total_rows:
+            self.decision = BUDGET_EXCEEDED
+        elif rows_processed >= self.min_rows and \
+                wilson_lower_bound(rows_with_warnings, rows_processed, self.z) >= rate:
+            self.decision = CONFIDENCE_BOUND
+        return self.decision is not None
@@ -0,0 +1,116 @@
+import logging
+import os
+from collections import Counter
+
+from common.utils import TransformerLogger
+
+LOG = TransformerLogger(__name__)
+
+# occurrences of each (rule, field) issue logged as they happen, the rest are only counted
+WARNING_LOG_LIMIT = int(os.getenv('WARNING_LOG_LIMIT') or 1)
+# example row numbers kept per issue for the summary
+WARNING_SAMPLE_SIZE = int(os.getenv('WARNING_SAMPLE_SIZE') or 10)
+# log an interim summary every N processed rows, 0 only summarizes once per file
+WARNING_SUMMARY_EVERY = int(os.getenv('WARNING_SUMMARY_EVERY') or 0)
+
+
+class WarningCollector:
+    """
+    Counts validation issues per (rule, field) with a bounded sample of the rows they occurred at.
+
+    Only the first `log_limit` occurrences of each issue are logged when they happen, everything else is reported
+    by `log_summary`, so the number of log lines grows with the number of distinct issues instead of the number of
+    rows. Collectors are picklable and can be merged, e.g. from parallel shards.
+    """
+
+    def __init__(self, logger=LOG, log_limit=WARNING_LOG_LIMIT, sample_size=WARNING_SAMPLE_SIZE,
+                 summary_every=WARNING_SUMMARY_EVERY):
+        self.logger = logger
+        self.log_limit = log_limit
+        self.sample_size = sample_size
+        self.summary_every = summary_every
+        self.counts = Counter()
+        self.samples = {}
+        self.levels = {}
+
+    def add(self, rule, field, row_num, message, level=logging.WARNING):
+        """
+        Record one occurrence of an issue.
+
+        :param rule: name of the check that failed, e.g. 'invalid_date'
+        :param field: JSON path of the offending field, None for record level issues
+        :param row_num: row number of the record in its file
+        :param message: log message, the row number is appended
+        :param level: logging level of the issue
+        """
+        key = (rule, field)
+        count = self.counts[key] = self.counts[key] + 1
+        if count == 1:
+            self.samples[key] = []
+            self.levels[key] = level
+        if len(self.samples[key]) < self.sample_size:
+            self.samples[key].append(row_num)
+        if count <= self.log_limit:
+            self.logger.log(level, f"{message} at row {row_num}")
+
+    def add_many(self, rule, field, row_nums, message, level=logging.WARNING):
+        """
+        Record one occurrence of an issue for each of `row_nums`, in increasing row order.
+        """
+        if not row_nums:
+            return
+        key = (rule, field)
+        # only the occurrences that can still be logged or sampled go through `add`, the rest are counted
+        head = max(self.log_limit - self.counts[key], self.sample_size - len(self.samples.get(key, ())), 1)
+        for row_num in row_nums[:head]:
+            self.add(rule, field, row_num, message, level)
+        self.counts[key] += len(row_nums[head:])
+
+    def merge(self, other):
+        """
+        Add the counts and samples of another collector, without logging again.
+        """
+        for key, count in other.counts.items():
+            self.counts[key] += count
+            self.levels.setdefault(key, other.levels[key])
+            sample = self.samples.setdefault(key, [])
+            sample.extend(other.samples[key][:self.sample_size - len(sample)])
+
+    def count(self, level=logging.WARNING):
+        """
+        Total number of issues logged at `level` or above.
+        """
+        return sum(count for key, count in self.counts.items() if self.levels[key] >= level)
+
+    def summary(self):
+        """
+        Returns one dict per distinct issue, most frequent first.
+        """
+        return [{
+                'rule': rule,
+                'field': field,
+                'level': logging.getLevelName(self.levels[rule, field]),
+                'count': count,
+                'sample_rows': list(self.samples[rule, field]),
+        } for (rule, field), count in self.counts.most_common()]
+
+    def row_processed(self, rows_processed, source=None):
+        """
+        Log an interim summary every `summary_every` rows.
+        """
+        if self.summary_every and rows_processed % self.summary_every == 0:
+            self.log_summary(rows_processed, source)
+
+    def log_summary(self, rows_processed, source=None):
+        """
+        Log all issues seen so far in a single record, at the level of the most severe issue.
+        """
+        if not self.counts:
+            return
+        lines = [f"{self.count()} warnings in {rows_processed} rows" + (f" of {source}" if source else "")]
+        for issue in self.summary():
+            rows = ", ".join(map(str, issue['sample_rows']))
+            more = ", ..." if issue['count'] > len(issue['sample_rows']) else ""
+            lines.append(f"  {issue['level']} {issue['rule']} {issue['field'] or ''}: {issue['count']} "
+                         f"(rows {rows}{more})")
+        self.logger.log(max(self.levels.values()), "\n".join(lines))
@@ -1,32 +1,139 @@
-import re
-from common.utils import TransformerLogger
+import json
+import os
+import sys
 from abc import ABC, abstractmethod
+from functools import lru_cache
+
+from common.utils import TransformerLogger
 
 LOG = TransformerLogger(__name__)
 
+# JSON file of the synonym tables of the enum normalizers, see load_enum_normalizers
+ENUM_NORMALIZERS_PATH = os.getenv('ENUM_NORMALIZERS_PATH') or os.path.join(os.path.dirname(__file__), 'enums.json')
+# distinct raw values remembered by each enum normalizer
+ENUM_CACHE_SIZE = int(os.getenv('ENUM_CACHE_SIZE') or 4096)
+
+# default of tables that keep unknown values as they are
+KEEP = object()
+
+
 class EnumNormalizer(ABC):
     @property
     def schema(self):
         pass
+
     @staticmethod
     @abstractmethod
     def normalize(value):
         pass
 
+    @classmethod
+    def normalize_many(cls, values):
+        """
+        Normalize a column of values, normalizing each distinct value only once. None values stay None.
+        """
+        normalized = {value: cls.normalize(value) for value in set(values) if value is not None}
+        return list(map(normalized.get, values))
+
+
+def compile_synonyms(values):
+    """
+    Compile a synonym table (standard value -> raw values) into a dict from stripped, lowercase raw value to
+    standard value. Every standard value is also a synonym of itself.
+    """
+    lookup = {}
+    for standard, synonyms in values.items():
+        # every normalized row shares the one interned copy of its standard value
+        standard = sys.intern(standard)
+        for synonym in [standard, *synonyms]:
+            key = synonym.strip().lower()
+            if lookup.setdefault(key, standard) != standard:
+                raise ValueError(f"'{synonym}' is a synonym of both '{lookup[key]}' and '{standard}'")
+    return lookup
+
+
+class TableEnumNormalizer(EnumNormalizer):
+    """
+    Enum normalizer driven by a synonym table instead of if/elif chains: subclasses set `name`, `values` (standard
+    value -> raw values, compared stripped and case-insensitively) and `default`, the result for unknown values
+    (KEEP returns them unchanged).
+
+    The table is compiled into a dict when the class is created, and `normalize` is memoized for the last
+    ENUM_CACHE_SIZE distinct raw values, so normalizing a value already seen is a single cache lookup. Values that are
+    not strings, e.g. a number or a list in a malformed resource, are returned unchanged and not cached.
+    """
+    name = None
+    values = {}
+    default = KEEP
+
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        cls.lookup = lookup = compile_synonyms(cls.values)
+        default = cls.default
+
+        @lru_cache(maxsize=ENUM_CACHE_SIZE)
+        def normalize_string(value):
+            return lookup.get(value.strip().lower(), value if default is KEEP else default)
+
+        def normalize(value):
+            # checked before the cache, which cannot hash lists or dicts
+            return normalize_string(value) if isinstance(value, str) else value
+
+        normalize.cache_info = normalize_string.cache_info
+        normalize.cache_clear = normalize_string.cache_clear
+        cls.normalize = staticmethod(normalize)
 
-class GenderNormalizer(EnumNormalizer):
     @property
     def schema(self):
-        return 'Gender'
+        return self.name
 
-    @staticmethod
-    def normalize(value):
-        gender = value.strip().lower()
-
-        # Map various forms to standardized values
-        if gender in ['male', 'm', 'man', 'boy']:
-            return 'Male'
-        elif gender in ['female', 'f', 'woman', 'girl']:
-            return 'Female'
-        else:
-            return 'Other'
+
+# enum normalizer classes by name, see register and get_normalizer
+NORMALIZERS = {}
+
+
+def register(normalizer):
+    """
+    Register an EnumNormalizer class under its `name`, replacing a normalizer of the same name. Usable as a class
+    decorator.
+    """
+    NORMALIZERS[normalizer.name] = normalizer
+    return normalizer
+
+
+def get_normalizer(name):
+    try:
+        return NORMALIZERS[name]
+    except KeyError:
+        raise ValueError(f"Unknown enum normalizer {name!r}, expected one of {sorted(NORMALIZERS)}") from None
+
+
+def make_enum_normalizer(name, values, default=KEEP):
+    """
+    Create a TableEnumNormalizer class for a synonym table, e.g.
+    `make_enum_normalizer('Gender', {'Male': ['m', 'man'], 'Female': ['f', 'woman']}, default='Other')`.
+    """
+    return type(f"{name}Normalizer", (TableEnumNormalizer,),
+                {'name': name, 'values': values, 'default': default, '__module__': __name__})
+
+
+def load_enum_normalizers(path=ENUM_NORMALIZERS_PATH):
+    """
+    Create and register the enum normalizers of a JSON file of synonym tables:
+
+        {"Gender": {"values": {"Male": ["m", "man"], "Female": ["f", "woman"]}, "default": "Other"}, ...}
+
+    Without a "default", unknown values are kept as they are.
+
+    :return: dict of the normalizer classes loaded, by name
+    """
+    with open(path) as file:
+        tables = json.load(file)
+    loaded = {name: register(make_enum_normalizer(name, table['values'], table.get('default', KEEP)))
+              for name, table in tables.items()}
+    LOG.debug(f"Loaded enum normalizers {sorted(loaded)} from {path}")
+    return loaded
+
+
+load_enum_normalizers()
+GenderNormalizer = get_normalizer('Gender')
@@ -0,0 +1,59 @@
+import gzip
+import os
+
+try:
+    import zstandard
+except ImportError:  # optional, only needed to read zstd compressed files
+    zstandard = None
+
+GZIP = 'gzip'
+ZSTD = 'zstd'
+MAGIC_BYTES = {GZIP: b'\x1f\x8b', ZSTD: b'\x28\xb5\x2f\xfd'}
+EXTENSIONS = {'.gz': GZIP, '.gzip': GZIP, '.zst': ZSTD, '.zstd': ZSTD}
+# compressed bytes read from the file per decompression call
+DECOMPRESS_READ_SIZE = 1024 * 1024
+
+
+def detect_compression(path):
+    """
+    Compression of a file from its magic bytes, or from its extension if it is too short to have them.
+
+    :return: GZIP, ZSTD or None for an uncompressed file
+    """
+    with open(path, 'rb') as file:
+        head = file.read(4)
+    for compression, magic in MAGIC_BYTES.items():
+        if head.startswith(magic):
+            return compression
+    if len(head) < 4:
+        return EXTENSIONS.get(os.path.splitext(os.fspath(path))[1].lower())
+    return None
+
+
+def is_compressed(path):
+    return detect_compression(path) is not None
+
+
+def open_decompressed(path, compression=None):
+    """
+    Open a file for binary reading, decompressing gzip and zstd files while they are read, without writing the
+    decompressed content to disk.
+
+    Offsets (`seek`, `tell`) are positions in the decompressed content; seeking forward in a compressed file
+    decompresses and skips everything before the target, and seeking backward is only supported for gzip.
+    Multi-member gzip files (e.g. from pigz or bgzip) and multi-frame zstd files are read completely.
+
+    :param compression: GZIP, ZSTD or None, detected with `detect_compression` by default
+    :return: a binary file object whose `read(size)` returns up to `size` decompressed bytes
+    """
+    compression = compression or detect_compression(path)
+    if compression is None:
+        return open(path, 'rb', buffering=0)
+    if compression == GZIP:
+        return gzip.open(path, 'rb')
+    if compression == ZSTD:
+        if zstandard is None:
+            raise ImportError(f"Reading {path} requires the zstandard package")
+        return zstandard.ZstdDecompressor().stream_reader(open(path, 'rb'), read_size=DECOMPRESS_READ_SIZE,
+                                                          read_across_frames=True, closefd=True)
+    raise ValueError(f"Unsupported compression {compression!r}, expected one of {tuple(MAGIC_BYTES)}")
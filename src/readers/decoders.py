@@ -0,0 +1,59 @@
+import json
+import os
+
+from common import metrics
+
+try:
+    import orjson
+except ImportError:  # optional, the stdlib decoder is used instead
+    orjson = None
+
+# 'auto' prefers the fastest installed backend, 'json' forces the standard library
+FHIR_JSON_DECODER = os.getenv('FHIR_JSON_DECODER') or 'auto'
+DECODERS = ('auto', 'orjson', 'json')
+
+
+def _decode_json(line):
+    return json.loads(line)
+
+
+def _decode_orjson(line):
+    try:
+        return orjson.loads(line)
+    except orjson.JSONDecodeError:
+        # orjson is stricter than the standard library (NaN, integers above 64 bits, lone surrogates, non UTF-8
+        # encodings), decode those lines the way json.loads always has so every backend yields the same records
+        return json.loads(bytes(line))
+
+
+_decode_json.name = 'json'
+_decode_orjson.name = 'orjson'
+
+
+def get_decoder(name=None):
+    """
+    Returns a function decoding one JSON document from bytes.
+
+    Every backend returns the same Python structures as `json.loads`; lines a fast backend rejects are decoded
+    again with the standard library rather than dropped.
+
+    :param name: one of DECODERS, defaults to the FHIR_JSON_DECODER environment variable
+    :return: a `loads(bytes)` function with a `name` attribute
+    """
+    name = name or FHIR_JSON_DECODER
+    if name not in DECODERS:
+        raise ValueError(f"Unknown JSON decoder {name!r}, expected one of {DECODERS}")
+    if name == 'orjson' and orjson is None:
+        raise ImportError("FHIR_JSON_DECODER is 'orjson' but orjson is not installed")
+    if name == 'json' or orjson is None:
+        return _decode_json
+    return _decode_orjson
+
+
+def decode_lines(lines, decoder=None):
+    """
+    Decode a batch of NDJSON lines, skipping blank ones.
+    """
+    decoder = decoder or get_decoder()
+    with metrics.timer('decode'):
+        return [decoder(line) for line in lines if line.strip()]
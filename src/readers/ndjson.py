@@ -0,0 +1,90 @@
+import os
+
+from common import metrics
+from readers.compression import is_compressed, open_decompressed
+from readers.decoders import decode_lines, get_decoder
+
+# bytes read from the file at a time, lines are split and decoded a buffer at a time
+READ_BUFFER_SIZE = int(os.getenv('NDJSON_READ_BUFFER_SIZE') or 4 * 1024 * 1024)
+
+
+def iter_line_batches(ndjson_path, start=0, end=None, buffer_size=READ_BUFFER_SIZE):
+    """
+    Read the lines of an NDJSON file in batches, one batch per read buffer.
+    Gzip and zstd compressed files are decompressed a buffer at a time while they are read, see
+    `readers.compression.open_decompressed`; their byte offsets are offsets in the decompressed content.
+
+    Parameters:
+    - ndjson_path: Path to the NDJSON file, optionally compressed.
+    - start: byte offset of the first line to read, must be at the start of a line.
+    - end: byte offset to stop at; a line starting before `end` is read completely. Defaults to the end of the file.
+    - buffer_size: number of bytes read at a time.
+
+    Yields:
+    - Lists of lines as bytes, without their newline, in file order. Blank lines are included.
+    """
+    with open_decompressed(ndjson_path) as file:
+        if start:
+            file.seek(start)
+        position = start
+        remainder = b''
+        while end is None or position < end:
+            with metrics.timer('read'):
+                buffer = file.read(buffer_size)
+            metrics.count('bytes_read', len(buffer))
+            if not buffer:
+                if remainder:
+                    yield [remainder]
+                return
+            lines = (remainder + buffer).split(b'\n')
+            remainder = lines.pop()
+            batch = []
+            for line in lines:
+                if end is not None and position >= end:
+                    break
+                position += len(line) + 1
+                batch.append(line)
+            if batch:
+                yield batch
+
+
+def iter_ndjson(ndjson_path, start=0, end=None, decoder=None, buffer_size=READ_BUFFER_SIZE):
+    """
+    Lazily read FHIR records from an NDJSON file, one record per line.
+
+    Parameters:
+    - ndjson_path: Path to the NDJSON file containing FHIR data, optionally gzip or zstd compressed.
+    - start: byte offset of the first line to read, must be at the start of a line.
+    - end: byte offset to stop at; a line starting before `end` is read completely. Defaults to the end of the file.
+    - decoder: a `loads(bytes)` function, see `readers.decoders.get_decoder`. Defaults to FHIR_JSON_DECODER.
+    - buffer_size: number of bytes read and decoded at a time.
+
+    Yields:
+    - A dictionary for each FHIR record, in file order. Blank lines are skipped.
+    """
+    decoder = decoder or get_decoder()
+    for batch in iter_line_batches(ndjson_path, start, end, buffer_size):
+        yield from decode_lines(batch, decoder)
+
+
+def count_ndjson_rows(ndjson_path, start=0, end=None):
+    """
+    Count the records `iter_ndjson` would yield for the same byte range, without parsing them.
+    """
+    return sum(1 for batch in iter_line_batches(ndjson_path, start, end) for line in batch if line.strip())
+
+
+def row_byte_offset(ndjson_path, row):
+    """
+    Byte offset of the line of the `row`-th record (0-based, blank lines are not counted) without parsing the file,
+    e.g. to resume reading with `iter_ndjson(ndjson_path, start=offset)`. Returns the file size past the last record.
+    """
+    position = 0
+    for batch in iter_line_batches(ndjson_path):
+        for line in batch:
+            if line.strip():
+                if row == 0:
+                    return position
+                row -= 1
+            position += len(line) + 1
+    return position if is_compressed(ndjson_path) else os.path.getsize(ndjson_path)
@@ -0,0 +1,272 @@
+"""
+Random access to the records of an NDJSON file through a memory map and an index of the byte offset of every row.
+
+    python -m readers.offset_index /data/Claim.ndjson 1234
+
+prints the record at row 1234 (0-based, blank lines are not counted), as numbered by the "at row N" warnings.
+"""
+import argparse
+import json
+import mmap
+import os
+import struct
+import sys
+
+import numpy as np
+
+from common import metrics
+from common.utils import TransformerLogger
+from readers.compression import is_compressed
+from readers.decoders import get_decoder
+
+LOG = TransformerLogger(__name__)
+
+# also write the offset index next to the NDJSON file, so it is only built once per file version; off by default, as
+# it adds a file to the input directory
+NDJSON_INDEX_PERSIST = (os.getenv('NDJSON_INDEX_PERSIST') or '0') == '1'
+INDEX_SUFFIX = '.idx'
+# magic, version, size and mtime of the indexed file, number of rows; followed by rows + 1 little-endian uint64
+INDEX_HEADER = struct.Struct('<8sIQQQ')
+INDEX_MAGIC = b'NDJSONIX'
+INDEX_VERSION = 1
+# bytes scanned for newlines at a time while building an index
+SCAN_BLOCK_SIZE = 16 * 1024 * 1024
+WHITESPACE = np.frombuffer(b' \t\r\x0b\x0c', dtype=np.uint8)
+
+
+def build_offsets(buffer):
+    """
+    Byte offsets of the non-blank lines of an NDJSON buffer (bytes or mmap), followed by the buffer size.
+
+    Row `n` spans `offsets[n]:offsets[n + 1]`, i.e. its line and the blank lines after it, which JSON decoders
+    ignore. Blank and whitespace-only lines are not rows, as in `readers.ndjson.iter_ndjson`.
+
+    :return: a uint64 numpy array of rows + 1 offsets
+    """
+    size = len(buffer)
+    if not size:
+        return np.zeros(1, dtype=np.uint64)
+    data = np.frombuffer(buffer, dtype=np.uint8)
+    newlines = [np.flatnonzero(data[block:block + SCAN_BLOCK_SIZE] == ord('\n')) + block
+                for block in range(0, size, SCAN_BLOCK_SIZE)]
+    newlines = np.concatenate(newlines).astype(np.uint64)
+    starts = np.concatenate([np.zeros(1, dtype=np.uint64), newlines + 1])
+    ends = np.concatenate([newlines, np.array([size], dtype=np.uint64)])
+    lines = starts < ends
+    starts, ends = starts[lines], ends[lines]
+    # a record starts with '{'; only lines starting with whitespace can still be blank
+    maybe_blank = np.flatnonzero(np.isin(data[starts], WHITESPACE))
+    del data
+    blank = [i for i in maybe_blank.tolist() if not buffer[int(starts[i]):int(ends[i])].strip()]
+    if blank:
+        starts = np.delete(starts, blank)
+    return np.concatenate([starts, np.array([size], dtype=np.uint64)])
+
+
+def index_path_for(ndjson_path):
+    return os.fspath(ndjson_path) + INDEX_SUFFIX
+
+
+def save_index(index_path, offsets, stat):
+    """
+    Write an offset index atomically, with the size and mtime of the indexed file to detect stale indexes.
+    """
+    with open(index_path + '.tmp', 'wb') as file:
+        file.write(INDEX_HEADER.pack(INDEX_MAGIC, INDEX_VERSION, stat.st_size, stat.st_mtime_ns, len(offsets) - 1))
+        file.write(offsets.astype('<u8').tobytes())
+    os.replace(index_path + '.tmp', index_path)
+
+
+def load_index(index_path, stat):
+    """
+    Read an offset index, returns None if it is missing, invalid or was built for another version of the file.
+    """
+    try:
+        with open(index_path, 'rb') as file:
+            header = file.read(INDEX_HEADER.size)
+            if len(header) != INDEX_HEADER.size:
+                return None
+            magic, version, size, mtime_ns, rows = INDEX_HEADER.unpack(header)
+            if (magic, version, size, mtime_ns) != (INDEX_MAGIC, INDEX_VERSION, stat.st_size, stat.st_mtime_ns):
+                return None
+            offsets = np.fromfile(file, dtype='<u8', count=rows + 1)
+    except OSError:
+        return None
+    return offsets.astype(np.uint64, copy=False) if len(offsets) == rows + 1 else None
+
+
+def persisted_row_count(ndjson_path, index_path=None):
+    """
+    Number of rows of an NDJSON file from its saved offset index, without reading the file or the offsets.
+    Returns None if the file has no up-to-date index, e.g. a compressed file.
+    """
+    try:
+        stat = os.stat(ndjson_path)
+        with open(index_path or index_path_for(ndjson_path), 'rb') as file:
+            header = file.read(INDEX_HEADER.size)
+    except OSError:
+        return None
+    if len(header) != INDEX_HEADER.size:
+        return None
+    magic, version, size, mtime_ns, rows = INDEX_HEADER.unpack(header)
+    if (magic, version, size, mtime_ns) != (INDEX_MAGIC, INDEX_VERSION, stat.st_size, stat.st_mtime_ns):
+        return None
+    return rows
+
+
+def row_count(ndjson_path, persist=NDJSON_INDEX_PERSIST):
+    """
+    Number of rows of an NDJSON file, from its saved offset index if it has an up-to-date one, and otherwise from an
+    index built with a vectorized scan of the memory-mapped file (and saved with `persist`).
+    Returns None for a compressed file, which could only be counted by decompressing it.
+    """
+    rows = persisted_row_count(ndjson_path)
+    if rows is not None or is_compressed(ndjson_path):
+        return rows
+    with IndexedNDJSON(ndjson_path, persist=persist) as ndjson:
+        return len(ndjson)
+
+
+def _decode(decoder, row):
+    # orjson parses memoryviews in place, json.loads needs bytes
+    return decoder(row if decoder.name == 'orjson' else row.tobytes())
+
+
+class IndexedNDJSON:
+    """
+    Memory-mapped NDJSON file with an index of the byte offset of every row, for O(1) access to any row or range of
+    rows without reading the rows before it, e.g. to reprocess the row of a warning.
+
+    The index (rows + 1 uint64 offsets, see `build_offsets`) is loaded from `{ndjson_path}.idx` if it matches the
+    file's size and mtime, and otherwise built with a vectorized scan of the mapped file, and saved there with
+    `persist` (NDJSON_INDEX_PERSIST). A directory that cannot be written to only costs the saving.
+
+    Rows are read as zero-copy memoryviews of the map; release them before `close`. Rows are numbered from 0 without
+    blank lines, like the row numbers of the processors.
+    """
+
+    def __init__(self, ndjson_path, index_path=None, persist=NDJSON_INDEX_PERSIST):
+        if is_compressed(ndjson_path):
+            raise ValueError(f"Cannot memory-map the compressed file {ndjson_path}, read it with iter_ndjson")
+        self.path = ndjson_path
+        self.index_path = index_path or index_path_for(ndjson_path)
+        self._file = open(ndjson_path, 'rb')
+        stat = os.fstat(self._file.fileno())
+        self._map = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ) if stat.st_size else b''
+        self._view = memoryview(self._map)
+        self.offsets = load_index(self.index_path, stat)
+        if self.offsets is None:
+            with metrics.timer('build_offset_index'):
+                self.offsets = build_offsets(self._map)
+            if persist:
+                try:
+                    save_index(self.index_path, self.offsets, stat)
+                except OSError as e:
+                    LOG.info(f"Could not save the offset index of {ndjson_path}: {e}")
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def _check_row(self, row):
+        if not 0 <= row < len(self):
+            raise IndexError(f"Row {row} out of range, {self.path} has {len(self)} rows")
+
+    def offset(self, row):
+        """
+        Byte offset of the line of `row`; the file size for `row == len(self)`.
+        """
+        if row != len(self):
+            self._check_row(row)
+        return int(self.offsets[row])
+
+    def byte_range(self, start=0, stop=None):
+        """
+        (start, end) byte offsets of the rows `start:stop`, for `iter_ndjson(path, start, end)`.
+        """
+        stop = len(self) if stop is None else min(stop, len(self))
+        start = min(start, stop)
+        return int(self.offsets[start]), int(self.offsets[stop])
+
+    def row_bytes(self, row):
+        """
+        Zero-copy memoryview of the bytes of `row`, including its newline.
+        """
+        self._check_row(row)
+        return self._view[int(self.offsets[row]):int(self.offsets[row + 1])]
+
+    def iter_row_bytes(self, start=0, stop=None):
+        """
+        Yield zero-copy memoryviews of the rows `start:stop`.
+        """
+        stop = len(self) if stop is None else min(stop, len(self))
+        offsets = self.offsets[start:stop + 1].tolist()
+        view = self._view
+        for begin, end in zip(offsets, offsets[1:]):
+            yield view[begin:end]
+
+    def records(self, start=0, stop=None, decoder=None):
+        """
+        Yield the decoded records of the rows `start:stop`.
+        """
+        decoder = decoder or get_decoder()
+        for row in self.iter_row_bytes(start, stop):
+            with row:
+                yield _decode(decoder, row)
+
+    def __getitem__(self, row):
+        """
+        Decoded record of a row, or the list of records of a slice of rows with step 1.
+        """
+        if isinstance(row, slice):
+            start, stop, step = row.indices(len(self))
+            if step != 1:
+                raise ValueError("Row slices do not support steps")
+            return list(self.records(start, stop))
+        if row < 0:
+            row += len(self)
+        with self.row_bytes(row) as data:
+            return _decode(get_decoder(), data)
+
+    def shard_ranges(self, shards):
+        """
+        Split the rows into at most `shards` contiguous ranges of about the same number of bytes, exactly on row
+        boundaries.
+
+        :return: list of (start, end, first_row), the byte range of each shard and the number of its first row
+        """
+        rows = len(self)
+        if not rows:
+            return []
+        targets = self.offsets[-1] * np.arange(1, shards, dtype=np.uint64) // np.uint64(shards)
+        boundaries = np.unique(np.concatenate([[0], np.searchsorted(self.offsets[:-1], targets), [rows]]))
+        return [(int(self.offsets[first]), int(self.offsets[stop]), int(first))
+                for first, stop in zip(boundaries.tolist(), boundaries[1:].tolist())]
+
+    def close(self):
+        self._view.release()
+        if isinstance(self._map, mmap.mmap):
+            self._map.close()
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('ndjson_path')
+    parser.add_argument('row', type=int)
+    parser.add_argument('--rows', type=int, default=1, help="number of rows to print from `row`")
+    args = parser.parse_args()
+
+    with IndexedNDJSON(args.ndjson_path) as ndjson:
+        for record in ndjson.records(args.row, args.row + args.rows):
+            json.dump(record, sys.stdout)
+            sys.stdout.write('\n')
+
+
+if __name__ == '__main__':
+    main()
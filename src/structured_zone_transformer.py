@@ -1,13 +1,27 @@
-import json, csv
-from pandas.io.json import json_normalize
 import pandas as pd
 from datetime import datetime
 from field_mappers.claim_processor import FHIRClaimProcessor
 from field_mappers.patient_processor import FHIRPatientProcessor
-from sqlalchemy import create_engine
+from field_mappers.parallel import process_ndjson_parallel
 from dotenv import load_dotenv
-import os, psycopg2
-from common.utils import TransformerLogger
+import os
+from contextlib import contextmanager
+from itertools import islice
+from psycopg2.extras import execute_values
+from common.utils import TransformerLogger, chunked, chunked_by_key, fingerprint, reservoir_sample
+from common import metrics
+from common.db import close_pools, db_session
+from common.spill import SpillFile
+from common.dedup import Deduplicator
+from common.checkpoints import COMPLETE, CheckpointStore, RoutedCheckpointStore, file_identity
+from common.routing import OriginRouter
+from common.pipeline import PIPELINE_QUEUE_SIZE, StopPipeline, run_pipeline
+from readers.decoders import decode_lines, get_decoder
+from readers.compression import is_compressed
+from readers.ndjson import iter_line_batches, iter_ndjson, row_byte_offset
+from readers.offset_index import IndexedNDJSON, row_count
+from writers.columnar_writer import write_columnar
+from writers.copy_loader import PostgresCopySink, copy_rows
 
 LOG = TransformerLogger(__name__)
 
@@ -21,9 +35,38 @@ DATABASE_HOST = os.getenv('DATABASE_HOST')
 DATABASE_PORT = os.getenv('DATABASE_PORT')
 DATABASE_NAME = os.getenv('DATABASE_NAME')
 
+# 'bulk' stages whole chunks of processed rows and applies them with set-based statements,
+# 'row' keeps the original one-connection-per-record upserts
+UPSERT_MODE = os.getenv('UPSERT_MODE') or 'bulk'
+UPSERT_CHUNK_SIZE = int(os.getenv('UPSERT_CHUNK_SIZE') or 1000)
+# estimate the share of known patients from a sample of this many IDs instead of checking every ID in the file
+PATIENT_COVERAGE_SAMPLE_SIZE = int(os.getenv('PATIENT_COVERAGE_SAMPLE_SIZE') or 0) or None
+# number of processes used to validate, map and normalize records; 1 processes files sequentially
+INGEST_WORKERS = int(os.getenv('INGEST_WORKERS') or 1)
+# records per vectorized date validation batch; 0 validates every record on its own
+VALIDATION_BATCH_SIZE = int(os.getenv('VALIDATION_BATCH_SIZE') or 1000)
+# maximum percentage of warnings per record for a file to be written
+WARNING_THRESHOLD = 5
+# reject files while they are processed as soon as they can no longer pass the warning threshold
+THRESHOLD_EARLY_ABORT = (os.getenv('THRESHOLD_EARLY_ABORT') or '1') == '1'
+# skip files that were already ingested and resume interrupted ones, see common.checkpoints
+INGEST_CHECKPOINTS = (os.getenv('INGEST_CHECKPOINTS') or '1') == '1'
+# write the records of a file in file order ('off'), group the versions of a record before writing ('all') or keep
+# only the last one ('final'); grouping holds a copy of the file's records, in memory or in SQLite
+DEDUP_MODE = os.getenv('DEDUP_MODE') or 'off'
+# read, process and write chunks of a file concurrently, in one transaction per file, see ingest_file_pipelined
+INGEST_PIPELINE = (os.getenv('INGEST_PIPELINE') or '0') == '1'
+# write the records of each origin in parallel, through the connection ORIGIN_ROUTES maps it to, see common.routing
+ORIGIN_ROUTING = (os.getenv('ORIGIN_ROUTING') or '0') == '1'
+# also write the processed rows of every file that passes its checks to this silver zone directory, see write_silver_zone
+SILVER_ZONE_PATH = os.getenv('SILVER_ZONE_PATH') or None
+# 'parquet' or 'arrow' (IPC) silver zone files
+SILVER_ZONE_FORMAT = os.getenv('SILVER_ZONE_FORMAT') or 'parquet'
+
 def load_fhir_data(ndjson_path):
     """
     Load FHIR data from an NDJSON file.
+    Materializes the whole file, prefer `iter_ndjson` for large files.
 
     Parameters:
     - ndjson_path: Path to the NDJSON file containing FHIR data.
@@ -31,36 +74,69 @@ def load_fhir_data(ndjson_path):
     Returns:
     - fhir_data: A list of dictionaries, where each dictionary represents a FHIR record.
     """
-    fhir_data = []
-    with open(ndjson_path, 'r') as file:
-        for line in file:
-            # Parse the JSON object in each line
-            fhir_record = json.loads(line)
-            fhir_data.append(fhir_record)
-    return fhir_data
+    return list(iter_ndjson(ndjson_path))
+
+
+def process_fhir_data(processor, ndjson_path, workers=INGEST_WORKERS, batch_size=VALIDATION_BATCH_SIZE):
+    """
+    Lazily process the records of an NDJSON file in file order, in parallel over byte ranges when `workers` > 1.
+    The processor's warning and row counters are complete once the returned iterator is exhausted.
+    With a threshold evaluation started on the processor, the iterator stops early once the file is rejected.
+    """
+    if workers > 1 and is_compressed(ndjson_path):
+        LOG.info(f"Processing the compressed file {ndjson_path} sequentially, it cannot be split into shards")
+    elif workers > 1:
+        return process_ndjson_parallel(processor, ndjson_path, workers=workers, batch_size=batch_size)
+    evaluator = processor.threshold_evaluator
+    if evaluator is not None and evaluator.total_rows is None:
+        # a known total lets hopeless files fail on their warning budget; counted with the offset index, a vectorized
+        # scan of the mapped file, and unknown for compressed files, which would have to be decompressed twice
+        evaluator.total_rows = row_count(ndjson_path)
+    return processor.process_many(iter_ndjson(ndjson_path), batch_size=batch_size)
 
 
 def write_to_file(filename, output_data):
-    with open(filename, mode='w', newline='') as file:
-        writer = csv.writer(file)
-
-        normalized_data = json_normalize(output_data)
-        writer.writerow(normalized_data.columns)
-
-        for index, row in normalized_data.iterrows():
-            writer.writerow(row)
-
-def write_to_db(table, output_data, mode='replace'):
-    df = pd.DataFrame(output_data)
-    pg_connection_dict = {
-            'dbname': DATABASE_NAME,
-            'user': DATABASE_USER,
-            'password': DATABASE_PASSWORD,
-            'port': DATABASE_PORT,
-            'host': DATABASE_HOST
-    }
-    engine = psycopg2.connect(**pg_connection_dict)
-    df.to_sql(table, engine, index=False, if_exists=mode)
+    """
+    Write processed rows to a CSV file, with their flattened keys as the header.
+    """
+    # json_normalize only flattens plain dicts, not the compact rows of the processors
+    normalized_data = pd.json_normalize([dict(row) for row in output_data])
+    # to_csv serializes the whole frame at once instead of a csv.writer call per iterrows() Series
+    normalized_data.to_csv(filename, index=False)
+
+
+def write_silver_zone(ndjson_path, processor, records, root=SILVER_ZONE_PATH, file_format=SILVER_ZONE_FORMAT):
+    """
+    Write the processed rows of an NDJSON file to a Parquet (or Arrow IPC) file of the silver zone, partitioned by
+    resource type and ingest date, see `writers.columnar_writer`. The file is named after the input file and the
+    ingest timestamp, e.g. `Claim-20240501T120000000000.parquet`, so every ingest of a day keeps its own file.
+
+    :return: LoadStats of the write
+    """
+    ingest_ts = processor.ingest_ts or datetime.now()
+    name = f"{os.path.splitext(os.path.basename(ndjson_path))[0]}-{ingest_ts:%Y%m%dT%H%M%S%f}"
+    with metrics.timer('write_silver_zone'):
+        stats, _ = write_columnar(root, processor.spec.resource_type, records, name, ingest_ts.date(),
+                                  file_format)
+    metrics.count('silver_zone_rows', stats.rows)
+    return stats
+
+
+def write_to_db(table, output_data, mode='replace', columns=None):
+    """
+    Bulk load processed rows into `table` with COPY FROM STDIN, streaming them without an intermediate DataFrame.
+
+    :param table: name of an existing table
+    :param output_data: iterable of dictionaries, e.g. a SpillFile
+    :param mode: 'replace' empties the table first, 'append' adds to it. Unlike the `DataFrame.to_sql` this replaces,
+                 the table is truncated rather than dropped and recreated, so it keeps its schema and indexes.
+    :param columns: columns to load, by default the keys of the first row that are columns of `table`; keys such as
+                    `origin` or `created` of the processed claims are left out
+    :return: LoadStats with the number of rows loaded and rows per second
+    """
+    with db_session(pg_connection_dict) as conn:
+        return copy_rows(PostgresCopySink(conn), table, output_data, columns, mode)
+
 
 pg_connection_dict = {
         'dbname': DATABASE_NAME,
@@ -69,6 +145,16 @@ pg_connection_dict = {
         'port': DATABASE_PORT,
         'host': DATABASE_HOST
 }
+origin_router = OriginRouter(pg_connection_dict)
+
+
+def writes_to_origin_databases():
+    """
+    True if the records of a file are written to the routed databases of their origins (ORIGIN_ROUTES), which
+    `write_claims` and `write_patients` do with ORIGIN_ROUTING and in the 'row' UPSERT_MODE. The pipelined ingestion
+    writes every file through the default connection.
+    """
+    return bool(origin_router.routes) and not INGEST_PIPELINE and (ORIGIN_ROUTING or UPSERT_MODE == 'row')
 
 
 def upsert_claim(claim_details):
@@ -76,12 +162,12 @@ def upsert_claim(claim_details):
     Upsert a claim record. If the claim is new or modified, it's inserted/updated in the 'claims' table.
     Previous versions of modified records are saved to 'claims_history'.
 
-    :param claim_details: Dictionary with claim data.
+    :param claim_details: Dictionary with claim data, written to the database of its `origin`.
     """
-    # Connect to the PostgreSQL database
-    conn = psycopg2.connect(**pg_connection_dict)
+    # Borrow a pooled connection to the PostgreSQL database, the transaction is committed when the block succeeds
     try:
-        with conn.cursor() as cursor:
+        with db_session(origin_router.connection_dict_for(claim_details.get('origin'))) as conn, \
+                conn.cursor() as cursor:
             # Extract claim details
             claim_id = claim_details['claim_id']
             patient_id = claim_details['patient_id']
@@ -93,177 +179,666 @@ def upsert_claim(claim_details):
             status = claim_details['status']
             amount = claim_details['amount']
 
-            # Check for an existing claim for the patient within the same billing period
-            cursor.execute("""
-                SELECT claim_id, insert_ts FROM claims WHERE claim_id = %s
-            """, (claim_id,)
-            )
-            existing_claim = cursor.fetchone()
-
             now = datetime.now()
-            # set the default for the history table
-            insert_ts = now
-
-            if existing_claim:
-                # If existing, move current record to history before updating
-                claim_id_db, insert_ts = existing_claim
-
-                # Update existing claim record
-                cursor.execute("""
-                    UPDATE claims
-                    SET provider = %s, admitting_diagnosis = %s, insurance = %s, status = %s,
-                        amount = %s, insert_ts = %s
-                    WHERE claim_id = %s
-                """, (
-                provider, admitting_diagnosis, insurance, status, amount, now, claim_id)
-                               )
-            else:
-                # Insert new claim record
-                cursor.execute("""
-                    INSERT INTO claims (claim_id, patient_id, billing_start, billing_end, provider, admitting_diagnosis,
-                                        insurance, status, amount, insert_ts)
-                    VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
-                """, (claim_id, patient_id, billing_start, billing_end, provider, admitting_diagnosis,
-                      insurance, status, amount, now)
-                               )
+            # A single statement against the unique claim_id: the history row records the insert_ts of the stored
+            # claim (or now for a new claim), since all parts of the statement see the table as it was before it ran.
+            # A claim whose content hash matches the stored one is neither updated nor added to the history.
             cursor.execute("""
+                WITH existing_claim AS (
+                    SELECT insert_ts, content_hash FROM claims WHERE claim_id = %(claim_id)s
+                ), upserted AS (
+                    INSERT INTO claims (claim_id, patient_id, billing_start, billing_end, provider, admitting_diagnosis,
+                                        insurance, status, amount, insert_ts, content_hash)
+                    VALUES (%(claim_id)s, %(patient_id)s, %(billing_start)s, %(billing_end)s, %(provider)s,
+                            %(admitting_diagnosis)s, %(insurance)s, %(status)s, %(amount)s, %(now)s, %(content_hash)s)
+                    ON CONFLICT (claim_id) DO UPDATE
+                    SET provider = EXCLUDED.provider, admitting_diagnosis = EXCLUDED.admitting_diagnosis,
+                        insurance = EXCLUDED.insurance, status = EXCLUDED.status, amount = EXCLUDED.amount,
+                        insert_ts = EXCLUDED.insert_ts, content_hash = EXCLUDED.content_hash
+                    WHERE claims.content_hash IS DISTINCT FROM EXCLUDED.content_hash
+                )
                 INSERT INTO claims_history (claim_id, patient_id, billing_start, billing_end, provider,
                                             admitting_diagnosis, insurance, status, amount, insert_ts, change_ts)
-                VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
-            """, (claim_id, patient_id, billing_start, billing_end, provider,
-                  admitting_diagnosis, insurance, status, amount, insert_ts, now)
+                SELECT %(claim_id)s, %(patient_id)s, %(billing_start)s, %(billing_end)s, %(provider)s,
+                       %(admitting_diagnosis)s, %(insurance)s, %(status)s, %(amount)s,
+                       COALESCE((SELECT insert_ts FROM existing_claim), %(now)s), %(now)s
+                WHERE NOT EXISTS (SELECT 1 FROM existing_claim WHERE content_hash = %(content_hash)s)
+            """, {'claim_id': claim_id, 'patient_id': patient_id, 'billing_start': billing_start,
+                  'billing_end': billing_end, 'provider': provider, 'admitting_diagnosis': admitting_diagnosis,
+                  'insurance': insurance, 'status': status, 'amount': amount, 'now': now,
+                  'content_hash': fingerprint(claim_details.get(column) for column in CLAIM_COLUMNS)}
                            )
 
-            # Commit the transaction
-            conn.commit()
-
     except Exception as e:
+        metrics.count('row_errors')
         LOG.error(f"An error occurred: {e}")
-        conn.rollback()
-    finally:
-        conn.close()
 
 def upsert_patient(patient_id, first_name, last_name, origin):
-    """Insert or update a patient's record and log changes to the history table."""
+    """Insert or update a patient's record and log changes to the history table of the database of its origin."""
     try:
-        conn = psycopg2.connect(**pg_connection_dict)
-        cursor = conn.cursor()
-
-        # Check if the patient already exists in the current table
-        cursor.execute('SELECT id, insert_ts FROM patients WHERE patient_id = %s', (patient_id,))
-        result = cursor.fetchone()
-        # set the default for the history table
-        now = datetime.now()
-        insert_ts = now
-
-        if result:
-            # If patient exists, update the current table and log to history
-            patient_id_db, insert_ts = result
-            cursor.execute('''
-                UPDATE patients SET first_name = %s, last_name = %s, insert_ts = %s WHERE patient_id = %s
-            ''', (first_name, last_name, now, patient_id)
-                           )
-        else:
-            # If patient does not exist, insert into the current table
+        with db_session(origin_router.connection_dict_for(origin)) as conn, conn.cursor() as cursor:
+            now = datetime.now()
+            # A single statement against the unique patient_id, see upsert_claim
             cursor.execute('''
-                INSERT INTO patients (first_name, last_name, patient_id, insert_ts)
-                VALUES (%s, %s, %s, %s)
-            ''', (first_name, last_name, patient_id, now)
+                WITH existing_patient AS (
+                    SELECT insert_ts, content_hash FROM patients WHERE patient_id = %(patient_id)s
+                ), upserted AS (
+                    INSERT INTO patients (first_name, last_name, patient_id, insert_ts, content_hash)
+                    VALUES (%(first_name)s, %(last_name)s, %(patient_id)s, %(now)s, %(content_hash)s)
+                    ON CONFLICT (patient_id) DO UPDATE
+                    SET first_name = EXCLUDED.first_name, last_name = EXCLUDED.last_name,
+                        insert_ts = EXCLUDED.insert_ts, content_hash = EXCLUDED.content_hash
+                    WHERE patients.content_hash IS DISTINCT FROM EXCLUDED.content_hash
+                )
+                INSERT INTO patients_history (first_name, last_name, patient_id, insert_ts, change_ts)
+                SELECT %(first_name)s, %(last_name)s, %(patient_id)s,
+                       COALESCE((SELECT insert_ts FROM existing_patient), %(now)s), %(now)s
+                WHERE NOT EXISTS (SELECT 1 FROM existing_patient WHERE content_hash = %(content_hash)s)
+            ''', {'first_name': first_name, 'last_name': last_name, 'patient_id': patient_id, 'now': now,
+                  'content_hash': fingerprint([first_name, last_name, patient_id])}
                            )
 
-        cursor.execute('''
-            INSERT INTO patients_history (first_name, last_name, patient_id, insert_ts, change_ts)
-            VALUES (%s, %s, %s, %s, %s)
-        ''', (first_name, last_name, patient_id, insert_ts, now)
-                       )
+    except Exception as e:
+        metrics.count('row_errors')
+        LOG.error(f"An error occurred: {e}")
+
+
+CLAIM_COLUMNS = ('claim_id', 'patient_id', 'billing_start', 'billing_end', 'provider', 'admitting_diagnosis',
+                 'insurance', 'status', 'amount')
+PATIENT_COLUMNS = ('first_name', 'last_name', 'patient_id')
+
+
+def _changed_records(cursor, records, table, key, columns):
+    """
+    Drop the records of a chunk whose content is the same as the version before them, which is the stored row for the
+    first version of a key in the chunk. The content hashes of the stored rows are fetched in one query.
+
+    :return: list of (record, content_hash) tuples for the records to write, in chunk order
+    """
+    cursor.execute(f"SELECT {key}, content_hash FROM {table} WHERE {key} = ANY(%s)",
+                   (list({record.get(key) for record in records}),)
+                   )
+    latest = dict(cursor.fetchall())
+    changed = []
+    for record in records:
+        content_hash = fingerprint(record.get(column) for column in columns)
+        if latest.get(record.get(key)) != content_hash:
+            latest[record.get(key)] = content_hash
+            changed.append((record, content_hash))
+    return changed
+
+
+def _upsert_claims_chunk(cursor, claims, now):
+    """
+    Apply a chunk of claims with set-based statements. Mirrors `upsert_claim` for every row in the chunk:
+    the first version of a claim in the chunk records the insert_ts of the stored claim (or `now` for new claims)
+    in the history table, later versions of the same claim record the insert_ts of the version before them.
+    Claims whose content did not change are skipped.
 
-        conn.commit()
+    :return: number of claims written
+    """
+    changed = _changed_records(cursor, claims, 'claims', 'claim_id', CLAIM_COLUMNS)
+    if not changed:
+        return 0
+    cursor.execute("""
+        CREATE TEMPORARY TABLE claims_stage
+        (
+            seq                 INT NOT NULL,
+            claim_id            VARCHAR(255),
+            patient_id          VARCHAR(255),
+            billing_start       DATE,
+            billing_end         DATE,
+            provider            VARCHAR(255),
+            admitting_diagnosis VARCHAR(128),
+            insurance           VARCHAR(50),
+            status              VARCHAR(50),
+            amount              NUMERIC(10, 2),
+            content_hash        CHAR(32)
+        ) ON COMMIT DROP
+    """)
+    execute_values(cursor,
+                   "INSERT INTO claims_stage (seq, {}, content_hash) VALUES %s".format(', '.join(CLAIM_COLUMNS)),
+                   [(seq,) + tuple(claim.get(column) for column in CLAIM_COLUMNS) + (content_hash,)
+                    for seq, (claim, content_hash) in enumerate(changed)],
+                   page_size=len(changed)
+                   )
+
+    # history rows have to be written before the current table is touched to see the previous insert_ts
+    cursor.execute("""
+        INSERT INTO claims_history (claim_id, patient_id, billing_start, billing_end, provider,
+                                    admitting_diagnosis, insurance, status, amount, insert_ts, change_ts)
+        SELECT s.claim_id, s.patient_id, s.billing_start, s.billing_end, s.provider,
+               s.admitting_diagnosis, s.insurance, s.status, s.amount,
+               CASE WHEN s.version = 1 THEN COALESCE(c.insert_ts, %(now)s) ELSE %(now)s END, %(now)s
+        FROM (SELECT *, ROW_NUMBER() OVER (PARTITION BY claim_id ORDER BY seq) AS version FROM claims_stage) s
+        LEFT JOIN claims c ON c.claim_id = s.claim_id
+        ORDER BY s.seq
+    """, {'now': now}
+                   )
+    # new claims keep the keys of their first version, and all claims take the updatable values of their last version
+    cursor.execute("""
+        INSERT INTO claims (claim_id, patient_id, billing_start, billing_end, provider, admitting_diagnosis,
+                            insurance, status, amount, insert_ts, content_hash)
+        SELECT f.claim_id, f.patient_id, f.billing_start, f.billing_end, l.provider, l.admitting_diagnosis,
+               l.insurance, l.status, l.amount, %(now)s, l.content_hash
+        FROM (SELECT DISTINCT ON (claim_id) * FROM claims_stage ORDER BY claim_id, seq) f
+        JOIN (SELECT DISTINCT ON (claim_id) * FROM claims_stage ORDER BY claim_id, seq DESC) l
+            ON l.claim_id = f.claim_id
+        ORDER BY f.seq
+        ON CONFLICT (claim_id) DO UPDATE
+        SET provider = EXCLUDED.provider, admitting_diagnosis = EXCLUDED.admitting_diagnosis,
+            insurance = EXCLUDED.insurance, status = EXCLUDED.status, amount = EXCLUDED.amount,
+            insert_ts = EXCLUDED.insert_ts, content_hash = EXCLUDED.content_hash
+    """, {'now': now}
+                   )
+    # dropped right away rather than on commit, so a transaction can apply several chunks
+    cursor.execute("DROP TABLE claims_stage")
+    return len(changed)
+
+
+def _upsert_patients_chunk(cursor, patients, now):
+    """
+    Apply a chunk of patients with set-based statements, with the same history semantics as `upsert_patient`.
+    Patients whose content did not change are skipped.
 
+    :return: number of patients written
+    """
+    changed = _changed_records(cursor, patients, 'patients', 'patient_id', PATIENT_COLUMNS)
+    if not changed:
+        return 0
+    cursor.execute("""
+        CREATE TEMPORARY TABLE patients_stage
+        (
+            seq        INT NOT NULL,
+            first_name VARCHAR(128),
+            last_name  VARCHAR(128),
+            patient_id VARCHAR(255),
+            content_hash CHAR(32)
+        ) ON COMMIT DROP
+    """)
+    execute_values(cursor,
+                   "INSERT INTO patients_stage (seq, {}, content_hash) VALUES %s".format(', '.join(PATIENT_COLUMNS)),
+                   [(seq,) + tuple(patient.get(column) for column in PATIENT_COLUMNS) + (content_hash,)
+                    for seq, (patient, content_hash) in enumerate(changed)],
+                   page_size=len(changed)
+                   )
+    cursor.execute("""
+        INSERT INTO patients_history (first_name, last_name, patient_id, insert_ts, change_ts)
+        SELECT s.first_name, s.last_name, s.patient_id,
+               CASE WHEN s.version = 1 THEN COALESCE(p.insert_ts, %(now)s) ELSE %(now)s END, %(now)s
+        FROM (SELECT *, ROW_NUMBER() OVER (PARTITION BY patient_id ORDER BY seq) AS version FROM patients_stage) s
+        LEFT JOIN patients p ON p.patient_id = s.patient_id
+        ORDER BY s.seq
+    """, {'now': now}
+                   )
+    cursor.execute("""
+        INSERT INTO patients (first_name, last_name, patient_id, insert_ts, content_hash)
+        SELECT s.first_name, s.last_name, s.patient_id, %(now)s, s.content_hash
+        FROM (SELECT DISTINCT ON (patient_id) * FROM patients_stage ORDER BY patient_id, seq DESC) s
+        ORDER BY s.seq
+        ON CONFLICT (patient_id) DO UPDATE
+        SET first_name = EXCLUDED.first_name, last_name = EXCLUDED.last_name, insert_ts = EXCLUDED.insert_ts,
+            content_hash = EXCLUDED.content_hash
+    """, {'now': now}
+                   )
+    cursor.execute("DROP TABLE patients_stage")
+    return len(changed)
+
+
+def _bulk_upsert(records, apply_chunk, key, chunk_size, connection_dict, on_commit=None):
+    """
+    Apply `records` in chunks of about `chunk_size`, one pooled transaction per chunk. Consecutive versions of the
+    same `key` (e.g. grouped by a Deduplicator) are applied in the same chunk.
+    A chunk that fails as a whole (e.g. because of one row violating a NOT NULL constraint) is rolled back and
+    replayed one row at a time behind savepoints, so only the offending rows are skipped, as in the per-row mode.
+
+    :param on_commit: optional `on_commit(cursor, rows_written)` called in the transaction of every chunk with the
+                      number of records consumed so far, e.g. to advance a checkpoint atomically with the chunk
+    """
+    rows_written = rows_changed = 0
+    for chunk in chunked_by_key(records, chunk_size, lambda record: record.get(key)):
+        rows_written += len(chunk)
+        try:
+            with db_session(connection_dict) as conn, conn.cursor() as cursor:
+                rows_changed += apply_chunk(cursor, chunk, datetime.now())
+                if on_commit:
+                    on_commit(cursor, rows_written)
+        except Exception as e:
+            metrics.count('chunk_retries')
+            LOG.warning(f"Bulk upsert of {len(chunk)} rows failed, retrying row by row: {e}")
+            with db_session(connection_dict) as conn, conn.cursor() as cursor:
+                rows_changed += _replay_rows(cursor, apply_chunk, chunk)
+                if on_commit:
+                    on_commit(cursor, rows_written)
+    metrics.count('rows_written', rows_written)
+    metrics.count('rows_changed', rows_changed)
+    LOG.info(f"Upserted {rows_changed} new or changed of {rows_written} rows")
+    return rows_changed
+
+
+def _replay_rows(cursor, apply_chunk, chunk):
+    """
+    Apply the records of a failed chunk one at a time behind savepoints, skipping the rows that fail.
+    """
+    rows_changed = 0
+    for record in chunk:
+        cursor.execute("SAVEPOINT upsert_row")
+        try:
+            rows_changed += apply_chunk(cursor, [record], datetime.now())
+        except Exception as e:
+            cursor.execute("ROLLBACK TO SAVEPOINT upsert_row")
+            metrics.count('row_errors')
+            LOG.error(f"An error occurred: {e}")
+        else:
+            cursor.execute("RELEASE SAVEPOINT upsert_row")
+    return rows_changed
+
+
+def _apply_chunk_in_transaction(cursor, apply_chunk, chunk):
+    """
+    Apply a chunk inside a transaction that spans several chunks: a failed chunk is rolled back to a savepoint and
+    replayed row by row, like `_bulk_upsert` does with its per-chunk transactions.
+    """
+    cursor.execute("SAVEPOINT upsert_chunk")
+    try:
+        rows_changed = apply_chunk(cursor, chunk, datetime.now())
     except Exception as e:
-        LOG.error(f"An error occurred: {e}")
-        conn.rollback()
-    finally:
-        if 'cursor' in locals():
-            cursor.close()
-        if 'conn' in locals():
-            conn.close()
+        cursor.execute("ROLLBACK TO SAVEPOINT upsert_chunk")
+        metrics.count('chunk_retries')
+        LOG.warning(f"Bulk upsert of {len(chunk)} rows failed, retrying row by row: {e}")
+        return _replay_rows(cursor, apply_chunk, chunk)
+    cursor.execute("RELEASE SAVEPOINT upsert_chunk")
+    return rows_changed
 
 
-def percent_of_patients_above_threshold(patient_ids, threshold, connection_dict):
+def upsert_claims(claims, chunk_size=UPSERT_CHUNK_SIZE, connection_dict=None, on_commit=None):
     """
-    Checks that the percentage of patient IDs in the history table is above a certain threshold
-    :param patient_ids: a list of patient IDs
+    Bulk version of `upsert_claim`: upserts an iterable of claim records `chunk_size` rows at a time.
+
+    :param claims: iterable of dictionaries with claim data, in file order
+    :param chunk_size: number of records staged and applied per transaction
+    :param connection_dict: psycopg2 connection parameters, defaults to `pg_connection_dict`
+    :param on_commit: optional callback run in the transaction of every chunk, see `_bulk_upsert`
+    :return: number of new or changed claims written, unchanged claims are skipped
+    """
+    return _bulk_upsert(claims, _upsert_claims_chunk, 'claim_id', chunk_size, connection_dict or pg_connection_dict,
+                        on_commit)
+
+
+def upsert_patients(patients, chunk_size=UPSERT_CHUNK_SIZE, connection_dict=None, on_commit=None):
+    """
+    Bulk version of `upsert_patient`: upserts an iterable of patient records `chunk_size` rows at a time.
+
+    :param patients: iterable of dictionaries with patient data, in file order
+    :param chunk_size: number of records staged and applied per transaction
+    :param connection_dict: psycopg2 connection parameters, defaults to `pg_connection_dict`
+    :param on_commit: optional callback run in the transaction of every chunk, see `_bulk_upsert`
+    :return: number of new or changed patients written, unchanged patients are skipped
+    """
+    return _bulk_upsert(patients, _upsert_patients_chunk, 'patient_id', chunk_size,
+                        connection_dict or pg_connection_dict, on_commit)
+
+
+def ensure_history_partitions(ts, connection_dict=None):
+    """
+    Create the monthly partitions of the history tables for the month of `ts` and the month after it, so history rows
+    written by a run do not fall into the default partitions.
+    :return: names of the partitions
+    """
+    with db_session(connection_dict or pg_connection_dict) as conn, conn.cursor() as cursor:
+        cursor.execute("""
+            SELECT ensure_history_partition(parent, date_trunc('month', %(ts)s::timestamp) + month * INTERVAL '1 month')
+            FROM unnest(ARRAY ['claims_history', 'patients_history']) AS parent, generate_series(0, 1) AS month
+        """, {'ts': ts}
+                       )
+        return [row[0] for row in cursor.fetchall()]
+
+
+def count_patients_in_history(patient_ids, connection_dict, sample_size=None):
+    """
+    Counts the distinct patient IDs and those of them that are already in the history table.
+    The IDs are streamed into a temporary table with COPY and matched against the patient_id index of the history
+    table, so neither the SQL text nor the memory use grows with the number of IDs.
+    :param patient_ids: an iterable of patient IDs, consumed lazily
+    :param connection_dict: psycopg2 connection parameters
+    :param sample_size: if set, count a uniform sample of at most this many IDs
+    :return: (distinct IDs, IDs in the history table), or None if the history table is empty
+    """
+    with db_session(connection_dict) as conn, conn.cursor() as cursor:
+        # handle special case where there are no records
+        cursor.execute("SELECT EXISTS (SELECT 1 FROM patients_history)")
+        if not cursor.fetchone()[0]:
+            return None
+
+        if sample_size:
+            patient_ids = reservoir_sample(patient_ids, sample_size)
+        cursor.execute("CREATE TEMPORARY TABLE patient_ids_stage (patient_id TEXT) ON COMMIT DROP")
+        copy_rows(PostgresCopySink(conn), 'patient_ids_stage',
+                  ({'patient_id': patient_id} for patient_id in map(str, patient_ids)), columns=['patient_id']
+                  )
+        cursor.execute("ANALYZE patient_ids_stage")
+        # as a semi join the planner can probe the patient_id index for small files and hash the history for large ones
+        cursor.execute("""
+            WITH distinct_ids AS MATERIALIZED (SELECT DISTINCT patient_id FROM patient_ids_stage)
+            SELECT (SELECT COUNT(*) FROM distinct_ids) AS total_values,
+                   (SELECT COUNT(*) FROM distinct_ids s
+                    WHERE EXISTS (SELECT 1 FROM patients_history h WHERE h.patient_id = s.patient_id)
+                   ) AS matching_values
+        """)
+        return cursor.fetchone()
+
+
+def _above_threshold(total_values, matching_values_count, threshold):
+    if not total_values:
+        return False
+    percentage = (matching_values_count / total_values) * 100
+    if percentage <= threshold:
+        LOG.info(f"Percent of patients in history table ({percentage:.1f}%) below threshold")
+    return percentage > threshold
+
+
+def percent_of_patients_above_threshold(patient_ids, threshold, connection_dict, sample_size=None):
+    """
+    Checks that the percentage of distinct patient IDs that are already in the history table is above a threshold,
+    see `count_patients_in_history`.
+    :param patient_ids: an iterable of patient IDs, consumed lazily
     :param threshold: percentage in the range of 0-100
+    :param connection_dict: psycopg2 connection parameters
+    :param sample_size: if set, estimate the percentage from a uniform sample of at most this many IDs
     :return: bool indicating whether the percentage was above threshold
     """
-    conn = psycopg2.connect(**connection_dict)
-
-    # handle special case where there are no records
-    sql_query = f"""
-    SELECT COUNT(*) AS count
-    FROM patients_history
-    """
-    with conn.cursor() as cursor:
-        cursor.execute(sql_query)
-        result = cursor.fetchone()
-        if result and result[0] == 0:
-            return True
-
-    sql_query = f"""
-    SELECT COUNT(*) AS count_matching_values
-    FROM patients_history
-    WHERE patient_id IN ({', '.join([f"'{s}'" for s in map(str, patient_ids)])});
-    """
-
-    with conn.cursor() as cursor:
-        cursor.execute(sql_query)
-        result = cursor.fetchone()
-        total_values_in_list = len(patient_ids)
-        if result:
-            matching_values_count = result[0]
-            percentage = (matching_values_count / total_values_in_list) * 100
-            return percentage > (threshold / 100)
-        else:
-            LOG.info("Percent of patients in history table below threshold")
-            return False
+    counts = count_patients_in_history(patient_ids, connection_dict, sample_size)
+    return True if counts is None else _above_threshold(*counts, threshold)
 
 
-if __name__ == "__main__":
-    ndjson_path = '/data/Claim.ndjson'
-    fhir_data = load_fhir_data(ndjson_path)
-    LOG.info(f"Loaded {len(fhir_data)} FHIR records.")
-
-    ingest_time = datetime.now()
-    output = []
-    processor = FHIRClaimProcessor(ingest_time)
-    for row_num, row in enumerate(fhir_data):
-        processed_data = processor.process(row, row_num)
-        output.append(processed_data)
-    if processor.total_warnings_below_threshold(5):
-        for processed_data in output:
-            upsert_claim(processed_data)
+def percent_of_routed_patients_above_threshold(patients, threshold, router, sample_size=None):
+    """
+    Variant of `percent_of_patients_above_threshold` for patients written to the database of their origin: the IDs
+    of every database are matched against its own history table and the counts are added up. Databases with an empty
+    history table are left out, and the check passes if all of them are empty.
+    :param patients: an iterable of processed patients with an `origin`
+    :param router: the OriginRouter the patients are written with
+    :param sample_size: if set, sample at most this many IDs per database
+    """
+    partitions = router.partition(patients)
+    try:
+        counts = [count_patients_in_history((patient['patient_id'] for origin in origins
+                                             for patient in partitions[origin]), connection_dict, sample_size)
+                  for connection_dict, origins in router.group_by_connection(partitions)]
+    finally:
+        for partition in partitions.values():
+            partition.close()
+    counts = [count for count in counts if count is not None]
+    if not counts:
+        return True
+    return _above_threshold(sum(total for total, _ in counts), sum(matching for _, matching in counts), threshold)
+
+
+def _write_rows(records, upsert_row, on_commit):
+    for rows_written, record in enumerate(records, 1):
+        upsert_row(record)
+        metrics.count('rows_written')
+        if on_commit:
+            # per-row upserts commit on their own, a crash between the two replays at most this row
+            with db_session(pg_connection_dict) as conn, conn.cursor() as cursor:
+                on_commit(cursor, rows_written)
+
+
+def _write_routed(records, write_partition):
+    """
+    Write the records of each origin in parallel with `origin_router`. The partitions of different databases cannot
+    share a transaction, so no checkpoint is advanced while they are written, see RoutedCheckpointStore; records of
+    an interrupted run are written again when it is resumed (unchanged ones are skipped by their content hash).
+    """
+    origin_router.write(records, write_partition)
+
+
+def write_claims(claims, on_commit=None):
+    if ORIGIN_ROUTING and UPSERT_MODE == 'bulk':
+        _write_routed(claims, lambda records, connection_dict: upsert_claims(records, connection_dict=connection_dict))
+    elif ORIGIN_ROUTING:
+        # upsert_claim connects to the database of the record's origin itself
+        _write_routed(claims, lambda records, connection_dict: _write_rows(records, upsert_claim, None))
+    elif UPSERT_MODE == 'bulk':
+        upsert_claims(claims, on_commit=on_commit)
     else:
-        LOG.warning(f"File at {ndjson_path} failed threshold checks")
-
-    # process patients
-    ndjson_path = '/data/Patient.ndjson'
-    fhir_data = load_fhir_data(ndjson_path)
-    LOG.info(f"Loaded {len(fhir_data)} FHIR records.")
-
-    ingest_time = datetime.now()
-    output = []
-    patient_ids = []
-    processor = FHIRPatientProcessor(ingest_time)
-    for row_num, row in enumerate(fhir_data):
-        processed_data = processor.process(row, row_num)
-        patient_ids.append(processed_data['patient_id'])
-        output.append(processed_data)
-
-    # checks that percent of patients seen before in the file being ingested is above 20% and the percent of warnings
-    # for records being ingested is less than 5% of total record count
-    if percent_of_patients_above_threshold(patient_ids, threshold=20, connection_dict=pg_connection_dict) and \
-        processor.total_warnings_below_threshold(5):
-        for processed_data in output:
-            upsert_patient(**processed_data)
+        _write_rows(claims, upsert_claim, on_commit)
+
+
+def write_patients(patients, on_commit=None):
+    upsert_row = lambda processed_data: upsert_patient(**processed_data)
+    if ORIGIN_ROUTING and UPSERT_MODE == 'bulk':
+        _write_routed(patients,
+                      lambda records, connection_dict: upsert_patients(records, connection_dict=connection_dict))
+    elif ORIGIN_ROUTING:
+        _write_routed(patients, lambda records, connection_dict: _write_rows(records, upsert_row, None))
+    elif UPSERT_MODE == 'bulk':
+        upsert_patients(patients, on_commit=on_commit)
     else:
-        LOG.warning(f"File at {ndjson_path} failed threshold checks")
+        _write_rows(patients, upsert_row, on_commit)
+
+
+def log_early_rejection(processor, ndjson_path):
+    evaluator = processor.threshold_evaluator
+    if evaluator is not None and evaluator.rejected:
+        LOG.warning(f"Stopped processing {ndjson_path} after {evaluator.rows_consumed} of {evaluator.total_rows} rows: "
+                    f"{processor.total_warnings} warnings, threshold check failed early ({evaluator.decision})")
+
+
+def claims_pass_checks(processor, claims):
+    return processor.total_warnings_below_threshold(WARNING_THRESHOLD)
+
+
+def patients_pass_checks(processor, patients):
+    # checks that the percent of warnings for records being ingested is less than 5% of total record count and
+    # percent of patients seen before in the file being ingested is above 20%; the cheaper check runs first
+    if not processor.total_warnings_below_threshold(WARNING_THRESHOLD):
+        return False
+    if writes_to_origin_databases():
+        # matched against the history of the databases the patients are written to
+        return percent_of_routed_patients_above_threshold(patients, threshold=20, router=origin_router,
+                                                          sample_size=PATIENT_COVERAGE_SAMPLE_SIZE)
+    patient_ids = (processed_data['patient_id'] for processed_data in patients)
+    return percent_of_patients_above_threshold(patient_ids, threshold=20, connection_dict=pg_connection_dict,
+                                               sample_size=PATIENT_COVERAGE_SAMPLE_SIZE)
+
+
+@contextmanager
+def deduplicated(records, key, mode=DEDUP_MODE):
+    """
+    Group the versions of `records` by `key` with a Deduplicator, unless the stage is turned off.
+    """
+    if not key or mode == 'off':
+        yield records
+        return
+    with Deduplicator(key, mode) as dedup:
+        dedup.extend(records)
+        LOG.info(f"Deduplicated {len(records)} records by {key}: writing {len(dedup)} records of {dedup.key_count()} "
+                 f"keys ({mode})")
+        yield dedup
+
+
+def ingest_file(ndjson_path, processor, write_records, passes_checks, checkpoints=None, key=None):
+    """
+    Process an NDJSON file and write it to the structured zone if it passes its checks.
+
+    Records are read, processed and spilled to disk one at a time; the spilled output is only read back (in chunks)
+    once the whole file has passed the threshold checks, so memory use does not grow with the file size.
+    With a `key`, the versions of each record are grouped (or collapsed to the last one) before writing, see
+    DEDUP_MODE.
+
+    With a CheckpointStore, files already ingested and unchanged since are skipped, and a file whose writing was
+    interrupted is resumed after its last committed chunk. It passed its checks in the interrupted run, so only the
+    remaining records are processed; with deduplication, the whole file is processed again and the records already
+    written are skipped, since the deduplicated order is not the file order.
+
+    Parameters:
+    - ndjson_path: Path to the NDJSON file containing FHIR data.
+    - processor: a FHIRResourceProcessor for the file's resource type.
+    - write_records: `write_records(records, on_commit=None)`, e.g. `write_claims`.
+    - passes_checks: `passes_checks(processor, records)` returning True if the file should be written.
+    - checkpoints: optional CheckpointStore.
+    - key: optional business key of the records, e.g. 'claim_id', to deduplicate them on.
+
+    With SILVER_ZONE_PATH set, every processed version of the records is also written to a silver zone file once the
+    file has passed its checks, see `write_silver_zone`. A resumed file was written there in the interrupted run.
+    """
+    identity = file_identity(ndjson_path)
+    checkpoint = checkpoints.load(identity) if checkpoints else None
+    if checkpoint and checkpoint.status == COMPLETE:
+        LOG.info(f"Skipping {ndjson_path}, it has not changed since it was ingested")
+        return
+
+    dedup_mode = DEDUP_MODE if key else 'off'
+    with SpillFile() as output:
+        if checkpoint:
+            first_row = checkpoint.rows_committed
+            LOG.info(f"Resuming {ndjson_path} after {first_row} committed rows")
+            start_row = first_row if dedup_mode == 'off' else 0
+            if is_compressed(ndjson_path):
+                start = row_byte_offset(ndjson_path, start_row)
+            else:
+                with IndexedNDJSON(ndjson_path) as ndjson:
+                    start, _ = ndjson.byte_range(start_row)
+            records = iter_ndjson(ndjson_path, start)
+            with metrics.timer('process'):
+                output.extend(processor.process_many(records, start_row, VALIDATION_BATCH_SIZE))
+        else:
+            first_row = 0
+            if THRESHOLD_EARLY_ABORT:
+                processor.start_threshold_evaluation(WARNING_THRESHOLD)
+            with metrics.timer('process'):
+                output.extend(process_fhir_data(processor, ndjson_path))
+            LOG.info(f"Processed {len(output)} FHIR records.")
+            metrics.count('rows_processed', processor.total_rows_processed)
+            metrics.count('warnings', processor.total_warnings)
+            processor.log_warning_summary(ndjson_path)
+            log_early_rejection(processor, ndjson_path)
+            with metrics.timer('checks'):
+                passed = passes_checks(processor, output)
+            if not passed:
+                metrics.count('files_rejected')
+                LOG.warning(f"File at {ndjson_path} failed threshold checks")
+                return
+            if SILVER_ZONE_PATH:
+                write_silver_zone(ndjson_path, processor, output, SILVER_ZONE_PATH, SILVER_ZONE_FORMAT)
+            if checkpoints:
+                checkpoints.start(identity)
+
+        with metrics.timer('write'), deduplicated(output, key, dedup_mode) as records:
+            if first_row and dedup_mode != 'off':
+                records = islice(records, first_row, None)
+            write_records(records, on_commit=checkpoints.on_commit(identity, first_row) if checkpoints else None)
+        if checkpoints:
+            checkpoints.complete(identity)
+
+
+def ingest_file_pipelined(ndjson_path, processor, apply_chunk, passes_checks, checkpoints=None,
+                          queue_size=PIPELINE_QUEUE_SIZE):
+    """
+    Variant of `ingest_file` that reads, parses, processes and writes chunks of `UPSERT_CHUNK_SIZE` lines
+    concurrently, in the stages of `common.pipeline.run_pipeline`, instead of processing the whole file before
+    writing it.
+
+    Chunks are written in file order as they are processed, in a single transaction that is only committed once the
+    whole file has passed its checks, and rolled back otherwise; a file rejected early by the threshold evaluation
+    stops the pipeline. Every version of a record is written, as with DEDUP_MODE 'off', and records are processed in
+    this process (INGEST_WORKERS is ignored). As the file is committed at once, a CheckpointStore only skips files
+    that were completely ingested before; an interrupted file is ingested again from its first row.
+
+    Parameters:
+    - ndjson_path: Path to the NDJSON file containing FHIR data.
+    - processor: a FHIRResourceProcessor for the file's resource type.
+    - apply_chunk: bulk chunk function, e.g. `_upsert_claims_chunk`.
+    - passes_checks: `passes_checks(processor, records)` returning True if the file should be written.
+    - checkpoints: optional CheckpointStore.
+    - queue_size: chunks buffered between two stages before the earlier stage waits, see PIPELINE_QUEUE_SIZE.
+
+    Returns:
+    - The StageStats of the read, parse, process and write stages.
+    """
+    identity = file_identity(ndjson_path)
+    checkpoint = checkpoints.load(identity) if checkpoints else None
+    if checkpoint and checkpoint.status == COMPLETE:
+        LOG.info(f"Skipping {ndjson_path}, it has not changed since it was ingested")
+        return None
+    if THRESHOLD_EARLY_ABORT:
+        processor.start_threshold_evaluation(WARNING_THRESHOLD, row_count(ndjson_path))
+
+    decoder = get_decoder()
+    lines = (line for batch in iter_line_batches(ndjson_path) for line in batch)
+    counters = {'next_row': 0, 'rows_written': 0, 'rows_changed': 0}
+
+    def process(records):
+        first_row = counters['next_row']
+        counters['next_row'] += len(records)
+        processed = list(processor.process_many(records, first_row, VALIDATION_BATCH_SIZE))
+        if processor.threshold_exceeded():
+            raise StopPipeline()
+        return processed
+
+    with SpillFile() as output, db_session(pg_connection_dict) as conn, conn.cursor() as cursor:
+        def write(records):
+            if not records:
+                return
+            counters['rows_changed'] += _apply_chunk_in_transaction(cursor, apply_chunk, records)
+            counters['rows_written'] += len(records)
+            output.extend(records)
+
+        stats, stopped = run_pipeline(chunked(lines, UPSERT_CHUNK_SIZE), [
+                ('parse', lambda batch: decode_lines(batch, decoder)),
+                ('process', process),
+                ('write', write),
+        ], queue_size)
+
+        LOG.info(f"Processed {processor.total_rows_processed} FHIR records.")
+        metrics.count('rows_processed', processor.total_rows_processed)
+        metrics.count('warnings', processor.total_warnings)
+        for stage in stats:
+            metrics.current().add_time(f'pipeline_{stage.name}', stage.busy_seconds)
+        processor.log_warning_summary(ndjson_path)
+        log_early_rejection(processor, ndjson_path)
+        with metrics.timer('checks'):
+            passed = not stopped and passes_checks(processor, output)
+        if not passed:
+            conn.rollback()
+            metrics.count('files_rejected')
+            LOG.warning(f"File at {ndjson_path} failed threshold checks, rolled back {counters['rows_written']} rows")
+            return stats
+        if SILVER_ZONE_PATH:
+            write_silver_zone(ndjson_path, processor, output, SILVER_ZONE_PATH, SILVER_ZONE_FORMAT)
+        if checkpoints:
+            checkpoints.finish(identity, cursor, counters['rows_written'])
+        metrics.count('rows_written', counters['rows_written'])
+        metrics.count('rows_changed', counters['rows_changed'])
+        LOG.info(f"Upserted {counters['rows_changed']} new or changed of {counters['rows_written']} rows")
+    return stats
+
+
+if __name__ == "__main__":
+    with metrics.instrumented_run():
+        # records are written to the database of their origin, see origin_router
+        for connection_dict in origin_router.connection_dicts():
+            ensure_history_partitions(datetime.now(), connection_dict)
+        checkpoints = None
+        if INGEST_CHECKPOINTS and writes_to_origin_databases():
+            checkpoints = RoutedCheckpointStore(origin_router.connection_dicts())
+        elif INGEST_CHECKPOINTS:
+            checkpoints = CheckpointStore(pg_connection_dict)
+
+        if INGEST_PIPELINE:
+            ingest_file_pipelined('/data/Claim.ndjson', FHIRClaimProcessor(datetime.now()), _upsert_claims_chunk,
+                                  claims_pass_checks, checkpoints
+                                  )
+            ingest_file_pipelined('/data/Patient.ndjson', FHIRPatientProcessor(datetime.now()), _upsert_patients_chunk,
+                                  patients_pass_checks, checkpoints
+                                  )
+        else:
+            ingest_file('/data/Claim.ndjson', FHIRClaimProcessor(datetime.now()), write_claims, claims_pass_checks,
+                        checkpoints, key='claim_id'
+                        )
+            ingest_file('/data/Patient.ndjson', FHIRPatientProcessor(datetime.now()), write_patients,
+                        patients_pass_checks, checkpoints, key='patient_id'
+                        )
+
+        close_pools()
@@ -0,0 +1,244 @@
+import os
+import re
+import time
+from datetime import date, datetime, timezone
+from decimal import Decimal, InvalidOperation
+
+from common.utils import TransformerLogger
+from writers.copy_loader import LoadStats
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:  # optional, only needed to write the silver zone as files
+    pa = pq = None
+
+LOG = TransformerLogger(__name__)
+
+FORMATS = ('parquet', 'arrow')
+EXTENSIONS = {'parquet': '.parquet', 'arrow': '.arrow'}
+# rows per Parquet row group or Arrow record batch
+SILVER_ZONE_ROW_GROUP_SIZE = int(os.getenv('SILVER_ZONE_ROW_GROUP_SIZE') or 65536)
+
+# columns of the processed rows of each resource type and their types, as in the tables of init.sql
+RESOURCE_COLUMNS = {
+        'Claim': (
+                ('origin', 'int'),
+                ('claim_id', 'string'),
+                ('patient_id', 'string'),
+                ('billing_start', 'date'),
+                ('billing_end', 'date'),
+                ('provider', 'string'),
+                ('admitting_diagnosis', 'string'),
+                ('insurance', 'string'),
+                ('status', 'string'),
+                ('created', 'timestamp'),
+                ('amount', 'decimal'),
+        ),
+        'Patient': (
+                ('origin', 'int'),
+                ('first_name', 'string'),
+                ('last_name', 'string'),
+                ('patient_id', 'string'),
+        ),
+}
+
+CENT = Decimal('0.01')
+# NUMERIC(10, 2)
+MAX_AMOUNT = Decimal('99999999.99')
+
+
+def _arrow_type(type_name):
+    return {
+            'int': pa.int32,
+            'string': pa.string,
+            'date': pa.date32,
+            'timestamp': lambda: pa.timestamp('us', tz='UTC'),
+            'decimal': lambda: pa.decimal128(10, 2),
+    }[type_name]()
+
+
+def _to_int(value):
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def _to_string(value):
+    return value if type(value) is str else str(value)
+
+
+def _to_date(value):
+    try:
+        return date.fromisoformat(value) if len(value) == 10 else None
+    except (TypeError, ValueError):
+        return None
+
+
+# date and time, fraction and offset of an ISO8601 datetime, see field_mappers.base.ISO8601_PATTERN
+TIMESTAMP_PARTS = re.compile(r'^(.+T\d\d:\d\d:\d\d)(?:\.(\d+))?(?:(Z)|([+-]\d\d):?(\d\d))?$')
+
+
+def _to_timestamp(value):
+    # datetime.fromisoformat only accepts 'Z', offsets without a colon and fractions that are not 3 or 6 digits long
+    # from Python 3.11 on
+    try:
+        parts = TIMESTAMP_PARTS.match(value)
+        if parts is None:
+            return None
+        moment, fraction, utc, offset_hours, offset_minutes = parts.groups()
+        if fraction:
+            moment += '.' + fraction[:6].ljust(6, '0')
+        if utc:
+            moment += '+00:00'
+        elif offset_hours:
+            moment += f'{offset_hours}:{offset_minutes}'
+        timestamp = datetime.fromisoformat(moment)
+    except (TypeError, ValueError):
+        return None
+    # values without an offset are taken as UTC
+    return timestamp.astimezone(timezone.utc) if timestamp.tzinfo else timestamp.replace(tzinfo=timezone.utc)
+
+
+def _to_decimal(value):
+    try:
+        amount = Decimal(str(value)).quantize(CENT)
+    except (InvalidOperation, ValueError):
+        return None
+    return amount if abs(amount) <= MAX_AMOUNT else None
+
+
+CONVERTERS = {
+        'int': _to_int,
+        'string': _to_string,
+        'date': _to_date,
+        'timestamp': _to_timestamp,
+        'decimal': _to_decimal,
+}
+
+
+def partition_path(root, resource, ingest_date, name, file_format='parquet'):
+    """
+    Path of a silver zone file, in Hive-style partitions by resource type and ingest date, e.g.
+    `{root}/resource=Claim/ingest_date=2024-05-01/Claim.parquet`.
+    """
+    return os.path.join(root, f"resource={resource}", f"ingest_date={ingest_date.isoformat()}",
+                        name + EXTENSIONS[file_format])
+
+
+class ColumnarFileWriter:
+    """
+    Streams the processed rows of one resource type into a Parquet or Arrow IPC file of the silver zone, so
+    consumer zone jobs can read them without querying PostgreSQL.
+
+    Rows are buffered and written a row group (`row_group_size` rows) at a time, with the column types of the
+    structured zone tables (`RESOURCE_COLUMNS`). Values that cannot be converted, e.g. an invalid date, are written as
+    null and counted per column in `invalid_values`. The file is written under a temporary name and renamed by
+    `close`, so readers never see a partial file and writing the same input again replaces it.
+    """
+
+    def __init__(self, root, resource, name, ingest_date=None, file_format='parquet',
+                 row_group_size=SILVER_ZONE_ROW_GROUP_SIZE):
+        if pa is None:
+            raise ImportError("Writing the silver zone as files requires pyarrow")
+        if file_format not in FORMATS:
+            raise ValueError(f"Unsupported format '{file_format}', expected one of {FORMATS}")
+        if resource not in RESOURCE_COLUMNS:
+            raise ValueError(f"No silver zone columns for resource type '{resource}'")
+        self.columns = RESOURCE_COLUMNS[resource]
+        self.schema = pa.schema([(column, _arrow_type(type_name)) for column, type_name in self.columns])
+        self.path = partition_path(root, resource, ingest_date or date.today(), name, file_format)
+        self.row_group_size = row_group_size
+        self.rows = 0
+        self.invalid_values = {}
+        self._buffer = []
+        self._tmp_path = self.path + '.tmp'
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        if file_format == 'parquet':
+            self._writer = pq.ParquetWriter(self._tmp_path, self.schema, compression='snappy')
+        else:
+            self._writer = pa.ipc.new_file(self._tmp_path, self.schema)
+
+    def write(self, row):
+        self._buffer.append(row)
+        if len(self._buffer) >= self.row_group_size:
+            self.flush()
+
+    def write_many(self, rows):
+        for row in rows:
+            self.write(row)
+
+    def flush(self):
+        """
+        Write the buffered rows as one row group.
+        """
+        if not self._buffer:
+            return
+        batch = self._to_batch(self._buffer)
+        if isinstance(self._writer, pq.ParquetWriter):
+            self._writer.write_batch(batch, row_group_size=len(self._buffer))
+        else:
+            self._writer.write_batch(batch)
+        self.rows += len(self._buffer)
+        self._buffer = []
+
+    def _to_batch(self, rows):
+        arrays = []
+        for (column, type_name), field in zip(self.columns, self.schema):
+            convert = CONVERTERS[type_name]
+            values = [row.get(column) for row in rows]
+            converted = [None if value is None else convert(value) for value in values]
+            invalid = sum(1 for value, result in zip(values, converted) if value is not None and result is None)
+            if invalid:
+                self.invalid_values[column] = self.invalid_values.get(column, 0) + invalid
+            arrays.append(pa.array(converted, type=field.type))
+        return pa.RecordBatch.from_arrays(arrays, schema=self.schema)
+
+    def close(self):
+        """
+        Write the remaining rows and publish the file under its final name.
+        """
+        self.flush()
+        self._writer.close()
+        os.replace(self._tmp_path, self.path)
+        if self.invalid_values:
+            LOG.warning(f"Wrote invalid values as null in {self.path}: {self.invalid_values}")
+
+    def abort(self):
+        """
+        Discard the file, e.g. after an error while writing it.
+        """
+        self._writer.close()
+        if os.path.exists(self._tmp_path):
+            os.remove(self._tmp_path)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        if exc_type is None:
+            self.close()
+        else:
+            self.abort()
+
+
+def write_columnar(root, resource, rows, name, ingest_date=None, file_format='parquet',
+                   row_group_size=SILVER_ZONE_ROW_GROUP_SIZE):
+    """
+    Write an iterable of processed rows to a silver zone file, see ColumnarFileWriter.
+
+    :param root: directory (or mounted bucket prefix) of the silver zone
+    :param resource: FHIR resource type of the rows, a key of RESOURCE_COLUMNS
+    :param rows: iterable of row mappings, consumed lazily
+    :param name: file name without extension, e.g. the name of the input file
+    :param ingest_date: date partition, defaults to today
+    :return: LoadStats with the number of rows written and the throughput, and the path of the file
+    """
+    start = time.perf_counter()
+    with ColumnarFileWriter(root, resource, name, ingest_date, file_format, row_group_size) as writer:
+        writer.write_many(rows)
+    seconds = time.perf_counter() - start
+    stats = LoadStats(writer.rows, seconds, writer.rows / seconds if seconds else 0.0)
+    LOG.info(f"Wrote {stats.rows} rows to {writer.path} in {stats.seconds:.2f}s ({stats.rows_per_second:.0f} rows/s)")
+    return stats, writer.path
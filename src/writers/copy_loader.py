@@ -0,0 +1,144 @@
+import time
+from abc import ABC, abstractmethod
+from collections import namedtuple
+from itertools import chain
+
+from psycopg2 import sql
+
+from common.utils import TransformerLogger
+
+LOG = TransformerLogger(__name__)
+
+LoadStats = namedtuple('LoadStats', ['rows', 'seconds', 'rows_per_second'])
+
+COPY_MODES = ('replace', 'append')
+
+
+def _encode_text(value):
+    """
+    Encode a value for the COPY text format: NULL is \\N, and backslashes and control characters are escaped.
+    """
+    if value is None:
+        return '\\N'
+    return str(value).replace('\\', '\\\\').replace('\t', '\\t').replace('\n', '\\n').replace('\r', '\\r')
+
+
+class CopyTextStream:
+    """
+    File-like object that renders rows in the COPY text format as they are read, so rows can be streamed into
+    COPY FROM STDIN without building the whole payload (or a DataFrame) in memory.
+    """
+
+    def __init__(self, rows, columns):
+        self.rows = iter(rows)
+        self.columns = columns
+        self.rows_read = 0
+        self._buffer = ''
+
+    def _encode_row(self, row):
+        return '\t'.join(_encode_text(row.get(column)) for column in self.columns) + '\n'
+
+    def read(self, size=-1):
+        lines = [self._buffer]
+        buffered = len(self._buffer)
+        for row in self.rows:
+            line = self._encode_row(row)
+            lines.append(line)
+            buffered += len(line)
+            self.rows_read += 1
+            if 0 <= size <= buffered:
+                break
+        data = ''.join(lines)
+        if size < 0:
+            self._buffer = ''
+            return data
+        self._buffer = data[size:]
+        return data[:size]
+
+
+class CopySink(ABC):
+    """
+    Destination of a bulk load, so the loader can be exercised without a database.
+    """
+
+    @abstractmethod
+    def truncate(self, table):
+        pass
+
+    @abstractmethod
+    def copy(self, table, columns, stream):
+        pass
+
+    def table_columns(self, table):
+        """
+        Columns of `table`, or None if the sink does not know them.
+        """
+        return None
+
+
+class PostgresCopySink(CopySink):
+    """
+    Loads rows into PostgreSQL with COPY FROM STDIN on an open psycopg2 connection.
+    The caller owns the transaction, so truncate and copy are committed (or rolled back) together.
+    """
+
+    def __init__(self, conn):
+        self.conn = conn
+
+    def truncate(self, table):
+        with self.conn.cursor() as cursor:
+            cursor.execute(sql.SQL("TRUNCATE {}").format(sql.Identifier(table)))
+
+    def table_columns(self, table):
+        with self.conn.cursor() as cursor:
+            cursor.execute("""
+                SELECT attname FROM pg_attribute
+                WHERE attrelid = %s::regclass AND attnum > 0 AND NOT attisdropped
+                ORDER BY attnum
+            """, (table,)
+                           )
+            return [row[0] for row in cursor.fetchall()]
+
+    def copy(self, table, columns, stream):
+        query = sql.SQL("COPY {} ({}) FROM STDIN").format(
+                sql.Identifier(table), sql.SQL(', ').join(map(sql.Identifier, columns))
+        )
+        with self.conn.cursor() as cursor:
+            cursor.copy_expert(query, stream)
+
+
+def copy_rows(sink, table, rows, columns=None, mode='append'):
+    """
+    Bulk load an iterable of row dictionaries into `table`.
+
+    :param sink: a CopySink, e.g. PostgresCopySink
+    :param table: name of the destination table, which must already exist
+    :param rows: iterable of dictionaries, consumed lazily
+    :param columns: columns to load, defaults to the keys of the first row that are columns of the table, so
+                    processed rows can be loaded with their extra keys (e.g. `origin`) left out
+    :param mode: 'replace' empties the table before loading, 'append' keeps the existing rows
+    :return: LoadStats with the number of rows loaded and the throughput
+    """
+    if mode not in COPY_MODES:
+        raise ValueError(f"Unsupported mode '{mode}', expected one of {COPY_MODES}")
+    rows = iter(rows)
+    start = time.perf_counter()
+    if mode == 'replace':
+        # replacing with no rows still empties the table
+        sink.truncate(table)
+    if columns is None:
+        first_row = next(rows, None)
+        if first_row is None:
+            return LoadStats(0, 0.0, 0.0)
+        table_columns = sink.table_columns(table)
+        columns = [column for column in first_row if table_columns is None or column in table_columns]
+        if not columns:
+            raise ValueError(f"None of the keys of the rows {list(first_row)} are columns of {table}")
+        rows = chain([first_row], rows)
+
+    stream = CopyTextStream(rows, columns)
+    sink.copy(table, columns, stream)
+    seconds = time.perf_counter() - start
+    stats = LoadStats(stream.rows_read, seconds, stream.rows_read / seconds if seconds else 0.0)
+    LOG.info(f"Loaded {stats.rows} rows into {table} in {stats.seconds:.2f}s ({stats.rows_per_second:.0f} rows/s)")
+    return stats
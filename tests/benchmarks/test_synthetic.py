@@ -0,0 +1,62 @@
+import json
+import logging
+from datetime import datetime
+
+import pytest
+
+from benchmarks.harness import MemorySink, SQLiteSink, run
+from benchmarks.synthetic import generate, write_ndjson
+from field_mappers.claim_processor import FHIRClaimProcessor
+from field_mappers.patient_processor import FHIRPatientProcessor
+
+
+def test_generator_is_reproducible():
+    assert list(generate('Claim', 50, seed=3, duplicate_rate=0.2)) == list(generate('Claim', 50, seed=3,
+                                                                                       duplicate_rate=0.2))
+    assert list(generate('Claim', 50, seed=3)) != list(generate('Claim', 50, seed=4))
+    with pytest.raises(ValueError):
+        list(generate('Observation', 1))
+
+
+@pytest.mark.parametrize('resource, processor_cls', [('Claim', FHIRClaimProcessor),
+                                                     ('Patient', FHIRPatientProcessor)])
+def test_every_error_row_has_one_warning(resource, processor_cls):
+    logging.disable(logging.CRITICAL)
+    try:
+        clean = processor_cls(datetime.now())
+        list(clean.process_many(generate(resource, 500, null_rate=0.3), batch_size=100))
+        assert clean.total_warnings == 0
+
+        faulty = processor_cls(datetime.now())
+        list(faulty.process_many(generate(resource, 500, null_rate=0.3, error_rate=0.1), batch_size=100))
+    finally:
+        logging.disable(logging.NOTSET)
+    error_rows = 500 - sum(1 for clean_record, record in zip(generate(resource, 500, null_rate=0.3),
+                                                             generate(resource, 500, null_rate=0.3, error_rate=0.1))
+                           if clean_record == record)
+    assert 20 < error_rows < 80
+    assert faulty.total_warnings == faulty.rows_with_warnings == error_rows
+
+
+def test_duplicates_resend_earlier_ids():
+    ids = [record['id'] for record in generate('Patient', 1000, duplicate_rate=0.25)]
+    assert 650 < len(set(ids)) < 850
+
+
+@pytest.mark.parametrize('sink_cls', [MemorySink, SQLiteSink])
+def test_run_writes_the_last_version_of_every_record(tmp_path, sink_cls):
+    path = str(tmp_path / 'Claim.ndjson')
+    write_ndjson(path, generate('Claim', 300, duplicate_rate=0.2))
+    ids = {json.loads(line)['id'] for line in open(path)}
+    sink = sink_cls()
+    try:
+        result = run('Claim', path, sink, batch_size=100, chunk_size=64)
+        if isinstance(sink, MemorySink):
+            assert set(sink.tables['claims']) == ids
+        else:
+            assert sink.db.execute("SELECT COUNT(*) FROM claims").fetchone()[0] == len(ids)
+    finally:
+        sink.close()
+    assert result['rows'] == 300
+    assert set(result['stages']) == {'parse', 'validate', 'map', 'normalize', 'write'}
+    assert all(stage['seconds'] > 0 for stage in result['stages'].values())
@@ -0,0 +1,48 @@
+import os
+import tempfile
+import unittest
+
+import psycopg2
+
+from common.metrics import instrumented_run
+from common.db import close_pools, db_session, get_pool
+from structured_zone_transformer import pg_connection_dict
+
+
+class TestDbSession(unittest.TestCase):
+    @classmethod
+    def tearDownClass(cls):
+        close_pools()
+
+    def test_sessions_reuse_pooled_connections(self):
+        with db_session(pg_connection_dict) as conn:
+            first_backend = conn.get_backend_pid()
+        with db_session(pg_connection_dict) as conn:
+            self.assertEqual(conn.get_backend_pid(), first_backend)
+        self.assertIs(get_pool(pg_connection_dict), get_pool(dict(pg_connection_dict)))
+
+    def test_session_rolls_back_on_error(self):
+        with self.assertRaises(RuntimeError):
+            with db_session(pg_connection_dict) as conn, conn.cursor() as cursor:
+                cursor.execute("INSERT INTO patients_history (first_name, last_name, patient_id) "
+                               "VALUES ('Pool', 'Rollback', 'pool-rollback')")
+                raise RuntimeError("abort")
+        with db_session(pg_connection_dict) as conn, conn.cursor() as cursor:
+            cursor.execute("SELECT COUNT(*) FROM patients_history WHERE patient_id = 'pool-rollback'")
+            self.assertEqual(cursor.fetchone()[0], 0)
+
+    def test_close_pools_discards_pools(self):
+        pool = get_pool(pg_connection_dict)
+        close_pools()
+        self.assertIsNot(get_pool(pg_connection_dict), pool)
+
+    def test_round_trips_are_counted_while_metrics_are_collected(self):
+        with tempfile.TemporaryDirectory() as directory:
+            with instrumented_run(os.path.join(directory, 'run.json'), None, None) as run:
+                with db_session(pg_connection_dict) as conn, conn.cursor() as cursor:
+                    cursor.execute("SELECT 1")
+                    cursor.execute("SELECT 2")
+            self.assertEqual(run.counters, {'db_transactions': 1, 'db_round_trips': 2})
+        # without metrics, sessions use plain cursors again
+        with db_session(pg_connection_dict) as conn, conn.cursor() as cursor:
+            self.assertIs(type(cursor), psycopg2.extensions.cursor)
@@ -0,0 +1,31 @@
+import pytest
+
+from common.dedup import Deduplicator
+
+RECORDS = [{"claim_id": "a", "v": 1}, {"claim_id": "b", "v": 1}, {"claim_id": None, "v": 1},
+           {"claim_id": "a", "v": 2}, {"claim_id": "c", "v": 1}, {"claim_id": None, "v": 2},
+           {"claim_id": "b", "v": 2}, {"claim_id": "a", "v": 3}]
+
+
+@pytest.mark.parametrize("max_in_memory", [100, 3, 0])
+def test_all_mode_groups_versions_by_first_occurrence(tmp_path, max_in_memory):
+    with Deduplicator("claim_id", "all", max_in_memory, tmp_path) as dedup:
+        dedup.extend(RECORDS)
+        assert [[(record["claim_id"], record["v"]) for record in group] for group in dedup.groups()] == [
+                [("a", 1), ("a", 2), ("a", 3)], [("b", 1), ("b", 2)], [(None, 1)], [("c", 1)], [(None, 2)]]
+        assert len(dedup) == len(RECORDS) and dedup.key_count() == 5
+    assert list(tmp_path.iterdir()) == []
+
+
+@pytest.mark.parametrize("max_in_memory", [100, 3, 0])
+def test_final_mode_keeps_last_version_by_last_occurrence(tmp_path, max_in_memory):
+    with Deduplicator("claim_id", "final", max_in_memory, tmp_path) as dedup:
+        dedup.extend(RECORDS)
+        assert [(record["claim_id"], record["v"]) for record in dedup] == [
+                (None, 1), ("c", 1), (None, 2), ("b", 2), ("a", 3)]
+        assert len(dedup) == dedup.key_count() == 5
+
+
+def test_unknown_mode():
+    with pytest.raises(ValueError):
+        Deduplicator("claim_id", "off")
@@ -0,0 +1,59 @@
+import json
+import os
+import pstats
+import threading
+
+from common import metrics
+from common.metrics import Metrics, NullMetrics, instrumented_run
+
+
+def test_timers_and_counters_are_thread_safe():
+    run = Metrics()
+
+    def work():
+        for _ in range(1000):
+            with run.timer('stage'):
+                run.count('rows')
+
+    threads = [threading.Thread(target=work) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    report = run.report()
+    assert report['timers']['stage']['calls'] == 4000
+    assert report['counters'] == {'rows': 4000}
+
+
+def test_disabled_metrics_record_nothing():
+    assert isinstance(metrics.current(), NullMetrics)
+    with metrics.timer('stage'):
+        metrics.count('rows', 10)
+    assert not hasattr(metrics.current(), 'counters')
+
+
+def test_instrumented_run_writes_reports(tmp_path):
+    report_path, prometheus_path, profile_path = (str(tmp_path / name) for name in ('run.json', 'run.prom', 'prof'))
+    with instrumented_run(report_path, prometheus_path, profile_path) as run:
+        assert metrics.current() is run
+        with metrics.timer('process'):
+            metrics.count('rows_processed', 3)
+            metrics.count('rows_processed', 2)
+    assert isinstance(metrics.current(), NullMetrics)
+
+    with open(report_path) as file:
+        report = json.load(file)
+    assert report['counters'] == {'rows_processed': 5}
+    assert report['timers']['process']['calls'] == 1
+    with open(prometheus_path) as file:
+        prometheus = file.read().splitlines()
+    assert 'fhir_ingest_rows_processed_total 5' in prometheus
+    assert any(line.startswith('fhir_ingest_stage_seconds_total{stage="process"} ') for line in prometheus)
+    assert not os.path.exists(prometheus_path + '.tmp')
+    assert pstats.Stats(profile_path).total_calls > 0
+
+
+def test_instrumented_run_without_paths_stays_disabled():
+    with instrumented_run(None, None, None) as run:
+        assert isinstance(run, NullMetrics)
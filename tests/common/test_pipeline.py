@@ -0,0 +1,63 @@
+import threading
+
+import pytest
+
+from common.pipeline import StopPipeline, run_pipeline
+
+
+def test_chunks_go_through_every_stage_in_order():
+    written = []
+    stats, stopped = run_pipeline(([n, n + 1] for n in range(0, 20, 2)), [
+            ('double', lambda chunk: [value * 2 for value in chunk]),
+            ('write', written.extend),
+    ], queue_size=1)
+
+    assert written == [value * 2 for value in range(20)]
+    assert not stopped
+    assert [stage.name for stage in stats] == ['read', 'double', 'write']
+    assert [(stage.chunks, stage.rows) for stage in stats] == [(10, 20)] * 3
+
+
+def test_stages_run_concurrently():
+    # the first chunk can only be written once the second one is being processed
+    second_chunk_processed = threading.Event()
+
+    def process(chunk):
+        if chunk == [2]:
+            second_chunk_processed.set()
+        return chunk
+
+    def write(chunk):
+        assert second_chunk_processed.wait(timeout=5)
+
+    stats, stopped = run_pipeline([[1], [2]], [('process', process), ('write', write)])
+    assert stats[-1].chunks == 2
+
+
+def test_stop_pipeline_stops_early():
+    written = []
+
+    def process(chunk):
+        if chunk == [3]:
+            raise StopPipeline()
+        return chunk
+
+    def source():
+        for n in range(1000):
+            yield [n]
+
+    stats, stopped = run_pipeline(source(), [('process', process), ('write', written.extend)], queue_size=2)
+    assert stopped
+    # chunks still queued when the pipeline stops are dropped
+    assert written == list(range(len(written)))
+    assert len(written) <= 3
+    # backpressure: the reader is stopped a bounded number of chunks ahead
+    assert stats[0].chunks < 10
+
+
+def test_stage_errors_are_raised():
+    def write(chunk):
+        raise ValueError("bad chunk")
+
+    with pytest.raises(ValueError, match="bad chunk"):
+        run_pipeline([[1], [2]], [('write', write)])
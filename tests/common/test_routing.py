@@ -0,0 +1,74 @@
+import threading
+
+import pytest
+
+from common.routing import OriginRouter, load_routes
+
+DEFAULT = {'dbname': 'structured', 'user': 'user', 'host': 'localhost'}
+
+
+def test_load_routes():
+    assert load_routes(None) == {}
+    assert load_routes('{"2": {"dbname": "hospital_2"}}') == {'2': {'dbname': 'hospital_2'}}
+    with pytest.raises(ValueError):
+        load_routes('[1, 2]')
+
+
+def test_connection_dict_for_origin():
+    router = OriginRouter(DEFAULT, {2: {'dbname': 'hospital_2'}, '3': {'schema': 'tenant_3'}})
+    assert router.connection_dict_for(1) == DEFAULT
+    assert router.connection_dict_for(None) == DEFAULT
+    assert router.connection_dict_for(2) == dict(DEFAULT, dbname='hospital_2')
+    assert router.connection_dict_for(3) == dict(DEFAULT, options='-c search_path=tenant_3')
+
+
+def test_origins_are_grouped_by_connection():
+    router = OriginRouter(DEFAULT, {2: {'dbname': 'hospital_2'}, 3: {'schema': 'tenant_3'},
+                                    4: {'dbname': 'hospital_2'}})
+    assert router.group_by_connection([1, 2, 3, 4, 5]) == [
+            (DEFAULT, [1, 5]),
+            (dict(DEFAULT, dbname='hospital_2'), [2, 4]),
+            (dict(DEFAULT, options='-c search_path=tenant_3'), [3]),
+    ]
+    assert router.connection_dicts() == [DEFAULT, dict(DEFAULT, dbname='hospital_2'),
+                                         dict(DEFAULT, options='-c search_path=tenant_3')]
+    assert OriginRouter(DEFAULT, {}).connection_dicts() == [DEFAULT]
+
+
+def test_partition_keeps_order_within_origin():
+    records = [{'origin': origin, 'n': n} for n, origin in enumerate([1, 2, 1, 3, 2, 1])]
+    partitions = OriginRouter.partition(records)
+    try:
+        assert list(partitions) == [1, 2, 3]
+        assert [[record['n'] for record in partition] for partition in partitions.values()] == [[0, 2, 5], [1, 4], [3]]
+    finally:
+        for partition in partitions.values():
+            partition.close()
+
+
+def test_write_partitions_in_parallel():
+    router = OriginRouter(DEFAULT, {2: {'dbname': 'hospital_2'}}, max_workers=2)
+    both_started = threading.Barrier(2, timeout=5)
+    written = {}
+
+    def write_partition(records, connection_dict):
+        both_started.wait()
+        written[connection_dict['dbname']] = [record['n'] for record in records]
+
+    stats = router.write([{'origin': origin, 'n': n} for n, origin in enumerate([1, 2, 2, 1, 1])], write_partition)
+    assert written == {'structured': [0, 3, 4], 'hospital_2': [1, 2]}
+    assert [(tenant.origin, tenant.rows) for tenant in stats] == [(1, 3), (2, 2)]
+
+
+def test_failed_partition_does_not_stop_the_others():
+    router = OriginRouter(DEFAULT, {2: {'dbname': 'hospital_2'}})
+    written = []
+
+    def write_partition(records, connection_dict):
+        if connection_dict['dbname'] == 'hospital_2':
+            raise RuntimeError("hospital_2 is down")
+        written.extend(records)
+
+    with pytest.raises(RuntimeError, match="hospital_2 is down"):
+        router.write([{'origin': 2}, {'origin': 1}, {'origin': 1}], write_partition)
+    assert written == [{'origin': 1}, {'origin': 1}]
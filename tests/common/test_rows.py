@@ -0,0 +1,56 @@
+import json
+import pickle
+import sys
+
+import pytest
+
+from common.rows import make_row_class, row_to_json
+from field_mappers.claim_processor import ClaimRow
+from field_mappers.patient_processor import FHIRPatientProcessor, PatientRow
+
+SampleRow = make_row_class('SampleRow', ['origin', 'patient_id', 'first_name'], __name__)
+
+
+def test_rows_behave_like_read_only_dicts():
+    row = SampleRow(1, 'p1', None)
+    assert row['patient_id'] == 'p1'
+    assert row.get('first_name', 'x') is None
+    assert row.get('missing', 'x') == 'x'
+    assert 'origin' in row and 'missing' not in row and 'get' not in row
+    assert list(row) == ['origin', 'patient_id', 'first_name']
+    assert dict(row) == row.as_dict() == {'origin': 1, 'patient_id': 'p1', 'first_name': None}
+    assert row == {'origin': 1, 'patient_id': 'p1', 'first_name': None}
+    assert dict(row, first_name='A') == {'origin': 1, 'patient_id': 'p1', 'first_name': 'A'}
+    assert (lambda **columns: columns)(**row) == dict(row)
+    with pytest.raises(KeyError):
+        row['get']
+
+    with pytest.raises(TypeError):
+        row['first_name'] = 'B'
+    with pytest.raises(AttributeError):
+        row.last_name = 'C'
+
+
+def test_rows_are_compact_and_serializable():
+    row = SampleRow(1, 'p1', 'A')
+    assert not hasattr(row, '__dict__')
+    assert sys.getsizeof(row) < sys.getsizeof(dict(row)) / 2
+    assert pickle.loads(pickle.dumps(row)) == row
+    assert json.loads(json.dumps(row, default=row_to_json)) == dict(row)
+    with pytest.raises(TypeError):
+        json.dumps(object(), default=row_to_json)
+
+
+def test_invalid_columns_are_rejected():
+    with pytest.raises(ValueError):
+        make_row_class('Bad', ['origin', 'class'], __name__)
+    with pytest.raises(ValueError):
+        make_row_class('Bad', ['_fields'], __name__)
+
+
+def test_processors_emit_picklable_rows():
+    processor = FHIRPatientProcessor(None)
+    row, = processor.process_many([{"resourceType": "Patient", "id": "p1", "name": [{"given": ["A"], "family": "B"}]}])
+    assert type(row) is PatientRow
+    assert pickle.loads(pickle.dumps(row)) == {'origin': 1, 'first_name': 'A', 'last_name': 'B', 'patient_id': 'p1'}
+    assert ClaimRow.__module__ == 'field_mappers.claim_processor'
@@ -0,0 +1,41 @@
+import os
+
+import pytest
+
+from common.rows import make_row_class
+from common.spill import SpillFile
+
+SpilledRow = make_row_class('SpilledRow', ['origin', 'patient_id'], __name__)
+
+
+def test_spill_file_is_re_iterable():
+    rows = [{"patient_id": "1", "first_name": "A"}, {"patient_id": "2", "first_name": None}]
+    with SpillFile() as spill:
+        spill.extend(iter(rows))
+        assert len(spill) == 2
+        assert list(spill) == rows
+        assert [row["patient_id"] for row in spill] == ["1", "2"]
+
+
+def test_spill_file_is_removed_on_close():
+    with SpillFile() as spill:
+        spill.append({"patient_id": "1"})
+    assert not os.path.exists(spill.path)
+
+
+
+def test_compact_rows_are_read_back_as_rows():
+    rows = [SpilledRow('a.ndjson', '1'), SpilledRow('a.ndjson', None)]
+    with SpillFile() as spill:
+        spill.extend(rows)
+        spilled = list(spill)
+    assert spilled == rows
+    assert all(type(row) is SpilledRow for row in spilled)
+
+
+def test_rows_of_another_class_are_refused():
+    OtherRow = make_row_class('OtherRow', ['origin'], __name__)
+    with SpillFile() as spill:
+        spill.append(SpilledRow('a.ndjson', '1'))
+        with pytest.raises(TypeError):
+            spill.append(OtherRow('a.ndjson'))
@@ -0,0 +1,20 @@
+import random
+
+from common.utils import chunked, chunked_by_key, reservoir_sample
+
+
+def test_chunked_yields_bounded_lists():
+    assert list(chunked(iter(range(5)), 2)) == [[0, 1], [2, 3], [4]]
+
+
+def test_chunked_by_key_keeps_runs_together():
+    assert list(chunked_by_key("abbcccd", 2, str)) == [["a"], ["b", "b"], ["c", "c", "c"], ["d"]]
+    assert list(chunked_by_key("abcc", 3, str)) == [["a", "b"], ["c", "c"]]
+    assert list(chunked_by_key(iter(range(5)), 2, str)) == [[0, 1], [2, 3], [4]]
+    assert list(chunked_by_key([], 2, str)) == []
+
+
+def test_reservoir_sample_keeps_at_most_size_items():
+    sample = reservoir_sample(range(1000), 10, random.Random(7))
+    assert len(sample) == 10 and len(set(sample)) == 10
+    assert reservoir_sample(range(3), 10) == [0, 1, 2]
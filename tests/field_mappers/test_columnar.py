@@ -0,0 +1,18 @@
+from field_mappers.base import ISO8601_PATTERN, is_valid_date_string, is_valid_datetime_string
+from field_mappers.columnar import invalid_date_mask, invalid_pattern_mask
+
+DATES = ['2020-02-29', '2019-02-29', '2000-02-29', '1900-02-29', '0000-01-01', '0001-01-01', '2020-13-01',
+         '2020-00-10', '2020-04-31', '2020-01-00', '2020-01-32', '2020-01- 1', '2020-1-01', '2020/01/01',
+         '2020-01-01 ', 'MM-YY', '２０２０-01-01', '٢٠٢٠-٠١-٠١', '', None, 0, 5, ['2020-01-01'], {'a': 1}]
+DATETIMES = ['2021-08-17T13:43:00.037-04:00', '2021-01-01T00:00:00Z', '2022-02-30TAA:00:00Z', '2021-01-01',
+             '2021-01-01T00:00:00Z\n', '2021-01-01T00:00:00Z\nX', '2021-01-01T24:00:00', '', None, 12, ['x']]
+
+
+def test_invalid_date_mask_matches_strptime():
+    invalid = invalid_date_mask(DATES, is_valid_date_string)
+    assert list(invalid) == [bool(value) and not is_valid_date_string(value) for value in DATES]
+
+
+def test_invalid_pattern_mask_matches_regex():
+    invalid = invalid_pattern_mask(DATETIMES, ISO8601_PATTERN)
+    assert list(invalid) == [bool(value) and not is_valid_datetime_string(value) for value in DATETIMES]
@@ -20,12 +20,25 @@ def test_map_values_with_null_patient_reference(processor):
     assert processor.data[
                'patient_id'] is None, "Expected 'patient_id' to be None when 'patient.reference' is not provided"
 
-def test_gender_normalization(processor):
+def test_normalize_keeps_the_mapped_row(processor):
     processor.data = {
-            "gender": "M"
+            "id": "claim-1",
+            "billablePeriod": {"start": "2022-01-01", "end": "2022-01-31"},
+            "total": {"value": 100},
     }
+    processor.map_values()
+    mapped = processor.data
 
     processor.normalize()
 
-    assert processor.data[
-               'gender'] is 'Male'
+    assert processor.data is mapped
+    assert processor.data['claim_id'] == 'claim-1'
+
+
+def test_status_is_kept_as_it_is(processor):
+    for status in (" Canceled", 3, ["active"]):
+        processor.data = {"status": status, "total": {"value": 100}}
+
+        processor.map_values()
+
+        assert processor.data['status'] == status
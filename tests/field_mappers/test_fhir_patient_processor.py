@@ -45,3 +45,33 @@ def test_validate_dates_with_future_last_updated(caplog, processor):
     }
     processor.validate_dates()
     assert "WARNING" in caplog.text, "Warnings should be logged for invalid date formats"
+
+
+def test_process_many_counts_rows_lazily(processor):
+    records = iter([{"name": [{"given": ["A"], "family": "B"}], "id": "1"}, {"id": "2"}])
+    output = processor.process_many(records)
+    assert processor.total_rows_processed == 0
+    assert [row["patient_id"] for row in output] == ["1", "2"]
+    assert processor.total_rows_processed == 2
+    assert processor.total_warnings == 1
+
+
+def test_batch_processing_matches_row_processing(caplog):
+    records = [{"id": str(row_num), "name": [{"given": ["A"], "family": "B"}], "birthDate": birth_date,
+                "meta": {"lastUpdated": last_updated}}
+               for row_num, (birth_date, last_updated) in enumerate([
+                    ("1952-11-17", "2021-08-17T13:43:00.037-04:00"),
+                    ("1952-02-30", "2021-08-17T13:43:00"),
+                    (None, "yesterday"),
+                    ("17/11/1952", None),
+               ])]
+    row_processor = FHIRPatientProcessor(datetime.utcnow())
+    expected = list(row_processor.process_many(records))
+    row_warnings = sorted(record.getMessage() for record in caplog.records)
+    caplog.clear()
+
+    batch_processor = FHIRPatientProcessor(datetime.utcnow())
+    assert list(batch_processor.process_many(records, batch_size=3)) == expected
+    assert batch_processor.total_warnings == row_processor.total_warnings == 3
+    assert sorted(record.getMessage() for record in caplog.records) == row_warnings
+    assert "Values in column 'birthDate' is not valid date string, should be YYYY-MM-DD at row 1" in row_warnings
@@ -0,0 +1,77 @@
+import json
+from datetime import datetime
+
+from common import metrics
+from field_mappers.claim_processor import FHIRClaimProcessor
+from field_mappers.parallel import process_ndjson_parallel
+from readers.ndjson import iter_ndjson
+
+
+def write_claims(ndjson_path, rows):
+    with open(ndjson_path, 'w') as file:
+        for row_num in range(rows):
+            claim = {"resourceType": "Claim", "id": f"claim-{row_num % 40}", "status": "active",
+                     "patient": {"reference": f"Patient/{row_num}"}, "total": {"value": row_num}}
+            if row_num % 7:
+                # every 7th claim is missing its required fields
+                claim.update({"created": "2021-01-01T00:00:00Z", "provider": {"reference": "#provider-org"},
+                              "billablePeriod": {"start": "2020-12-19", "end": "2020-12-20"}})
+            file.write(json.dumps(claim) + "\n")
+
+
+def test_parallel_processing_matches_sequential_order_and_counters(tmp_path):
+    ndjson_path = tmp_path / "Claim.ndjson"
+    write_claims(ndjson_path, 100)
+    ingest_ts = datetime.utcnow()
+
+    sequential = FHIRClaimProcessor(ingest_ts)
+    expected = list(sequential.process_many(iter_ndjson(ndjson_path)))
+    parallel = FHIRClaimProcessor(ingest_ts)
+    output = list(process_ndjson_parallel(parallel, ndjson_path, workers=2, shard_size=512))
+
+    assert output == expected
+    assert parallel.total_rows_processed == sequential.total_rows_processed == 100
+    assert parallel.total_warnings == sequential.total_warnings
+    assert parallel.total_warnings_below_threshold(5) == sequential.total_warnings_below_threshold(5)
+
+
+def test_shard_warnings_use_file_row_numbers(tmp_path, caplog):
+    from field_mappers.parallel import _process_shard
+    ndjson_path = tmp_path / "Claim.ndjson"
+    write_claims(ndjson_path, 1)
+
+    rows, total_warnings, rows_with_warnings, total_rows_processed, warnings, shard_metrics = _process_shard(
+            (FHIRClaimProcessor, datetime.utcnow(), 1, ndjson_path, 0, None, 28, None, False)
+    )
+
+    assert total_rows_processed == 1 and total_warnings > 0
+    assert "at row 28" in caplog.text
+
+
+def test_shard_metrics_are_merged_into_the_run(tmp_path):
+    ndjson_path = tmp_path / "Claim.ndjson"
+    write_claims(ndjson_path, 100)
+
+    with metrics.instrumented_run(None, None, None, enabled=True) as run:
+        with metrics.timer('process'):
+            list(process_ndjson_parallel(FHIRClaimProcessor(datetime.utcnow()), ndjson_path, workers=2,
+                                         shard_size=512))
+
+    report = run.report()
+    assert {name: report['timers'][name]['calls'] for name in ('process', 'validate', 'map_values', 'normalize')} == \
+           {'process': 1, 'validate': 100, 'map_values': 100, 'normalize': 100}
+    assert report['counters']['bytes_read'] >= ndjson_path.stat().st_size
+
+
+def test_parallel_processing_stops_once_threshold_is_exceeded(tmp_path):
+    from field_mappers.threshold import BUDGET_EXCEEDED
+    ndjson_path = tmp_path / "Claim.ndjson"
+    write_claims(ndjson_path, 2000)
+    processor = FHIRClaimProcessor(datetime.utcnow())
+    evaluator = processor.start_threshold_evaluation(5)
+
+    output = list(process_ndjson_parallel(processor, ndjson_path, workers=2, shard_size=4096))
+
+    assert evaluator.total_rows == 2000 and evaluator.decision == BUDGET_EXCEEDED
+    assert len(output) == evaluator.rows_consumed < 2000
+    assert not processor.total_warnings_below_threshold(5)
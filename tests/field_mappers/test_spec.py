@@ -0,0 +1,67 @@
+import logging
+from datetime import datetime
+
+import pytest
+
+from field_mappers.base import FHIRResourceProcessor
+from field_mappers.claim_processor import CLAIM_SPEC
+from field_mappers.spec import DATE, Field, ResourceSpec, equals_ignore_case
+
+COVERAGE_SPEC = ResourceSpec(
+        'Coverage',
+        [
+                Field('coverage_id', 'id', required=True),
+                Field('payor', 'payor[0].display', normalizer=str.upper),
+                Field('period_start', 'period.start', type=DATE),
+                Field('plan', 'class[0].value', when=('class[0].type.text', equals_ignore_case('plan'))),
+        ],
+        required=['resourceType'],
+        datetime_fields=['meta.lastUpdated'],
+        check_resource_type=True,
+)
+
+
+class FHIRCoverageProcessor(FHIRResourceProcessor):
+    spec = COVERAGE_SPEC
+
+
+def test_spec_derives_validation_lists():
+    assert COVERAGE_SPEC.required_fields == ('resourceType', 'id')
+    assert COVERAGE_SPEC.date_fields == ('period.start',)
+    assert COVERAGE_SPEC.datetime_fields == ('meta.lastUpdated',)
+    assert CLAIM_SPEC.mapping['admitting_diagnosis'] == "diagnosis[0].diagnosisCodeableConcept.coding[0].code"
+    with pytest.raises(ValueError):
+        Field('amount', 'total.value', type='money')
+
+
+def test_map_record_applies_normalizers_and_rules():
+    missing = []
+    record = {"id": "c1", "payor": [{"display": "Acme"}], "period": {"start": "2021-01-01"},
+              "class": [{"type": {"text": "Plan"}, "value": "gold"}]}
+    assert COVERAGE_SPEC.map_record(record, 2, lambda *args: missing.append(args)) == {
+            'origin': 2, 'coverage_id': 'c1', 'payor': 'ACME', 'period_start': '2021-01-01', 'plan': 'gold'}
+    assert missing == []
+
+    assert COVERAGE_SPEC.map_record({"id": "c2", "class": [{"type": {"text": "group"}, "value": "g"}]}, 1,
+                                    lambda *args: missing.append(args)) == {
+            'origin': 1, 'coverage_id': 'c2', 'payor': None, 'period_start': None, 'plan': None}
+    assert missing == [('plan', 'class[0].value')]
+
+
+def test_new_resource_type_only_needs_a_spec(caplog):
+    processor = FHIRCoverageProcessor(datetime.now())
+    records = [
+            {"resourceType": "Coverage", "id": "c1", "period": {"start": "2021-01-01"},
+             "meta": {"lastUpdated": "2021-08-17T13:43:00Z"}},
+            {"resourceType": "Claim", "id": "c2", "period": {"start": "2021-02-30"}},
+            {"resourceType": "Coverage", "meta": {"lastUpdated": "yesterday"}},
+    ]
+    with caplog.at_level(logging.WARNING):
+        output = list(processor.process_many(records))
+
+    assert [row['coverage_id'] for row in output] == ['c1', 'c2', None]
+    assert processor.total_warnings == 4
+    assert {(issue['rule'], issue['field']) for issue in processor.warnings.summary()
+            if issue['level'] == 'WARNING'} == {
+            ('wrong_resource_type', 'resourceType'), ('invalid_date', 'period.start'),
+            ('missing_required_field', 'id'), ('invalid_datetime', 'meta.lastUpdated')}
@@ -0,0 +1,57 @@
+from datetime import datetime
+
+import pytest
+
+from field_mappers.patient_processor import FHIRPatientProcessor
+from field_mappers.threshold import BUDGET_EXCEEDED, CONFIDENCE_BOUND, ThresholdEvaluator, wilson_lower_bound
+
+GOOD = {"id": "1", "name": [{"given": ["A"], "family": "B"}], "birthDate": "1952-11-17"}
+BAD = {"id": "2", "name": [{"given": ["A"], "family": "B"}], "birthDate": "17/11/1952"}
+
+
+def test_wilson_lower_bound():
+    assert wilson_lower_bound(0, 0, 3.09) == 0.0
+    assert wilson_lower_bound(0, 100, 3.09) == 0.0
+    assert 0.5 < wilson_lower_bound(600, 1000, 3.09) < 0.6
+
+
+def test_budget_exceeded_when_total_rows_known():
+    evaluator = ThresholdEvaluator(5, total_rows=1000, min_rows=10 ** 9)
+
+    assert not evaluator.update(49, 49, 60)
+    assert evaluator.update(50, 50, 61)
+    assert evaluator.decision == BUDGET_EXCEEDED and evaluator.rows_consumed == 61
+    # the decision is final
+    assert evaluator.update(0, 0, 100) and evaluator.rows_consumed == 61
+
+
+def test_confidence_bound_needs_minimum_sample():
+    evaluator = ThresholdEvaluator(5, min_rows=100)
+
+    assert not evaluator.update(60, 60, 99)
+    assert evaluator.update(60, 60, 100) and evaluator.decision == CONFIDENCE_BOUND
+    # a rate close to the threshold is not rejected
+    assert not ThresholdEvaluator(5, min_rows=100).update(60, 60, 1000)
+
+
+@pytest.mark.parametrize("batch_size", [None, 50])
+def test_process_many_stops_on_hopeless_file(batch_size):
+    records = [BAD if row_num % 5 < 3 else GOOD for row_num in range(10000)]
+    processor = FHIRPatientProcessor(datetime.utcnow())
+    evaluator = processor.start_threshold_evaluation(5, min_rows=200)
+
+    rows = list(processor.process_many(records, batch_size=batch_size))
+
+    assert evaluator.decision == CONFIDENCE_BOUND
+    assert len(rows) == evaluator.rows_consumed == processor.total_rows_processed < 300
+    assert not processor.total_warnings_below_threshold(5)
+
+
+def test_process_many_keeps_going_on_good_file():
+    records = [BAD if row_num % 100 == 0 else GOOD for row_num in range(5000)]
+    processor = FHIRPatientProcessor(datetime.utcnow())
+    evaluator = processor.start_threshold_evaluation(5, total_rows=len(records), min_rows=200)
+
+    assert len(list(processor.process_many(records, batch_size=64))) == 5000
+    assert evaluator.decision is None and processor.rows_with_warnings == 50
+    assert processor.total_warnings_below_threshold(5)
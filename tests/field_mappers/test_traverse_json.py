@@ -12,3 +12,21 @@ def test_nested_structure():
         ]
     }
     assert get_value_at_json_path(json_input, "users[0].age") == 30
+
+
+def test_missing_key_bad_index_and_wrong_type_return_none():
+    json_input = {"users": [{"name": "John", "tags": ["a"]}], "count": 1}
+    assert get_value_at_json_path(json_input, "users[0].missing") is None
+    assert get_value_at_json_path(json_input, "users[5].name") is None
+    assert get_value_at_json_path(json_input, "users[x].name") is None
+    assert get_value_at_json_path(json_input, "count.value") is None
+    assert get_value_at_json_path(json_input, "users[0].name.first") is None
+    assert get_value_at_json_path(json_input, "users[-1].tags[0]") == "a"
+
+
+def test_compiled_accessor_is_cached_and_reusable():
+    from field_mappers.base import compile_json_path
+    accessor = compile_json_path("diagnosis[0].diagnosisCodeableConcept.coding[0].code")
+    assert accessor is compile_json_path("diagnosis[0].diagnosisCodeableConcept.coding[0].code")
+    assert accessor({"diagnosis": [{"diagnosisCodeableConcept": {"coding": [{"code": "A01"}]}}]}) == "A01"
+    assert accessor({"diagnosis": []}) is None
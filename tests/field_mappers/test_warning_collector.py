@@ -0,0 +1,58 @@
+import logging
+import pickle
+from datetime import datetime
+
+from field_mappers.claim_processor import FHIRClaimProcessor
+from field_mappers.warning_collector import WarningCollector
+
+
+def test_only_first_occurrences_are_logged(caplog):
+    collector = WarningCollector(log_limit=2, sample_size=3)
+
+    for row_num in range(100):
+        collector.add('invalid_date', 'birthDate', row_num, "Bad birthDate")
+    collector.add('missing_value', 'admitting_diagnosis', 7, "No diagnosis", logging.INFO)
+
+    assert [record.getMessage() for record in caplog.records if record.levelno == logging.WARNING] == [
+            "Bad birthDate at row 0", "Bad birthDate at row 1"]
+    assert collector.count() == 100 and collector.count(logging.INFO) == 101
+    assert collector.summary()[0] == {'rule': 'invalid_date', 'field': 'birthDate', 'level': 'WARNING',
+                                      'count': 100, 'sample_rows': [0, 1, 2]}
+
+
+def test_add_many_matches_add():
+    one_by_one, batched = WarningCollector(sample_size=5), WarningCollector(sample_size=5)
+    for row_num in [3, 8, 9, 20, 31, 40, 41]:
+        one_by_one.add('invalid_date', 'created', row_num, "Bad created")
+    batched.add_many('invalid_date', 'created', [3, 8], "Bad created")
+    batched.add_many('invalid_date', 'created', [], "Bad created")
+    batched.add_many('invalid_date', 'created', [9, 20, 31, 40, 41], "Bad created")
+
+    assert batched.summary() == one_by_one.summary()
+
+
+def test_merge_and_summary(caplog):
+    first, second = WarningCollector(sample_size=2), WarningCollector(sample_size=2)
+    first.add('missing_required_field', 'id', 1, "Missing required field: id")
+    second.add('missing_required_field', 'id', 11, "Missing required field: id")
+    second.add('missing_required_field', 'id', 12, "Missing required field: id")
+
+    first.merge(pickle.loads(pickle.dumps(second)))
+    caplog.clear()
+    first.log_summary(20, "Patient.ndjson")
+
+    assert first.summary()[0]['count'] == 3 and first.summary()[0]['sample_rows'] == [1, 11]
+    assert len(caplog.records) == 1
+    assert "3 warnings in 20 rows of Patient.ndjson" in caplog.text
+    assert "missing_required_field id: 3 (rows 1, 11, ...)" in caplog.text
+
+
+def test_claim_processor_counts_warnings_without_logging_each(caplog):
+    processor = FHIRClaimProcessor(datetime.utcnow())
+    claims = [{"resourceType": "Claim", "id": str(row_num), "created": "yesterday"} for row_num in range(50)]
+
+    list(processor.process_many(claims))
+
+    assert processor.total_warnings == processor.warnings.count() == 50 * 7
+    # one line per distinct issue: 5 missing fields (provider is required twice) and the invalid datetime
+    assert len(caplog.records) == 6
@@ -1,4 +1,55 @@
+import json
+
+import pytest
+
 from normalizers.enum_normalizer import *
 
+
 def test_normalize_gender():
     assert GenderNormalizer.normalize('male') == "Male"
+
+
+def test_gender_synonyms_and_default():
+    assert [GenderNormalizer.normalize(value) for value in (' M ', 'Woman', 'girl', 'unknown')] == \
+           ['Male', 'Female', 'Female', 'Other']
+    assert GenderNormalizer().schema == 'Gender'
+    assert get_normalizer('Gender') is GenderNormalizer
+
+
+def test_normalize_is_memoized():
+    normalize = get_normalizer('Gender').normalize
+    normalize.cache_clear()
+
+    assert [normalize(value) for value in ('Woman', 'Woman', 'unknown')] == ['Female', 'Female', 'Other']
+    assert normalize.cache_info().hits == 1
+
+
+def test_values_that_are_not_strings_are_returned_unchanged():
+    status = make_enum_normalizer('TestClaimStatus', {'cancelled': ['canceled', 'void']})
+    status.normalize.cache_clear()
+
+    assert [status.normalize(value) for value in (3, ['void'], {'code': 'void'}, None, ' Void')] == \
+           [3, ['void'], {'code': 'void'}, None, 'cancelled']
+    assert GenderNormalizer.normalize(1) == 1
+    assert status.normalize.cache_info().currsize == 1
+
+
+def test_normalize_many_normalizes_a_column():
+    assert GenderNormalizer.normalize_many(['f', None, 'F', 'boy', 'x']) == ['Female', None, 'Female', 'Male', 'Other']
+
+
+def test_enum_tables_are_loaded_from_config(tmp_path):
+    config = tmp_path / "enums.json"
+    config.write_text(json.dumps({"TestInsurance": {"values": {"MEDICARE": ["medicare", "mcare"],
+                                                               "PRIVATE": ["commercial"]}, "default": None}}))
+
+    loaded = load_enum_normalizers(config)
+
+    normalizer = get_normalizer('TestInsurance')
+    assert loaded == {'TestInsurance': normalizer} and issubclass(normalizer, EnumNormalizer)
+    assert normalizer.normalize_many(['MCare', 'Commercial', 'medicaid']) == ['MEDICARE', 'PRIVATE', None]
+    del NORMALIZERS['TestInsurance']
+    with pytest.raises(ValueError):
+        get_normalizer('TestInsurance')
+    with pytest.raises(ValueError):
+        make_enum_normalizer('Bad', {'A': ['x'], 'B': ['X ']})
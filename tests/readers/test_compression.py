@@ -0,0 +1,46 @@
+import gzip
+
+import pytest
+
+from readers.compression import GZIP, ZSTD, detect_compression
+from readers.ndjson import count_ndjson_rows, iter_ndjson, row_byte_offset
+
+LINES = b''.join(b'{"id": "%d"}\n' % row_num + b'\n' * (row_num % 2) for row_num in range(200))
+RECORDS = [{"id": str(row_num)} for row_num in range(200)]
+
+
+def test_gzip_is_decompressed_while_reading(tmp_path):
+    ndjson_path = tmp_path / "Patient.ndjson.gz"
+    # two gzip members, as written by pigz or by appending to a .gz file
+    ndjson_path.write_bytes(gzip.compress(LINES[:1000]) + gzip.compress(LINES[1000:]))
+
+    assert detect_compression(ndjson_path) == GZIP
+    for buffer_size in (7, 4096):
+        assert list(iter_ndjson(ndjson_path, buffer_size=buffer_size)) == RECORDS
+    assert count_ndjson_rows(ndjson_path) == 200
+    assert list(iter_ndjson(ndjson_path, row_byte_offset(ndjson_path, 150))) == RECORDS[150:]
+    assert row_byte_offset(ndjson_path, 200) == len(LINES)
+
+
+def test_zstd_is_decompressed_while_reading(tmp_path):
+    zstandard = pytest.importorskip('zstandard')
+    # detected from the magic bytes, whatever the extension
+    ndjson_path = tmp_path / "Patient.ndjson"
+    compressor = zstandard.ZstdCompressor()
+    ndjson_path.write_bytes(compressor.compress(LINES[:500]) + compressor.compress(LINES[500:]))
+
+    assert detect_compression(ndjson_path) == ZSTD
+    for buffer_size in (7, 4096):
+        assert list(iter_ndjson(ndjson_path, buffer_size=buffer_size)) == RECORDS
+    assert list(iter_ndjson(ndjson_path, row_byte_offset(ndjson_path, 150))) == RECORDS[150:]
+
+
+def test_plain_files_are_not_decompressed(tmp_path):
+    ndjson_path = tmp_path / "Patient.ndjson.gz"
+    ndjson_path.write_bytes(LINES)
+    empty_path = tmp_path / "Empty.ndjson.zst"
+    empty_path.write_bytes(b'')
+
+    assert detect_compression(ndjson_path) is None
+    assert list(iter_ndjson(ndjson_path)) == RECORDS
+    assert detect_compression(empty_path) == ZSTD
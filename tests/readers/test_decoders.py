@@ -0,0 +1,33 @@
+import json
+
+import pytest
+
+from readers.decoders import decode_lines, get_decoder
+
+LINES = [
+        b'{"resourceType": "Patient", "id": "1", "name": [{"given": ["Ren\\u00e9e", "\xc3\xa9"]}]}',
+        b'{"total": {"value": 100.5}, "small": 1e-7, "big": 1.7976931348623157e308, "neg": -0.0, "int": -12}',
+        b'{"huge": 123456789012345678901234567890, "nan": NaN, "inf": -Infinity}',
+        b'{"surrogate": "\\ud800", "pair": "\\ud83d\\ude00", "escapes": "\\t\\n\\"\\\\\\/"}',
+        b'{"dup": 1, "dup": 2, "empty": {}, "list": [], "null": null, "bool": [true, false]}',
+        b'\xef\xbb\xbf{"bom": true}',
+        b'  {"padded": true}\r',
+]
+
+
+@pytest.mark.parametrize("line", LINES)
+def test_orjson_decoder_matches_json(line):
+    pytest.importorskip("orjson")
+
+    decoded = get_decoder('orjson')(line)
+
+    assert repr(decoded) == repr(json.loads(line))
+
+
+def test_decode_lines_skips_blank_lines():
+    assert decode_lines([b'{"id": "1"}', b'', b'  ', b'{"id": "2"}'], get_decoder('json')) == [{"id": "1"}, {"id": "2"}]
+
+
+def test_unknown_decoder():
+    with pytest.raises(ValueError):
+        get_decoder('yaml')
@@ -0,0 +1,37 @@
+import types
+
+from readers.ndjson import iter_ndjson
+
+
+def test_iter_ndjson_is_lazy_and_skips_blank_lines(tmp_path):
+    ndjson_path = tmp_path / "Patient.ndjson"
+    ndjson_path.write_text('{"id": "1"}\n\n{"id": "2"}\n')
+
+    records = iter_ndjson(ndjson_path)
+
+    assert isinstance(records, types.GeneratorType)
+    assert list(records) == [{"id": "1"}, {"id": "2"}]
+
+
+def test_iter_ndjson_small_buffers(tmp_path):
+    from readers.ndjson import count_ndjson_rows
+    ndjson_path = tmp_path / "Patient.ndjson"
+    ndjson_path.write_bytes(b'{"id": "1"}\r\n\n{"id": "\xc3\xa9", "name": [{"family": "B"}]}\n{"id": "3"}')
+
+    for buffer_size in (1, 3, 16, 1024):
+        assert list(iter_ndjson(ndjson_path, buffer_size=buffer_size)) == [
+                {"id": "1"}, {"id": "é", "name": [{"family": "B"}]}, {"id": "3"}]
+        # a line starting before `end` is read completely
+        assert list(iter_ndjson(ndjson_path, 0, 5, buffer_size=buffer_size)) == [{"id": "1"}]
+    assert count_ndjson_rows(ndjson_path) == 3
+
+
+def test_row_byte_offset_resumes_at_record(tmp_path):
+    from readers.ndjson import row_byte_offset
+    ndjson_path = tmp_path / "Patient.ndjson"
+    ndjson_path.write_text('{"id": "0"}\n\n{"id": "1"}\n{"id": "2"}\n')
+
+    for row in range(3):
+        assert list(iter_ndjson(ndjson_path, row_byte_offset(ndjson_path, row))) == [
+                {"id": str(row_num)} for row_num in range(row, 3)]
+    assert row_byte_offset(ndjson_path, 3) == ndjson_path.stat().st_size
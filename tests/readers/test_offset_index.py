@@ -0,0 +1,79 @@
+import gzip
+import os
+
+import pytest
+
+from readers.ndjson import iter_ndjson
+from readers.offset_index import IndexedNDJSON, build_offsets, index_path_for, persisted_row_count, row_count
+
+LINES = b'{"id": "0"}\r\n\n   \n{"id": "1"}\n \t{"id": "2"}\n{"id": "3"}'
+
+
+def test_offsets_skip_blank_lines_like_iter_ndjson(tmp_path):
+    ndjson_path = tmp_path / "Patient.ndjson"
+    ndjson_path.write_bytes(LINES)
+
+    with IndexedNDJSON(ndjson_path) as ndjson:
+        assert len(ndjson) == 4
+        assert ndjson[:] == list(iter_ndjson(ndjson_path))
+        assert [ndjson[row]['id'] for row in (3, 0, -1)] == ['3', '0', '3']
+        assert ndjson[1:3] == [{"id": "1"}, {"id": "2"}]
+        start, end = ndjson.byte_range(1, 3)
+        assert list(iter_ndjson(ndjson_path, start, end)) == [{"id": "1"}, {"id": "2"}]
+        with ndjson.row_bytes(1) as row:
+            assert isinstance(row, memoryview) and bytes(row) == b'{"id": "1"}\n'
+        with pytest.raises(IndexError):
+            ndjson.row_bytes(4)
+    assert build_offsets(b'').tolist() == [0]
+    assert build_offsets(b'\n\n').tolist() == [2]
+
+
+def test_index_is_persisted_and_rebuilt_when_the_file_changes(tmp_path):
+    ndjson_path = tmp_path / "Patient.ndjson"
+    ndjson_path.write_bytes(LINES)
+    index_path = index_path_for(ndjson_path)
+    with IndexedNDJSON(ndjson_path):
+        pass
+    # only saved when asked to, input directories are often read-only or shared
+    assert not os.path.exists(index_path)
+    with IndexedNDJSON(ndjson_path, persist=True):
+        pass
+    assert os.path.getsize(index_path) > 5 * 8
+
+    assert persisted_row_count(ndjson_path) == 4
+
+    # a stale index is detected by the size and mtime of the file
+    ndjson_path.write_bytes(LINES + b'\n{"id": "4"}\n')
+    assert persisted_row_count(ndjson_path) is None
+    with IndexedNDJSON(ndjson_path, persist=True) as ndjson:
+        assert ndjson[4] == {"id": "4"}
+    assert persisted_row_count(ndjson_path) == 5
+    with IndexedNDJSON(ndjson_path) as ndjson:
+        assert len(ndjson) == 5
+
+
+def test_rows_are_counted_without_a_saved_index(tmp_path):
+    ndjson_path = tmp_path / "Patient.ndjson"
+    ndjson_path.write_bytes(LINES)
+
+    assert row_count(ndjson_path) == 4
+    assert not os.path.exists(index_path_for(ndjson_path))
+    gzip_path = tmp_path / "Patient.ndjson.gz"
+    gzip_path.write_bytes(gzip.compress(LINES))
+    assert row_count(gzip_path) is None
+
+
+def test_shard_ranges_split_exactly_on_rows(tmp_path):
+    ndjson_path = tmp_path / "Patient.ndjson"
+    ndjson_path.write_text("".join(f'{{"id": "{row_num}"}}\n' + "\n" * (row_num % 3) for row_num in range(50)))
+
+    with IndexedNDJSON(ndjson_path, persist=False) as ndjson:
+        ranges = ndjson.shard_ranges(7)
+        assert ndjson.shard_ranges(1000)[-1][1] == ndjson_path.stat().st_size
+
+    assert len(ranges) == 7 and ranges[0][:1] == (0,) and ranges[-1][1] == ndjson_path.stat().st_size
+    assert all(end == next_start for (_, end, _), (next_start, _, _) in zip(ranges, ranges[1:]))
+    for start, end, first_row in ranges:
+        assert next(iter_ndjson(ndjson_path, start, end)) == {"id": str(first_row)}
+    assert [record for start, end, _ in ranges for record in iter_ndjson(ndjson_path, start, end)] == \
+           list(iter_ndjson(ndjson_path))
@@ -1,7 +1,24 @@
+import json
+import os
+import tempfile
 import unittest
+from unittest import mock
 import psycopg2
 from datetime import datetime
-from structured_zone_transformer import upsert_patient, pg_connection_dict, percent_of_patients_above_threshold
+from structured_zone_transformer import upsert_patient, pg_connection_dict, percent_of_patients_above_threshold, \
+    upsert_patients, upsert_claims, write_to_db, upsert_claim, ensure_history_partitions, ingest_file, \
+    ingest_file_pipelined, _upsert_patients_chunk, write_patients, origin_router, patients_pass_checks, \
+    process_fhir_data
+from common.checkpoints import COMPLETE, CheckpointStore, RoutedCheckpointStore, file_identity
+from field_mappers.claim_processor import FHIRClaimProcessor
+from field_mappers.patient_processor import FHIRPatientProcessor
+from field_mappers.threshold import BUDGET_EXCEEDED
+from readers.offset_index import index_path_for
+
+try:
+    import pyarrow.parquet as pq
+except ImportError:
+    pq = None
 
 
 # Assuming upsert_patient is defined somewhere, import it
@@ -101,5 +118,490 @@ class TestPatientPercentageNoRecords(unittest.TestCase):
         self.assertTrue(result)
 
 
+class TestPatientPercentageDistinctMatches(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.conn = psycopg2.connect(**pg_connection_dict)
+        with cls.conn.cursor() as cursor:
+            # the same patient appears in several history rows
+            cursor.executemany("INSERT INTO patients_history (first_name, last_name, patient_id) VALUES (%s, %s, %s);",
+                               [('Test', 'Name 1', 'Coverage ID 1')] * 3
+                               )
+            cls.conn.commit()
+
+    @classmethod
+    def tearDownClass(cls):
+        with cls.conn.cursor() as cursor:
+            cursor.execute("DELETE FROM patients_history WHERE patient_id = 'Coverage ID 1'")
+            cls.conn.commit()
+        cls.conn.close()
+
+    def test_duplicate_history_rows_count_once(self):
+        patient_ids = ['Coverage ID 1', 'Coverage ID 2', 'Coverage ID 3', 'Coverage ID 4']
+        self.assertTrue(percent_of_patients_above_threshold(iter(patient_ids), 20, pg_connection_dict))
+        self.assertFalse(percent_of_patients_above_threshold(iter(patient_ids), 30, pg_connection_dict))
+
+    def test_duplicate_ids_in_file_count_once(self):
+        patient_ids = ['Coverage ID 1'] * 5 + ['Coverage ID 2']
+        self.assertFalse(percent_of_patients_above_threshold(patient_ids, 60, pg_connection_dict))
+
+    def test_sampled_check(self):
+        patient_ids = ['Coverage ID 1'] * 10
+        self.assertTrue(percent_of_patients_above_threshold(patient_ids, 90, pg_connection_dict, sample_size=3))
+
+
+class TestBulkUpsert(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.conn = psycopg2.connect(**pg_connection_dict)
+
+    @classmethod
+    def tearDownClass(cls):
+        with cls.conn.cursor() as cursor:
+            cursor.execute("DELETE FROM patients WHERE patient_id LIKE 'bulk-%'")
+            cursor.execute("DELETE FROM patients_history WHERE patient_id LIKE 'bulk-%'")
+            cursor.execute("DELETE FROM claims WHERE claim_id LIKE 'bulk-%'")
+            cursor.execute("DELETE FROM claims_history WHERE claim_id LIKE 'bulk-%'")
+            cls.conn.commit()
+        cls.conn.close()
+
+    def fetch(self, query, params):
+        with self.conn.cursor() as cursor:
+            cursor.execute(query, params)
+            result = cursor.fetchall()
+        self.conn.commit()
+        return result
+
+    def test_upsert_patients_keeps_history_semantics(self):
+        upsert_patient('bulk-1', 'First', 'Version', 1)
+        (existing_insert_ts,), = self.fetch("SELECT insert_ts FROM patients WHERE patient_id = %s", ('bulk-1',))
+
+        upsert_patients([
+                {'origin': 1, 'first_name': 'Second', 'last_name': 'Version', 'patient_id': 'bulk-1'},
+                {'origin': 1, 'first_name': 'New', 'last_name': 'Patient', 'patient_id': 'bulk-2'},
+                {'origin': 1, 'first_name': 'Newer', 'last_name': 'Patient', 'patient_id': 'bulk-2'},
+        ], chunk_size=10
+        )
+
+        current = self.fetch("SELECT patient_id, first_name FROM patients WHERE patient_id IN ('bulk-1', 'bulk-2') "
+                             "ORDER BY patient_id", ()
+                             )
+        self.assertEqual(current, [('bulk-1', 'Second'), ('bulk-2', 'Newer')])
+        history = self.fetch("SELECT patient_id, first_name, insert_ts, change_ts FROM patients_history "
+                             "WHERE patient_id IN ('bulk-1', 'bulk-2') ORDER BY id", ()
+                             )
+        self.assertEqual([row[:2] for row in history],
+                         [('bulk-1', 'First'), ('bulk-1', 'Second'), ('bulk-2', 'New'), ('bulk-2', 'Newer')]
+                         )
+        # the updated patient records the insert_ts of the stored version
+        self.assertEqual(history[1][2], existing_insert_ts)
+        # the duplicate records the insert_ts of the version before it
+        self.assertEqual(history[3][2], history[2][3])
+
+    def test_upsert_claims_keeps_first_keys_and_last_values(self):
+        claim = {'origin': 1, 'claim_id': 'bulk-claim', 'patient_id': 'bulk-patient-a', 'billing_start': '2020-01-01',
+                 'billing_end': '2020-01-02', 'provider': 'provider', 'admitting_diagnosis': None,
+                 'insurance': 'MEDICARE', 'status': 'active', 'amount': 10}
+        upsert_claims([claim, dict(claim, patient_id='bulk-patient-b', amount=20)], chunk_size=10)
+
+        current = self.fetch("SELECT patient_id, amount FROM claims WHERE claim_id = %s", ('bulk-claim',))
+        self.assertEqual(current, [('bulk-patient-a', 20)])
+        history = self.fetch("SELECT amount FROM claims_history WHERE claim_id = %s ORDER BY id", ('bulk-claim',))
+        self.assertEqual(history, [(10,), (20,)])
+
+    def test_failed_chunk_falls_back_to_row_by_row(self):
+        upsert_patients([
+                {'origin': 1, 'first_name': 'Valid', 'last_name': 'Patient', 'patient_id': 'bulk-3'},
+                {'origin': 1, 'first_name': None, 'last_name': 'Patient', 'patient_id': 'bulk-4'},
+        ], chunk_size=10
+        )
+        current = self.fetch("SELECT patient_id FROM patients WHERE patient_id IN ('bulk-3', 'bulk-4')", ())
+        self.assertEqual(current, [('bulk-3',)])
+
+
+class TestUpsertWithBusinessKeys(unittest.TestCase):
+    def tearDown(self):
+        with psycopg2.connect(**pg_connection_dict) as conn, conn.cursor() as cursor:
+            cursor.execute("DELETE FROM claims WHERE claim_id = 'keys-claim'")
+            cursor.execute("DELETE FROM claims_history WHERE claim_id = 'keys-claim'")
+        conn.close()
+
+    def test_upsert_claim_records_previous_insert_ts_in_partitioned_history(self):
+        ensure_history_partitions(datetime.now())
+        claim = {'origin': 1, 'claim_id': 'keys-claim', 'patient_id': 'keys-patient', 'billing_start': '2020-01-01',
+                 'billing_end': '2020-01-02', 'provider': 'provider', 'admitting_diagnosis': None,
+                 'insurance': 'MEDICARE', 'status': 'active', 'amount': 10}
+        upsert_claim(claim)
+        upsert_claim(dict(claim, amount=20))
+
+        with psycopg2.connect(**pg_connection_dict) as conn, conn.cursor() as cursor:
+            cursor.execute("SELECT amount, insert_ts FROM claims WHERE claim_id = 'keys-claim'")
+            (amount, insert_ts), = cursor.fetchall()
+            cursor.execute("SELECT tableoid::regclass::text, amount, insert_ts, change_ts FROM claims_history "
+                           "WHERE claim_id = 'keys-claim' ORDER BY id")
+            history = cursor.fetchall()
+        conn.close()
+
+        self.assertEqual(amount, 20)
+        self.assertEqual([row[1] for row in history], [10, 20])
+        # the second version records when the first one was inserted
+        self.assertEqual(history[1][2], history[0][3])
+        self.assertEqual(history[1][3], insert_ts)
+        partition = 'claims_history_' + insert_ts.strftime('%Y_%m')
+        self.assertEqual({row[0] for row in history}, {partition})
+
+
+class TestEarlyRejection(unittest.TestCase):
+    def test_small_file_is_stopped_on_its_warning_budget(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        ndjson_path = os.path.join(directory.name, 'Patient.ndjson')
+        with open(ndjson_path, 'w') as file:
+            # 500 rows, fewer than THRESHOLD_MIN_ROWS, starting with 100 invalid birth dates for a budget of 25
+            for row_num in range(500):
+                file.write(json.dumps({"resourceType": "Patient", "id": f"budget-{row_num}",
+                                       "name": [{"given": ["A"], "family": "B"}],
+                                       "birthDate": "17/11/1952" if row_num < 100 else "1952-11-17"}) + "\n")
+        processor = FHIRPatientProcessor(datetime.now())
+        evaluator = processor.start_threshold_evaluation(5)
+
+        list(process_fhir_data(processor, ndjson_path))
+
+        # rejected at the end of the first validation batch, before the confidence bound could apply
+        self.assertEqual((evaluator.total_rows, evaluator.decision), (500, BUDGET_EXCEEDED))
+        self.assertTrue(evaluator.rejected)
+        self.assertFalse(os.path.exists(index_path_for(ndjson_path)))
+
+
+class TestWriteToDb(unittest.TestCase):
+    def tearDown(self):
+        with psycopg2.connect(**pg_connection_dict) as conn, conn.cursor() as cursor:
+            cursor.execute("DELETE FROM patients_history WHERE patient_id LIKE 'copy-%'")
+            cursor.execute("DELETE FROM claims_history WHERE claim_id LIKE 'copy-%'")
+        conn.close()
+
+    def test_processed_claims_are_copied_without_their_extra_keys(self):
+        claims = FHIRClaimProcessor(datetime.now()).process_many([{
+                "resourceType": "Claim", "id": f"copy-{row_num}", "status": "active",
+                "created": "2021-01-01T00:00:00Z", "patient": {"reference": "Patient/p1"},
+                "provider": {"reference": "#provider"}, "billablePeriod": {"start": "2020-12-19", "end": "2020-12-20"},
+                "total": {"value": row_num},
+        } for row_num in range(10)])
+        stats = write_to_db('claims_history', claims, mode='append')
+        self.assertEqual(stats.rows, 10)
+        with psycopg2.connect(**pg_connection_dict) as conn, conn.cursor() as cursor:
+            cursor.execute("SELECT SUM(amount) FROM claims_history WHERE claim_id LIKE 'copy-%'")
+            self.assertEqual(cursor.fetchone()[0], 45)
+        conn.close()
+
+    def test_write_to_db_appends_with_copy(self):
+        rows = [{'first_name': 'Copy', 'last_name': f'Name {row_num}', 'patient_id': f'copy-{row_num}'}
+                for row_num in range(100)]
+        stats = write_to_db('patients_history', iter(rows), mode='append')
+        self.assertEqual(stats.rows, 100)
+        with psycopg2.connect(**pg_connection_dict) as conn, conn.cursor() as cursor:
+            cursor.execute("SELECT COUNT(*) FROM patients_history WHERE patient_id LIKE 'copy-%'")
+            self.assertEqual(cursor.fetchone()[0], 100)
+        conn.close()
+
+
+class TestContentHash(unittest.TestCase):
+    claim = {'origin': 1, 'claim_id': 'hash-claim', 'patient_id': 'hash-patient', 'billing_start': '2020-01-01',
+             'billing_end': '2020-01-02', 'provider': 'provider', 'admitting_diagnosis': None,
+             'insurance': 'MEDICARE', 'status': 'active', 'amount': 10}
+
+    def tearDown(self):
+        with psycopg2.connect(**pg_connection_dict) as conn, conn.cursor() as cursor:
+            cursor.execute("DELETE FROM claims WHERE claim_id = 'hash-claim'")
+            cursor.execute("DELETE FROM claims_history WHERE claim_id = 'hash-claim'")
+            cursor.execute("DELETE FROM patients WHERE patient_id = 'hash-patient'")
+            cursor.execute("DELETE FROM patients_history WHERE patient_id = 'hash-patient'")
+        conn.close()
+
+    def history(self, table, key):
+        with psycopg2.connect(**pg_connection_dict) as conn, conn.cursor() as cursor:
+            cursor.execute(f"SELECT COUNT(*) FROM {table}_history WHERE {key} LIKE 'hash-%'")
+            count, = cursor.fetchone()
+        conn.close()
+        return count
+
+    def test_unchanged_claims_are_skipped_in_both_modes(self):
+        self.assertEqual(upsert_claims([self.claim, dict(self.claim)], chunk_size=10), 1)
+        upsert_claim(dict(self.claim))
+        self.assertEqual(upsert_claims([dict(self.claim)], chunk_size=10), 0)
+        self.assertEqual(self.history('claims', 'claim_id'), 1)
+
+        self.assertEqual(upsert_claims([dict(self.claim, amount=20), dict(self.claim, amount=20)], chunk_size=10), 1)
+        upsert_claim(dict(self.claim, amount=30))
+        self.assertEqual(self.history('claims', 'claim_id'), 3)
+
+    def test_unchanged_patients_are_skipped_in_both_modes(self):
+        patient = {'origin': 1, 'first_name': 'Hash', 'last_name': 'Patient', 'patient_id': 'hash-patient'}
+        upsert_patient(**patient)
+        self.assertEqual(upsert_patients([patient], chunk_size=10), 0)
+        upsert_patient(**patient)
+        self.assertEqual(self.history('patients', 'patient_id'), 1)
+
+        self.assertEqual(upsert_patients([dict(patient, first_name='Changed'), patient], chunk_size=10), 2)
+        self.assertEqual(self.history('patients', 'patient_id'), 3)
+
+
+class TestIngestCheckpoints(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.ndjson_path = os.path.join(self.directory.name, 'Patient.ndjson')
+        with open(self.ndjson_path, 'w') as file:
+            for row_num in range(10):
+                file.write(json.dumps({"resourceType": "Patient", "id": f"ckpt-{row_num}",
+                                       "name": [{"given": ["Check"], "family": "Point"}]}) + "\n")
+        self.checkpoints = CheckpointStore(pg_connection_dict)
+        self.written = []
+
+    def tearDown(self):
+        with psycopg2.connect(**pg_connection_dict) as conn, conn.cursor() as cursor:
+            cursor.execute("DELETE FROM patients WHERE patient_id LIKE 'ckpt-%'")
+            cursor.execute("DELETE FROM patients_history WHERE patient_id LIKE 'ckpt-%'")
+            cursor.execute("DELETE FROM ingest_checkpoints WHERE path = %s", (os.path.abspath(self.ndjson_path),))
+        conn.close()
+        self.directory.cleanup()
+
+    def write(self, patients, on_commit=None, fail_after=None):
+        def records():
+            for patient in patients:
+                if len(self.written) == fail_after:
+                    raise RuntimeError("crash")
+                self.written.append(patient['patient_id'])
+                yield patient
+        upsert_patients(records(), chunk_size=3, on_commit=on_commit)
+
+    def ingest(self, fail_after=None, key=None):
+        ingest_file(self.ndjson_path, FHIRPatientProcessor(datetime.now()),
+                    lambda patients, on_commit: self.write(patients, on_commit, fail_after),
+                    lambda processor, patients: True, self.checkpoints, key
+                    )
+
+    def history(self):
+        with psycopg2.connect(**pg_connection_dict) as conn, conn.cursor() as cursor:
+            cursor.execute("SELECT patient_id, first_name FROM patients_history WHERE patient_id LIKE 'ckpt-%' "
+                           "ORDER BY id")
+            history = cursor.fetchall()
+        conn.close()
+        return history
+
+    def write_versions(self):
+        # patient ckpt-{n % 4} with the first name version {n}
+        with open(self.ndjson_path, 'w') as file:
+            for row_num in range(10):
+                file.write(json.dumps({"resourceType": "Patient", "id": f"ckpt-{row_num % 4}",
+                                       "name": [{"given": [f"v{row_num}"], "family": "Point"}]}) + "\n")
+
+    def test_interrupted_file_resumes_after_last_committed_chunk(self):
+        with self.assertRaises(RuntimeError):
+            self.ingest(fail_after=7)
+        self.assertEqual(self.checkpoints.load(file_identity(self.ndjson_path)).rows_committed, 6)
+
+        self.written = []
+        self.ingest()
+        self.assertEqual(self.written, [f'ckpt-{row_num}' for row_num in range(6, 10)])
+        self.assertEqual(self.checkpoints.load(file_identity(self.ndjson_path)), (10, COMPLETE))
+        with psycopg2.connect(**pg_connection_dict) as conn, conn.cursor() as cursor:
+            cursor.execute("SELECT COUNT(*), COUNT(DISTINCT patient_id) FROM patients_history "
+                           "WHERE patient_id LIKE 'ckpt-%'")
+            self.assertEqual(cursor.fetchone(), (10, 10))
+        conn.close()
+
+        # unchanged files are skipped
+        self.written = []
+        self.ingest()
+        self.assertEqual(self.written, [])
+
+    def test_changed_file_is_ingested_again(self):
+        self.ingest()
+        with open(self.ndjson_path, 'a') as file:
+            file.write(json.dumps({"resourceType": "Patient", "id": "ckpt-10",
+                                   "name": [{"given": ["Check"], "family": "Point"}]}) + "\n")
+        self.assertIsNone(self.checkpoints.load(file_identity(self.ndjson_path)))
+
+        self.written = []
+        self.ingest()
+        self.assertEqual(len(self.written), 11)
+
+
+    def test_records_are_written_in_file_order_by_default(self):
+        self.write_versions()
+        self.ingest(key='patient_id')
+
+        self.assertEqual(self.written, [f'ckpt-{n % 4}' for n in range(10)])
+
+    def test_duplicates_are_grouped_and_resumed(self):
+        self.write_versions()
+        with mock.patch('structured_zone_transformer.DEDUP_MODE', 'all'):
+            with self.assertRaises(RuntimeError):
+                self.ingest(fail_after=4, key='patient_id')
+            # chunks of 3 records never split the versions of a patient: ckpt-0 has 3 versions
+            self.assertEqual(self.history(), [('ckpt-0', 'v0'), ('ckpt-0', 'v4'), ('ckpt-0', 'v8')])
+            self.written = []
+            self.ingest(key='patient_id')
+
+        self.assertEqual(self.written, ['ckpt-1', 'ckpt-1', 'ckpt-1', 'ckpt-2', 'ckpt-2', 'ckpt-3', 'ckpt-3'])
+        self.assertEqual(sorted(self.history()), sorted((f'ckpt-{n % 4}', f'v{n}') for n in range(10)))
+
+    @unittest.skipIf(pq is None, "pyarrow is not installed")
+    def test_silver_zone_file_is_written_with_every_version(self):
+        self.write_versions()
+        silver_zone = os.path.join(self.directory.name, 'silver')
+        with mock.patch('structured_zone_transformer.SILVER_ZONE_PATH', silver_zone):
+            self.ingest(key='patient_id')
+
+        partition = os.path.join(silver_zone, 'resource=Patient', f'ingest_date={datetime.now().date().isoformat()}')
+        name, = os.listdir(partition)
+        self.assertRegex(name, r'^Patient-\d{8}T\d{12}\.parquet$')
+        self.assertEqual(pq.read_table(os.path.join(partition, name)).column('first_name').to_pylist(),
+                         [f'v{n}' for n in range(10)])
+
+    @unittest.skipIf(pq is None, "pyarrow is not installed")
+    def test_silver_zone_keeps_every_ingest_of_a_day(self):
+        silver_zone = os.path.join(self.directory.name, 'silver')
+        with mock.patch('structured_zone_transformer.SILVER_ZONE_PATH', silver_zone):
+            self.ingest()
+            self.write_versions()
+            self.ingest()
+
+        partition = os.path.join(silver_zone, 'resource=Patient', f'ingest_date={datetime.now().date().isoformat()}')
+        self.assertEqual([pq.read_table(os.path.join(partition, name)).column('first_name').to_pylist()
+                          for name in sorted(os.listdir(partition))],
+                         [['Check'] * 10, [f'v{n}' for n in range(10)]])
+
+    def test_final_mode_writes_last_versions(self):
+        self.write_versions()
+        with mock.patch('structured_zone_transformer.DEDUP_MODE', 'final'):
+            self.ingest(key='patient_id')
+
+        self.assertEqual(sorted(self.history()), [('ckpt-0', 'v8'), ('ckpt-1', 'v9'), ('ckpt-2', 'v6'),
+                                                  ('ckpt-3', 'v7')])
+
+
+class TestIngestPipelined(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.ndjson_path = os.path.join(self.directory.name, 'Patient.ndjson')
+        with open(self.ndjson_path, 'w') as file:
+            for row_num in range(10):
+                file.write(json.dumps({"resourceType": "Patient", "id": f"pipe-{row_num % 7}",
+                                       "name": [{"given": [f"v{row_num}"], "family": "Line"}]}) + "\n")
+        self.checkpoints = CheckpointStore(pg_connection_dict)
+
+    def tearDown(self):
+        with psycopg2.connect(**pg_connection_dict) as conn, conn.cursor() as cursor:
+            cursor.execute("DELETE FROM patients WHERE patient_id LIKE 'pipe-%'")
+            cursor.execute("DELETE FROM patients_history WHERE patient_id LIKE 'pipe-%'")
+            cursor.execute("DELETE FROM ingest_checkpoints WHERE path = %s", (os.path.abspath(self.ndjson_path),))
+        conn.close()
+        self.directory.cleanup()
+
+    def ingest(self, passes_checks):
+        with mock.patch('structured_zone_transformer.UPSERT_CHUNK_SIZE', 3):
+            return ingest_file_pipelined(self.ndjson_path, FHIRPatientProcessor(datetime.now()),
+                                         _upsert_patients_chunk, passes_checks, self.checkpoints, queue_size=1
+                                         )
+
+    def history(self):
+        with psycopg2.connect(**pg_connection_dict) as conn, conn.cursor() as cursor:
+            cursor.execute("SELECT patient_id, first_name FROM patients_history WHERE patient_id LIKE 'pipe-%' "
+                           "ORDER BY id")
+            history = cursor.fetchall()
+        conn.close()
+        return history
+
+    def test_file_is_written_in_chunks_and_checkpointed(self):
+        stats = self.ingest(lambda processor, patients: len(patients) == 10)
+
+        self.assertEqual([(stage.name, stage.chunks, stage.rows) for stage in stats],
+                         [('read', 4, 10), ('parse', 4, 10), ('process', 4, 10), ('write', 4, 10)])
+        self.assertEqual(self.history(), [(f'pipe-{n % 7}', f'v{n}') for n in range(10)])
+        self.assertEqual(self.checkpoints.load(file_identity(self.ndjson_path)), (10, COMPLETE))
+        self.assertIsNone(self.ingest(lambda processor, patients: True))
+
+    def test_file_failing_its_checks_is_rolled_back(self):
+        self.ingest(lambda processor, patients: False)
+
+        self.assertEqual(self.history(), [])
+        self.assertIsNone(self.checkpoints.load(file_identity(self.ndjson_path)))
+
+
+class TestOriginRouting(unittest.TestCase):
+    def setUp(self):
+        with psycopg2.connect(**pg_connection_dict) as conn, conn.cursor() as cursor:
+            cursor.execute("CREATE SCHEMA routing_test")
+            cursor.execute("CREATE TABLE routing_test.patients (LIKE public.patients INCLUDING ALL)")
+            cursor.execute("CREATE TABLE routing_test.patients_history (LIKE public.patients_history INCLUDING ALL)")
+            cursor.execute("CREATE TABLE routing_test.ingest_checkpoints "
+                           "(LIKE public.ingest_checkpoints INCLUDING ALL)")
+        conn.close()
+        self.patients = [{'patient_id': f'route-{n}', 'first_name': 'Route', 'last_name': f'{n}', 'origin': n % 2 + 1}
+                         for n in range(6)]
+
+    def tearDown(self):
+        with psycopg2.connect(**pg_connection_dict) as conn, conn.cursor() as cursor:
+            cursor.execute("DROP SCHEMA routing_test CASCADE")
+            cursor.execute("DELETE FROM patients WHERE patient_id LIKE 'route-%'")
+            cursor.execute("DELETE FROM patients_history WHERE patient_id LIKE 'route-%'")
+        conn.close()
+
+    def patient_ids(self, schema):
+        with psycopg2.connect(**pg_connection_dict) as conn, conn.cursor() as cursor:
+            cursor.execute(f"SELECT patient_id FROM {schema}.patients_history WHERE patient_id LIKE 'route-%' "
+                           f"ORDER BY id")
+            patient_ids = [row[0] for row in cursor.fetchall()]
+        conn.close()
+        return patient_ids
+
+    def test_origins_are_written_to_their_schema_in_both_modes(self):
+        for mode in ('bulk', 'row'):
+            with self.subTest(mode=mode), \
+                    mock.patch.object(origin_router, 'routes', {'2': {'schema': 'routing_test'}}), \
+                    mock.patch('structured_zone_transformer.ORIGIN_ROUTING', True), \
+                    mock.patch('structured_zone_transformer.UPSERT_MODE', mode):
+                write_patients([dict(patient, last_name=mode) for patient in self.patients])
+
+        self.assertEqual(self.patient_ids('public'), ['route-0', 'route-2', 'route-4'] * 2)
+        self.assertEqual(self.patient_ids('routing_test'), ['route-1', 'route-3', 'route-5'] * 2)
+
+    def test_patient_coverage_is_checked_against_the_routed_history(self):
+        processor = mock.Mock(**{'total_warnings_below_threshold.return_value': True})
+        routes = {'2': {'schema': 'routing_test'}}
+        with mock.patch.object(origin_router, 'routes', routes), \
+                mock.patch('structured_zone_transformer.ORIGIN_ROUTING', True):
+            write_patients([{'patient_id': 'route-other', 'first_name': 'Route', 'last_name': 'Other', 'origin': 2}])
+            self.assertFalse(patients_pass_checks(processor, self.patients))
+            # the default history has none of the patients, routing_test has the three of origin 2
+            write_patients([patient for patient in self.patients if patient['origin'] == 2])
+            self.assertTrue(patients_pass_checks(processor, self.patients))
+
+    def test_checkpoints_are_kept_in_every_routed_database(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        ndjson_path = os.path.join(directory.name, 'Patient.ndjson')
+        with open(ndjson_path, 'w') as file:
+            for patient in self.patients:
+                file.write(json.dumps({"resourceType": "Patient", "id": patient['patient_id'],
+                                       "name": [{"given": ["Route"], "family": patient['last_name']}]}) + "\n")
+        routes = {'1': {'schema': 'routing_test'}}
+        with mock.patch.object(origin_router, 'routes', routes), \
+                mock.patch('structured_zone_transformer.ORIGIN_ROUTING', True):
+            checkpoints = RoutedCheckpointStore(origin_router.connection_dicts())
+            ingest_file(ndjson_path, FHIRPatientProcessor(datetime.now()), write_patients,
+                        lambda processor, patients: True, checkpoints)
+
+            identity = file_identity(ndjson_path)
+            self.assertEqual([store.load(identity).status for store in checkpoints.stores], [COMPLETE, COMPLETE])
+            self.assertEqual(checkpoints.load(identity).status, COMPLETE)
+        with psycopg2.connect(**pg_connection_dict) as conn, conn.cursor() as cursor:
+            cursor.execute("DELETE FROM ingest_checkpoints WHERE path = %s", (identity.path,))
+        conn.close()
+        self.assertIsNone(checkpoints.load(identity))
+        self.assertEqual(len(self.patient_ids('routing_test')), 6)
+
+
 if __name__ == "__main__":
     unittest.main()
@@ -0,0 +1,80 @@
+import os
+from datetime import date, datetime, timezone
+from decimal import Decimal
+
+import pytest
+
+pa = pytest.importorskip('pyarrow')
+pq = pytest.importorskip('pyarrow.parquet')
+
+from writers.columnar_writer import ColumnarFileWriter, partition_path, write_columnar  # noqa: E402
+
+
+def claim(n, **values):
+    row = {'origin': 1, 'claim_id': f'claim-{n}', 'patient_id': 'p1', 'billing_start': '2020-01-02',
+           'billing_end': '2020-01-03', 'provider': '#provider', 'admitting_diagnosis': None, 'insurance': 'PRIVATE',
+           'status': 'active', 'created': '2021-05-01T10:00:00+02:00', 'amount': 12.5}
+    row.update(values)
+    return row
+
+
+def test_partitioned_parquet_with_typed_columns_in_row_groups(tmp_path):
+    rows = (claim(n) for n in range(5))
+
+    stats, path = write_columnar(str(tmp_path), 'Claim', rows, 'Claim', date(2024, 5, 1), row_group_size=2)
+
+    assert stats.rows == 5
+    assert path == os.path.join(str(tmp_path), 'resource=Claim', 'ingest_date=2024-05-01', 'Claim.parquet')
+    assert os.listdir(os.path.dirname(path)) == ['Claim.parquet']
+    parquet = pq.ParquetFile(path)
+    assert parquet.metadata.num_row_groups == 3
+    schema = parquet.schema_arrow
+    assert schema.field('origin').type == pa.int32()
+    assert schema.field('billing_start').type == pa.date32()
+    assert schema.field('created').type == pa.timestamp('us', tz='UTC')
+    assert schema.field('amount').type == pa.decimal128(10, 2)
+    first = parquet.read().to_pylist()[0]
+    assert first['billing_start'] == date(2020, 1, 2)
+    assert first['created'] == datetime(2021, 5, 1, 8, tzinfo=timezone.utc)
+    assert first['amount'] == Decimal('12.50')
+    assert first['admitting_diagnosis'] is None
+    assert pq.read_table(path).column('created').to_pylist()[0] == datetime(2021, 5, 1, 8, tzinfo=timezone.utc)
+
+
+def test_timestamps_in_every_fhir_form(tmp_path):
+    created = ['2021-05-01T10:00:00Z', '2021-05-01T06:00:00.5-04:00', '2021-05-01T15:30:00.1234567+0530',
+               '2021-05-01T10:00:00']
+    stats, path = write_columnar(str(tmp_path), 'Claim', [claim(n, created=value) for n, value in enumerate(created)],
+                                 'Claim', date(2024, 5, 1))
+
+    assert [value.replace(microsecond=0) for value in pq.read_table(path).column('created').to_pylist()] == \
+           [datetime(2021, 5, 1, 10, tzinfo=timezone.utc)] * 4
+
+
+def test_invalid_values_are_written_as_null(tmp_path):
+    with ColumnarFileWriter(str(tmp_path), 'Claim', 'Claim', date(2024, 5, 1)) as writer:
+        writer.write_many([claim(0, billing_start='2020-02-30', created='yesterday', amount='n/a'),
+                           claim(1, amount=10 ** 9)])
+
+    assert writer.invalid_values == {'billing_start': 1, 'created': 1, 'amount': 2}
+    table = pq.read_table(writer.path)
+    assert table.column('billing_start').to_pylist() == [None, date(2020, 1, 2)]
+    assert table.column('amount').null_count == 2
+
+
+def test_arrow_ipc_and_partial_files(tmp_path):
+    stats, path = write_columnar(str(tmp_path), 'Patient', [{'origin': 1, 'first_name': 'A', 'last_name': 'B',
+                                                             'patient_id': 'p1'}], 'Patient', date(2024, 5, 1), 'arrow')
+    with pa.ipc.open_file(path) as reader:
+        assert reader.read_all().to_pylist() == [{'origin': 1, 'first_name': 'A', 'last_name': 'B', 'patient_id': 'p1'}]
+
+    def failing_rows():
+        yield {'origin': 1, 'patient_id': 'p2'}
+        raise RuntimeError("crash")
+
+    with pytest.raises(RuntimeError):
+        write_columnar(str(tmp_path), 'Patient', failing_rows(), 'Patient', date(2024, 5, 2))
+    assert os.listdir(os.path.dirname(partition_path(str(tmp_path), 'Patient', date(2024, 5, 2), 'Patient'))) == []
+
+    with pytest.raises(ValueError):
+        ColumnarFileWriter(str(tmp_path), 'Coverage', 'Coverage')
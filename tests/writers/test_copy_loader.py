@@ -0,0 +1,86 @@
+from datetime import datetime
+
+import pytest
+
+from field_mappers.claim_processor import FHIRClaimProcessor
+from writers.copy_loader import CopySink, copy_rows
+
+
+class MemorySink(CopySink):
+    """Collects the COPY payload, reading it in small pieces like psycopg2 does."""
+
+    def __init__(self, columns=None):
+        self.truncated = []
+        self.payload = ''
+        self.columns = columns
+        self.copied_columns = None
+
+    def truncate(self, table):
+        self.truncated.append(table)
+
+    def table_columns(self, table):
+        return self.columns
+
+    def copy(self, table, columns, stream):
+        self.copied_columns = columns
+        while True:
+            data = stream.read(16)
+            if not data:
+                break
+            self.payload += data
+
+
+def test_copy_rows_streams_text_format():
+    sink = MemorySink()
+    rows = ({'patient_id': str(row_num), 'first_name': name} for row_num, name in
+            enumerate(['Ann', None, 'tab\there', 'back\\slash', 'new\nline']))
+
+    stats = copy_rows(sink, 'patients', rows)
+
+    assert stats.rows == 5
+    assert sink.truncated == []
+    assert sink.payload.split('\n')[:-1] == [
+            '0\tAnn', '1\t\\N', '2\ttab\\there', '3\tback\\\\slash', '4\tnew\\nline'
+    ]
+
+
+def test_copy_rows_replace_mode_truncates_first():
+    sink = MemorySink()
+    copy_rows(sink, 'patients', [{'patient_id': '1'}], columns=['patient_id', 'first_name'], mode='replace')
+    assert sink.truncated == ['patients']
+    assert sink.payload == '1\t\\N\n'
+
+
+def test_copy_rows_replace_with_no_rows_empties_the_table():
+    sink = MemorySink()
+
+    stats = copy_rows(sink, 'patients', iter([]), mode='replace')
+
+    assert stats.rows == 0
+    assert sink.truncated == ['patients']
+    assert copy_rows(sink, 'patients', [], mode='append').rows == 0
+    assert sink.truncated == ['patients']
+
+
+def test_processed_claims_are_loaded_without_their_extra_keys():
+    sink = MemorySink(columns=['id', 'claim_id', 'patient_id', 'billing_start', 'billing_end', 'provider',
+                               'admitting_diagnosis', 'insurance', 'status', 'amount', 'insert_ts', 'change_ts'])
+    claims = FHIRClaimProcessor(datetime.utcnow()).process_many([{
+            "resourceType": "Claim", "id": "c1", "status": "active", "created": "2021-01-01T00:00:00Z",
+            "patient": {"reference": "Patient/p1"}, "provider": {"reference": "#provider"},
+            "billablePeriod": {"start": "2020-12-19", "end": "2020-12-20"}, "total": {"value": 10.5},
+    }])
+
+    stats = copy_rows(sink, 'claims_history', claims, mode='replace')
+
+    assert stats.rows == 1 and sink.truncated == ['claims_history']
+    assert sink.copied_columns == ['claim_id', 'patient_id', 'billing_start', 'billing_end', 'provider',
+                                   'admitting_diagnosis', 'insurance', 'status', 'amount']
+    assert sink.payload == 'c1\tPatient/p1\t2020-12-19\t2020-12-20\t#provider\t\\N\t\\N\tactive\t10.5\n'
+    with pytest.raises(ValueError):
+        copy_rows(sink, 'claims_history', [{'origin': 1}])
+
+
+def test_copy_rows_rejects_unknown_mode():
+    with pytest.raises(ValueError):
+        copy_rows(MemorySink(), 'patients', [], mode='fail')